@@ -9,7 +9,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.database import Base
-from app.models import user, repository, document, dur  # noqa: import all models
+from app.models import user, repository, blob, document, dur, search  # noqa: import all models
 
 config = context.config
 
@@ -0,0 +1,145 @@
+"""Delta-compressed document versions
+
+Revision ID: 002
+Revises: 001
+Create Date: 2024-02-01 00:00:00.000000
+"""
+import json
+import zlib
+from difflib import SequenceMatcher
+from typing import Optional, Tuple
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+# The encoding as this revision introduced it (see app.core.version_store),
+# frozen so that upgrading writes the same rows whatever the app code becomes.
+SNAPSHOT = 'snapshot'
+DELTA = 'delta'
+SNAPSHOT_INTERVAL = 16
+
+versions = sa.table(
+    'document_versions',
+    sa.column('id', postgresql.UUID(as_uuid=True)),
+    sa.column('document_id', postgresql.UUID(as_uuid=True)),
+    sa.column('version_number', sa.Integer()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('content', sa.Text()),
+    sa.column('storage', sa.String(10)),
+    sa.column('payload', sa.LargeBinary()),
+)
+
+
+def _encode_delta(old: str, new: str) -> bytes:
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: list = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def _apply_delta(old: str, delta: bytes) -> str:
+    a = old.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for step in json.loads(zlib.decompress(delta)):
+        if isinstance(step, str):
+            out.append(step)
+        elif step > 0:
+            out.extend(a[pos:pos + step])
+            pos += step
+        else:
+            pos -= step
+    return ''.join(out)
+
+
+def _encode_version(version_number: int, content: str, previous: Optional[str]) -> Tuple[str, bytes]:
+    snapshot = zlib.compress(content.encode('utf-8'))
+    if previous is None or (version_number - 1) % SNAPSHOT_INTERVAL == 0:
+        return SNAPSHOT, snapshot
+    delta = _encode_delta(previous, content)
+    if len(delta) >= len(snapshot):
+        return SNAPSHOT, snapshot
+    return DELTA, delta
+
+
+def _decode(row, previous: Optional[str]) -> str:
+    if row.storage == SNAPSHOT:
+        return zlib.decompress(row.payload).decode('utf-8')
+    if previous is None:
+        raise ValueError(f'Version {row.version_number} has no base snapshot')
+    return _apply_delta(previous, row.payload)
+
+
+def _document_ids(conn):
+    return [row[0] for row in conn.execute(sa.select(versions.c.document_id).distinct())]
+
+
+def upgrade() -> None:
+    op.add_column('document_versions', sa.Column('storage', sa.String(10), nullable=True))
+    op.add_column('document_versions', sa.Column('payload', sa.LargeBinary(), nullable=True))
+
+    # Re-encode each document's history in order, one document at a time so
+    # memory stays bounded by the longest history.  Each row is encoded
+    # against the last text numbered just below it: where concurrent writers
+    # left two rows with the same number, both were written from the same
+    # earlier text, which is how the app (and revision 005) read them.
+    conn = op.get_bind()
+    for document_id in _document_ids(conn):
+        rows = conn.execute(
+            sa.select(versions.c.id, versions.c.version_number, versions.c.content)
+            .where(versions.c.document_id == document_id)
+            .order_by(versions.c.version_number, versions.c.created_at, versions.c.id)
+        ).all()
+        text_at = {}
+        for row in rows:
+            previous = text_at.get(row.version_number - 1)
+            storage, payload = _encode_version(row.version_number, row.content, previous)
+            conn.execute(
+                versions.update()
+                .where(versions.c.id == row.id)
+                .values(storage=storage, payload=payload)
+            )
+            text_at[row.version_number] = row.content
+
+    op.alter_column('document_versions', 'storage', nullable=False)
+    op.alter_column('document_versions', 'payload', nullable=False)
+    op.drop_column('document_versions', 'content')
+
+
+def downgrade() -> None:
+    op.add_column('document_versions', sa.Column('content', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    for document_id in _document_ids(conn):
+        rows = conn.execute(
+            sa.select(versions.c.id, versions.c.version_number, versions.c.storage, versions.c.payload)
+            .where(versions.c.document_id == document_id)
+            .order_by(versions.c.version_number, versions.c.created_at, versions.c.id)
+        ).all()
+        text_at = {}
+        for row in rows:
+            content = text_at[row.version_number] = _decode(row, text_at.get(row.version_number - 1))
+            conn.execute(
+                versions.update()
+                .where(versions.c.id == row.id)
+                .values(content=content)
+            )
+
+    op.alter_column('document_versions', 'content', nullable=False)
+    op.drop_column('document_versions', 'payload')
+    op.drop_column('document_versions', 'storage')
+
@@ -0,0 +1,61 @@
+"""Full-text search index
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-02-15 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.config import settings
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'search_entries',
+        sa.Column('kind', sa.String(20), nullable=False),
+        sa.Column('object_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('repo_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('dur_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('title', sa.String(200), nullable=False),
+        sa.Column('tsv', postgresql.TSVECTOR(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['dur_id'], ['durs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('kind', 'object_id'),
+    )
+    op.create_index('ix_search_entries_repo_id', 'search_entries', ['repo_id'])
+
+    # Backfill before building the GIN index; one bulk build is much cheaper
+    # than maintaining it row by row.
+    op.execute(sa.text("""
+        INSERT INTO search_entries (kind, object_id, repo_id, document_id, dur_id, title, tsv)
+        SELECT 'document', d.id, d.repo_id, d.id, NULL, d.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), d.title), 'A') ||
+               setweight(to_tsvector(CAST(:cfg AS regconfig), left(d.current_content, 200000)), 'B')
+        FROM documents d
+        UNION ALL
+        SELECT 'dur', r.id, r.repo_id, r.document_id, r.id, r.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), r.title), 'A') ||
+               setweight(to_tsvector(CAST(:cfg AS regconfig), coalesce(r.description, '')), 'B')
+        FROM durs r
+        UNION ALL
+        SELECT 'comment', c.id, r.repo_id, r.document_id, r.id, r.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), left(c.content, 200000)), 'B')
+        FROM dur_comments c JOIN durs r ON r.id = c.dur_id
+    """).bindparams(cfg=settings.SEARCH_CONFIG))
+    op.create_index('ix_search_entries_tsv', 'search_entries', ['tsv'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_search_entries_tsv', table_name='search_entries')
+    op.drop_index('ix_search_entries_repo_id', table_name='search_entries')
+    op.drop_table('search_entries')
@@ -0,0 +1,47 @@
+"""Notify on user permission changes
+
+Revision ID: 004
+Revises: 003
+Create Date: 2024-03-01 00:00:00.000000
+"""
+from alembic import op
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Workers cache principals (app/core/principals.py) and evict on this channel.
+    op.execute("""
+        CREATE FUNCTION notify_user_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('user_changed', OLD.id::text);
+                RETURN OLD;
+            END IF;
+            PERFORM pg_notify('user_changed', NEW.id::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_permissions_changed
+        AFTER UPDATE OF is_active, is_admin ON users
+        FOR EACH ROW
+        WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active OR OLD.is_admin IS DISTINCT FROM NEW.is_admin)
+        EXECUTE FUNCTION notify_user_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER users_deleted
+        AFTER DELETE ON users
+        FOR EACH ROW
+        EXECUTE FUNCTION notify_user_changed()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_deleted ON users")
+    op.execute("DROP TRIGGER IF EXISTS users_permissions_changed ON users")
+    op.execute("DROP FUNCTION IF EXISTS notify_user_changed()")
@@ -0,0 +1,139 @@
+"""Head version counter on documents, unique version numbers
+
+Revision ID: 005
+Revises: 004
+Create Date: 2024-03-15 00:00:00.000000
+"""
+import json
+import zlib
+from difflib import SequenceMatcher
+from typing import Optional, Tuple
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# The version encoding of revision 002, frozen like it is there.
+SNAPSHOT = 'snapshot'
+DELTA = 'delta'
+SNAPSHOT_INTERVAL = 16
+
+versions = sa.table(
+    'document_versions',
+    sa.column('id', postgresql.UUID(as_uuid=True)),
+    sa.column('document_id', postgresql.UUID(as_uuid=True)),
+    sa.column('version_number', sa.Integer()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('storage', sa.String(10)),
+    sa.column('payload', sa.LargeBinary()),
+)
+
+
+def _encode_delta(old: str, new: str) -> bytes:
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: list = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def _apply_delta(old: str, delta: bytes) -> str:
+    a = old.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for step in json.loads(zlib.decompress(delta)):
+        if isinstance(step, str):
+            out.append(step)
+        elif step > 0:
+            out.extend(a[pos:pos + step])
+            pos += step
+        else:
+            pos -= step
+    return ''.join(out)
+
+
+def _encode_version(version_number: int, content: str, previous: Optional[str]) -> Tuple[str, bytes]:
+    snapshot = zlib.compress(content.encode('utf-8'))
+    if previous is None or (version_number - 1) % SNAPSHOT_INTERVAL == 0:
+        return SNAPSHOT, snapshot
+    delta = _encode_delta(previous, content)
+    if len(delta) >= len(snapshot):
+        return SNAPSHOT, snapshot
+    return DELTA, delta
+
+
+def _decode(row, previous: Optional[str]) -> str:
+    if row.storage == SNAPSHOT:
+        return zlib.decompress(row.payload).decode('utf-8')
+    if previous is None:
+        raise ValueError(f'Version {row.version_number} has no base snapshot')
+    return _apply_delta(previous, row.payload)
+
+
+def _renumber(conn, document_id) -> None:
+    """Numbers a history with duplicate version numbers 1..n in commit order.
+
+    Concurrent writers each stored a delta against the same earlier version,
+    so every row is rebuilt against the last text with the number below its
+    own, then the whole history is re-encoded under its new numbers.
+    """
+    rows = conn.execute(
+        sa.select(versions.c.id, versions.c.version_number, versions.c.storage, versions.c.payload)
+        .where(versions.c.document_id == document_id)
+        .order_by(versions.c.version_number, versions.c.created_at, versions.c.id)
+    ).all()
+    text_at = {}
+    texts = []
+    for row in rows:
+        text = _decode(row, text_at.get(row.version_number - 1))
+        text_at[row.version_number] = text
+        texts.append(text)
+    # Out of the way of the unique index while renumbering.
+    conn.execute(versions.update().where(versions.c.document_id == document_id)
+                 .values(version_number=-versions.c.version_number))
+    previous = None
+    for number, (row, text) in enumerate(zip(rows, texts), 1):
+        storage, payload = _encode_version(number, text, previous)
+        conn.execute(versions.update().where(versions.c.id == row.id)
+                     .values(version_number=number, storage=storage, payload=payload))
+        previous = text
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    duplicated = conn.execute(
+        sa.select(versions.c.document_id)
+        .group_by(versions.c.document_id, versions.c.version_number)
+        .having(sa.func.count() > 1)
+        .distinct()
+    ).scalars().all()
+    for document_id in duplicated:
+        _renumber(conn, document_id)
+
+    op.create_unique_constraint(
+        'uq_document_versions_document_version', 'document_versions', ['document_id', 'version_number']
+    )
+    op.add_column('documents', sa.Column('head_version', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE documents d SET head_version = v.head
+        FROM (SELECT document_id, max(version_number) AS head FROM document_versions GROUP BY document_id) v
+        WHERE v.document_id = d.id
+    """)
+    op.alter_column('documents', 'head_version', server_default=None)
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'head_version')
+    op.drop_constraint('uq_document_versions_document_version', 'document_versions', type_='unique')
@@ -0,0 +1,39 @@
+"""Unique document slugs per repository
+
+Revision ID: 006
+Revises: 005
+Create Date: 2024-03-20 00:00:00.000000
+"""
+from alembic import op
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Concurrent creates could store one slug twice; all but the oldest
+    # document get the start of their id appended.
+    op.execute("""
+        UPDATE documents d SET slug = left(d.slug, 191) || '-' || left(d.id::text, 8)
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY repo_id, slug ORDER BY created_at, id) AS n
+            FROM documents
+        ) dup
+        WHERE dup.id = d.id AND dup.n > 1
+    """)
+    op.drop_index('ix_documents_slug', table_name='documents')
+    # text_pattern_ops lets core.slugs find the next "<slug>-N" with a range scan.
+    op.create_index('uq_documents_repo_slug', 'documents', ['repo_id', 'slug'], unique=True,
+                    postgresql_ops={'slug': 'text_pattern_ops'})
+    op.drop_index('ix_repositories_slug', table_name='repositories')
+    op.create_index('ix_repositories_slug', 'repositories', ['slug'],
+                    postgresql_ops={'slug': 'text_pattern_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_repositories_slug', table_name='repositories')
+    op.create_index('ix_repositories_slug', 'repositories', ['slug'])
+    op.drop_index('uq_documents_repo_slug', table_name='documents')
+    op.create_index('ix_documents_slug', 'documents', ['slug'])
@@ -0,0 +1,43 @@
+"""Indexes for the API's filters, sort orders and foreign keys
+
+Revision ID: 007
+Revises: 006
+Create Date: 2024-03-25 00:00:00.000000
+
+Chosen from the plans of every query the routers issue, as checked by
+``benchmarks/query_plans.py``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index predicate)
+INDEXES = [
+    # Keyset pagination: equality on the parent, then the (created_at, id) cursor.
+    ('ix_documents_repo_created', 'documents', ['repo_id', 'created_at', 'id'], None),
+    ('ix_durs_repo_created', 'durs', ['repo_id', 'created_at', 'id'], None),
+    ('ix_durs_repo_open_created', 'durs', ['repo_id', 'created_at', 'id'], "status = 'open'"),
+    ('ix_dur_comments_dur_created', 'dur_comments', ['dur_id', 'created_at', 'id'], None),
+    ('ix_repositories_created', 'repositories', ['created_at', 'id'], None),
+    ('ix_users_created', 'users', ['created_at', 'id'], None),
+    # Repositories a user is a member of; the primary key leads with repo_id.
+    ('ix_repository_members_user_id', 'repository_members', ['user_id'], None),
+    # Foreign keys that deleting a document or DUR checks or cascades through.
+    ('ix_durs_document_id', 'durs', ['document_id'], None),
+    ('ix_search_entries_document_id', 'search_entries', ['document_id'], None),
+    ('ix_search_entries_dur_id', 'search_entries', ['dur_id'], 'dur_id IS NOT NULL'),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns, where in INDEXES:
+        op.create_index(name, table, columns, postgresql_where=sa.text(where) if where else None)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
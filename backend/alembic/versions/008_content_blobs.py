@@ -0,0 +1,231 @@
+"""Content-addressed blobs for document, DUR and snapshot texts
+
+Revision ID: 008
+Revises: 007
+Create Date: 2024-04-02 00:00:00.000000
+
+Moves ``documents.current_content`` and ``durs.proposed_content`` into
+``blobs``, keyed by SHA-256, so each distinct text is stored once; see
+app/core/blobs.py.  Versions whose text is one of those blobs then reference
+it instead of holding a snapshot or delta.  ``benchmarks/blob_storage.py`` reports
+the space this saves on a generated history.
+"""
+import hashlib
+import json
+import zlib
+from typing import Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+# Version rows as revision 002 encoded them; frozen, since
+# app.core.version_store now also reads rows that reference blobs.
+SNAPSHOT = 'snapshot'
+
+BATCH = 1000
+DOCUMENT_BATCH = 100
+
+# Each (table, column) referencing blobs.hash.
+REFERENCES = (
+    ('documents', 'content_hash'),
+    ('durs', 'proposed_hash'),
+    ('document_versions', 'blob_hash'),
+)
+
+
+def _refcount_function(table: str, column: str) -> str:
+    # Statement-level, so a bulk write touches each blob once.  Updates only
+    # apply the net change, and most leave the hash alone.
+    return f"""
+        CREATE FUNCTION {table}_blob_refs() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE blobs b SET refcount = b.refcount + c.refs
+                FROM (SELECT {column} AS hash, count(*) AS refs FROM new_rows
+                      WHERE {column} IS NOT NULL GROUP BY 1) c
+                WHERE b.hash = c.hash;
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                UPDATE blobs b SET refcount = b.refcount - c.refs
+                FROM (SELECT {column} AS hash, count(*) AS refs FROM old_rows
+                      WHERE {column} IS NOT NULL GROUP BY 1) c
+                WHERE b.hash = c.hash;
+            ELSE
+                UPDATE blobs b SET refcount = b.refcount + c.refs
+                FROM (SELECT hash, sum(refs) AS refs
+                      FROM (SELECT {column} AS hash, 1 AS refs FROM new_rows
+                            UNION ALL
+                            SELECT {column}, -1 FROM old_rows) r
+                      WHERE hash IS NOT NULL GROUP BY 1 HAVING sum(refs) <> 0) c
+                WHERE b.hash = c.hash;
+            END IF;
+            DELETE FROM blobs WHERE refcount = 0 AND hash IN (SELECT {column} FROM old_rows);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def _apply_delta(old: str, delta: bytes) -> str:
+    a = old.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for step in json.loads(zlib.decompress(delta)):
+        if isinstance(step, str):
+            out.append(step)
+        elif step > 0:
+            out.extend(a[pos:pos + step])
+            pos += step
+        else:
+            pos -= step
+    return ''.join(out)
+
+
+def _decode(row, previous: Optional[str]) -> str:
+    if row.storage == SNAPSHOT:
+        return zlib.decompress(row.payload).decode('utf-8')
+    if previous is None:
+        raise ValueError(f'Version {row.version_number} has no base snapshot')
+    return _apply_delta(previous, row.payload)
+
+
+def _reference_blobs(conn) -> None:
+    """Makes versions whose text is a document's or a DUR's reference its blob,
+    as ``version_store.new_version`` does for new versions."""
+    last = None
+    while True:
+        where = "WHERE id > :last" if last else ""
+        ids = conn.execute(sa.text(
+            f"SELECT id FROM documents {where} ORDER BY id LIMIT :limit"
+        ), {"last": last, "limit": DOCUMENT_BATCH}).scalars().all()
+        if not ids:
+            return
+        rows = conn.execute(sa.text("""
+            SELECT id, document_id, version_number, storage, payload FROM document_versions
+            WHERE document_id = ANY(CAST(:ids AS uuid[])) ORDER BY document_id, version_number
+        """), {"ids": [str(i) for i in ids]}).all()
+        digests = {}
+        document_id = content = None
+        for row in rows:
+            if row.document_id != document_id:
+                document_id, content = row.document_id, None
+            content = _decode(row, content)
+            digests[row.id] = hashlib.sha256(content.encode('utf-8')).digest()
+        stored = {bytes(digest) for digest in conn.execute(sa.text(
+            "SELECT hash FROM blobs WHERE hash = ANY(CAST(:hashes AS bytea[]))"
+        ), {"hashes": list(set(digests.values()))}).scalars()}
+        moved = [(str(id), digest) for id, digest in digests.items() if digest in stored]
+        if moved:
+            conn.execute(sa.text("""
+                UPDATE document_versions v SET storage = 'snapshot', blob_hash = u.hash, payload = NULL
+                FROM unnest(CAST(:ids AS uuid[]), CAST(:hashes AS bytea[])) AS u(id, hash)
+                WHERE v.id = u.id
+            """), {"ids": [id for id, _ in moved], "hashes": [digest for _, digest in moved]})
+        last = ids[-1]
+
+
+def _inline_snapshots(conn) -> None:
+    last = None
+    while True:
+        where = "v.blob_hash IS NOT NULL" + (" AND v.id > :last" if last else "")
+        rows = conn.execute(sa.text(
+            f"SELECT v.id, b.content FROM document_versions v JOIN blobs b ON b.hash = v.blob_hash "
+            f"WHERE {where} ORDER BY v.id LIMIT :limit"
+        ), {"last": last, "limit": BATCH}).all()
+        if not rows:
+            return
+        conn.execute(sa.text("""
+            UPDATE document_versions v SET payload = u.payload
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:payloads AS bytea[])) AS u(id, payload)
+            WHERE v.id = u.id
+        """), {"ids": [str(row.id) for row in rows],
+               "payloads": [zlib.compress(row.content.encode('utf-8')) for row in rows]})
+        last = rows[-1].id
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blobs',
+        sa.Column('hash', sa.LargeBinary(), primary_key=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.add_column('documents', sa.Column('content_hash', sa.LargeBinary(), nullable=True))
+    op.add_column('durs', sa.Column('proposed_hash', sa.LargeBinary(), nullable=True))
+    op.add_column('document_versions', sa.Column('blob_hash', sa.LargeBinary(), nullable=True))
+    op.alter_column('document_versions', 'payload', nullable=True)
+
+    for table, column, text_column in (('documents', 'content_hash', 'current_content'),
+                                       ('durs', 'proposed_hash', 'proposed_content')):
+        op.execute(f"UPDATE {table} SET {column} = sha256(convert_to({text_column}, 'UTF8'))")
+        op.execute(f"""
+            INSERT INTO blobs (hash, content)
+            SELECT DISTINCT ON ({column}) {column}, {text_column} FROM {table}
+            ON CONFLICT (hash) DO NOTHING
+        """)
+    _reference_blobs(op.get_bind())
+
+    op.drop_column('documents', 'current_content')
+    op.drop_column('durs', 'proposed_content')
+    op.alter_column('documents', 'content_hash', nullable=False)
+    op.alter_column('durs', 'proposed_hash', nullable=False)
+
+    op.execute("""
+        UPDATE blobs b SET refcount = r.refs
+        FROM (SELECT hash, count(*) AS refs FROM (
+                  SELECT content_hash AS hash FROM documents
+                  UNION ALL SELECT proposed_hash FROM durs
+                  UNION ALL SELECT blob_hash FROM document_versions WHERE blob_hash IS NOT NULL
+              ) t GROUP BY hash) r
+        WHERE b.hash = r.hash
+    """)
+    for table, column in REFERENCES:
+        op.create_foreign_key(f'fk_{table}_{column}', table, 'blobs', [column], ['hash'])
+        op.execute(_refcount_function(table, column))
+        for event, tables in (('INSERT', 'NEW TABLE AS new_rows'),
+                              ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                              ('DELETE', 'OLD TABLE AS old_rows')):
+            op.execute(f"""
+                CREATE TRIGGER {table}_blob_refs_{event.lower()}
+                AFTER {event} ON {table}
+                REFERENCING {tables}
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION {table}_blob_refs()
+            """)
+    # Dropping a blob checks that nothing references it.
+    op.create_index('ix_documents_content_hash', 'documents', ['content_hash'])
+    op.create_index('ix_durs_proposed_hash', 'durs', ['proposed_hash'])
+    op.create_index('ix_document_versions_blob_hash', 'document_versions', ['blob_hash'],
+                    postgresql_where=sa.text('blob_hash IS NOT NULL'))
+
+
+def downgrade() -> None:
+    for table, column in REFERENCES:
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_blob_refs_{event} ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS {table}_blob_refs()")
+    op.drop_index('ix_document_versions_blob_hash', table_name='document_versions')
+    op.drop_index('ix_durs_proposed_hash', table_name='durs')
+    op.drop_index('ix_documents_content_hash', table_name='documents')
+
+    op.add_column('documents', sa.Column('current_content', sa.Text(), nullable=True))
+    op.add_column('durs', sa.Column('proposed_content', sa.Text(), nullable=True))
+    op.execute("UPDATE documents d SET current_content = b.content FROM blobs b WHERE b.hash = d.content_hash")
+    op.execute("UPDATE durs r SET proposed_content = b.content FROM blobs b WHERE b.hash = r.proposed_hash")
+    _inline_snapshots(op.get_bind())
+    op.alter_column('documents', 'current_content', nullable=False)
+    op.alter_column('durs', 'proposed_content', nullable=False)
+    op.alter_column('document_versions', 'payload', nullable=False)
+
+    for table, column in REFERENCES:
+        op.drop_constraint(f'fk_{table}_{column}', table, type_='foreignkey')
+    op.drop_column('document_versions', 'blob_hash')
+    op.drop_column('durs', 'proposed_hash')
+    op.drop_column('documents', 'content_hash')
+    op.drop_table('blobs')
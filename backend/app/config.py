@@ -9,6 +9,78 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     ENVIRONMENT: str = "development"
+    # X-Query-Count on every response, e.g. for benchmarks; always on in development.
+    QUERY_COUNT_HEADER: bool = False
+    # Server-Timing header on every response, e.g. for benchmarks; always on in
+    # development (the timing log line is always written, at INFO on
+    # app.core.profiling).  Requests slower than
+    # PROFILE_SLOW_MS get their sampled stacks written to PROFILE_DIR; 0 turns
+    # the sampler off.
+    SERVER_TIMING_HEADER: bool = False
+    PROFILE_SLOW_MS: float = 0
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_DIR: str = "profiles"
+    # /metrics wants "Authorization: Bearer <METRICS_TOKEN>"; without a token
+    # it is not served at all unless METRICS_PUBLIC opens it to anyone.
+    # With several uvicorn workers, point METRICS_DIR at a directory they
+    # share so /metrics reports all of them (see app/core/metrics.py).
+    METRICS_TOKEN: Optional[str] = None
+    METRICS_PUBLIC: bool = False
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_SECONDS: float = 5
+    # Anonymous reads of public repositories: seconds a body may be served
+    # (0 disables), bodies kept per worker, or redis://host:port/db to share
+    # them between workers instead.
+    RESPONSE_CACHE_TTL: float = 60
+    RESPONSE_CACHE_SIZE: int = 10_000
+    RESPONSE_CACHE_URL: Optional[str] = None
+    # Applied to the sync and the async engine separately.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Behind PgBouncer in transaction mode: no prepared-statement caching and
+    # no local pool on the async engine.
+    DB_PGBOUNCER: bool = False
+    # Direct to Postgres, for the LISTEN connection of the in-process caches
+    # (app/core/notify.py); defaults to DATABASE_URL.  Behind PgBouncer, which
+    # never delivers notifications in transaction mode, the caches stay off
+    # unless this is set.
+    DB_LISTEN_URL: Optional[str] = None
+    # Principals resolved from access tokens, per worker.
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_CACHE_TTL: float = 60
+    # (user, repository) roles, per worker.
+    PERMISSION_CACHE_SIZE: int = 50_000
+    PERMISSION_CACHE_TTL: float = 300
+    # Password hashing: bcrypt work factor (existing hashes are upgraded on
+    # login), worker processes (0 = half the CPUs) and how many calls may
+    # wait for a worker before sign-ins get 503.
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_WORKERS: int = 0
+    BCRYPT_MAX_QUEUE: int = 64
+    # Smallest response body worth compressing, in bytes.
+    COMPRESSION_MIN_SIZE: int = 1024
+    # Bulk import: documents per transaction, and the largest accepted upload.
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_MAX_SIZE: int = 1024 * 1024 * 1024
+    PAGE_DEFAULT_LIMIT: int = 50
+    PAGE_MAX_LIMIT: int = 200
+    VERSION_SNAPSHOT_INTERVAL: int = 16
+    DIFF_CACHE_SIZE: int = 256
+    # Edits a diff may search for before showing the change as one replacement.
+    DIFF_MAX_EDITS: int = 1000
+    # Rendered Markdown (HTML and table of contents) kept per worker, by content hash.
+    RENDER_CACHE_SIZE: int = 512
+    # Longest unsaved text, in characters, that /preview renders.
+    PREVIEW_MAX_LENGTH: int = 1_000_000
+    SEARCH_CONFIG: str = "english"
+    SEARCH_MAX_CANDIDATES: int = 2000
+    # Live event streams: seconds between keep-alive comments, and events a
+    # stream may fall behind before it is told to refetch instead.
+    EVENTS_KEEPALIVE_SECONDS: float = 25
+    EVENTS_QUEUE_SIZE: int = 64
 
     class Config:
         env_file = ".env"
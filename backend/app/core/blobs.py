@@ -0,0 +1,38 @@
+"""Content-addressed storage of document texts.
+
+A document's current text and a DUR's proposed text are rows of ``blobs``
+keyed by their SHA-256, which the document or DUR references, so a text
+held by several of them, or repeated by a merge or a copy, is stored once.
+Versions reference a blob when their text is one already and otherwise keep
+their snapshot or delta inline; see core.version_store.
+
+Triggers on the referencing tables (migration 008) keep ``blobs.refcount``
+and delete a blob once nothing references it, in the same transaction.
+Writers call ``store`` before inserting or updating a reference: it creates
+missing blobs and locks existing ones, so a concurrent drop of the last
+reference waits for this transaction and then finds the count above zero.
+"""
+import hashlib
+from typing import Mapping, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def digest(content: str) -> bytes:
+    return hashlib.sha256(content.encode("utf-8")).digest()
+
+
+async def store(db: AsyncSession, blobs: Mapping[bytes, str]) -> Set[bytes]:
+    """Makes sure each ``digest -> text`` is stored; returns the digests that already were."""
+    if not blobs:
+        return set()
+    # Sorted, so concurrent writers lock shared blobs in the same order.
+    hashes = sorted(blobs)
+    result = await db.execute(text("""
+        INSERT INTO blobs (hash, content, refcount)
+        SELECT hash, content, 0 FROM unnest(CAST(:hashes AS bytea[]), CAST(:contents AS text[])) AS b(hash, content)
+        ON CONFLICT (hash) DO UPDATE SET refcount = blobs.refcount
+        RETURNING hash, xmax <> 0 AS existed
+    """), {"hashes": hashes, "contents": [blobs[h] for h in hashes]})
+    return {row.hash for row in result if row.existed}
@@ -0,0 +1,69 @@
+"""Bounded in-process caches for data that other workers can invalidate.
+
+``TTLCache`` is an LRU whose entries also expire; with ``ttl=math.inf`` it
+is a plain LRU, as for values derived only from their key.  Every eviction bumps
+``generation``; a caller that reads the database on a miss passes the
+generation it saw beforehand to ``put`` so a value loaded before a
+concurrent invalidation is dropped instead of cached::
+
+    generation = cache.generation
+    value = await load()
+    cache.put(key, value, generation=generation)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+def content_hash(text: str) -> str:
+    """Cache key of a text, for values that depend only on it."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl: Optional[float] = None, generation: Optional[int] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[object], bool]) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
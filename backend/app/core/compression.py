@@ -0,0 +1,213 @@
+"""Response compression and precompressed static files.
+
+``CompressionMiddleware`` negotiates ``br`` or ``gzip`` from
+``Accept-Encoding`` for textual responses of at least ``minimum_size``
+bytes, including streamed ones.  Responses that already carry a
+``Content-Encoding`` (precompressed assets) and event streams pass through.
+
+``PrecompressedStaticFiles`` serves the ``.br``/``.gz`` siblings that the
+frontend build writes next to each asset (``frontend/scripts/precompress.mjs``);
+``SPAIndex`` keeps ``index.html`` and its compressed forms in memory.
+"""
+import gzip
+import mimetypes
+import zlib
+from typing import Dict, Optional, Tuple
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .conditional import is_fresh, make_etag
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/plain", "text/css", "text/markdown", "text/csv", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+# Preferred first; on-the-fly levels trade ratio for latency.
+ENCODINGS = ("br", "gzip")
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best of ``ENCODINGS`` the client accepts, honouring ``q=0``."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=4)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._brotli.process(data) if self._brotli else self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        return self._brotli.finish() if self._brotli else self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    # A strong validator names one exact byte sequence; compression changes it.
+    if headers.get("etag", "").startswith('"'):
+        headers["ETag"] = "W/" + headers["etag"]
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Optional[Send] = None
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        self.if_none_match = Headers(scope=scope).get("if-none-match", "")
+        await self.app(scope, receive, self.send_compressed)
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        return content_type in COMPRESSIBLE_TYPES
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            if message["status"] == 304:
+                # Repeat the validator the client holds, weakened if it came
+                # from a compressed 200.
+                headers = MutableHeaders(raw=message["headers"])
+                if "W/" + headers.get("etag", "") in self.if_none_match:
+                    _weaken_etag(headers)
+            # Held back until the first body chunk shows whether to compress.
+            self.start_message = message
+            self.passthrough = not self._should_compress(Headers(raw=message["headers"]))
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.passthrough:
+            if self.start_message is not None:
+                await self.send(self.start_message)
+                self.start_message = None
+            await self.send(message)
+            return
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send_compressed(message)
+                return
+            self.compressor = _Compressor(self.encoding)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            _weaken_etag(headers)
+            compressed = self.compressor.compress(body)
+            if not more_body:
+                compressed += self.compressor.finish()
+                headers["Content-Length"] = str(len(compressed))
+            elif "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(self.start_message)
+            self.start_message = None
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        compressed = self.compressor.compress(body)
+        if not more_body:
+            compressed += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles for fingerprinted build output: prefers ``<file>.br``/``<file>.gz``
+    when the client accepts them, and marks everything immutable."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        if encoding is not None:
+            full_path, stat_result = self.lookup_path(path + PRECOMPRESSED_SUFFIXES[encoding])
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                response.headers["Content-Encoding"] = encoding
+                # FileResponse guessed the type from the compressed file name.
+                response.headers["Content-Type"] = _media_type(path)
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers.setdefault("Vary", "Accept-Encoding")
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+def _media_type(path: str) -> str:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return f"{media_type}; charset=utf-8" if media_type.startswith("text/") else media_type
+
+
+class SPAIndex:
+    """``index.html`` read once, with gzip and brotli forms built up front."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            body = f.read()
+        self.etag = make_etag(body)
+        self.variants: Dict[Optional[str], Tuple[bytes, str]] = {
+            None: (body, self.etag),
+            "br": (brotli.compress(body, quality=11), "W/" + self.etag),
+            "gzip": (gzip.compress(body, compresslevel=9), "W/" + self.etag),
+        }
+
+    def response(self, request: Request) -> Response:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if is_fresh(request, self.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type="text/html", headers=headers)
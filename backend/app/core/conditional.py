@@ -0,0 +1,60 @@
+"""ETag validation for read endpoints.
+
+Handlers build a strong ETag from columns that change whenever the response
+would (``updated_at``, version ids, review status, ...) before loading the
+body, and return ``not_modified`` when it matches ``If-None-Match``::
+
+    etag = make_etag(doc.id, doc.updated_at)
+    if is_fresh(request, etag):
+        return not_modified(etag, REVALIDATE)
+    set_validators(response, etag, REVALIDATE)
+
+Responses are ``private`` because they sit behind repository access checks.
+"""
+import hashlib
+
+from fastapi import HTTPException, Request, Response
+
+# Cache, but check with the server before every reuse.
+REVALIDATE = "private, no-cache"
+# Never changes at this URL.
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def is_conditional(request: Request) -> bool:
+    """True if the client sent a validator, i.e. the body will likely not be needed."""
+    return "if-none-match" in request.headers
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2).
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def check_if_match(request: Request, etag: str) -> None:
+    """Raises 412 unless ``If-Match`` is absent, ``*`` or names ``etag``."""
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return
+    # Weak tags are accepted: ours are only weakened by response compression.
+    if etag not in (tag.strip().removeprefix("W/") for tag in header.split(",")):
+        raise HTTPException(status_code=412, detail="Document has changed since it was read")
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_validators(response: Response, etag: str, cache_control: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
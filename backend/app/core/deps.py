@@ -1,31 +1,52 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..core.security import decode_token
+from ..core.principals import Principal, principal_cache
+from ..core.profiling import span
 from ..models.user import User
 
 security = HTTPBearer()
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    token = credentials.credentials
-    payload = decode_token(token)
+def _token_user_id(token: str) -> Optional[str]:
+    user_id = principal_cache.user_id_for(token)
+    if user_id is not None:
+        return user_id
+    with span("auth"):
+        payload = decode_token(token)
     if payload is None or payload.get("type") != "access":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
+        return None
     user_id = payload.get("sub")
+    if user_id:
+        principal_cache.remember_token(token, user_id, payload["exp"])
+    return user_id
+
+
+async def _load_principal(user_id: str, db: AsyncSession) -> Optional[Principal]:
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    generation = principal_cache.generation
+    with span("auth"):
+        user = await db.scalar(select(User).where(User.id == user_id))
+    return principal_cache.put(user, generation) if user else None
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
+    user_id = _token_user_id(credentials.credentials)
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token payload",
+            detail="Invalid or expired token",
         )
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await _load_principal(user_id, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -39,11 +60,11 @@ def get_current_user(
     return user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     return current_user
 
 
-def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -52,17 +73,13 @@ def get_current_admin_user(current_user: User = Depends(get_current_user)) -> Us
     return current_user
 
 
-def get_optional_user(
+async def get_optional_user(
     credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db),
-) -> User | None:
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal | None:
     if credentials is None:
         return None
-    token = credentials.credentials
-    payload = decode_token(token)
-    if payload is None or payload.get("type") != "access":
-        return None
-    user_id = payload.get("sub")
+    user_id = _token_user_id(credentials.credentials)
     if not user_id:
         return None
-    return db.query(User).filter(User.id == user_id).first()
+    return await _load_principal(user_id, db)
@@ -0,0 +1,264 @@
+"""Line and word diffs for DUR review.
+
+Uses Myers' O(ND) algorithm with the linear-space middle-snake refinement, so
+cost grows with the size of the change rather than the size of the document.
+Past ``DIFF_MAX_EDITS`` edits the search gives up and the changed region is
+shown as one replacement. Results are cached by the content hashes of both
+sides.
+"""
+import math
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from ..config import settings
+from .cache import TTLCache
+
+Opcode = Tuple[str, int, int, int, int]
+
+_WORD_RE = re.compile(r"\s+|\w+|[^\w\s]")
+
+
+def _bisect(a: Sequence, b: Sequence, max_edits: int) -> Optional[Tuple[int, int]]:
+    """Finds the middle snake of the shortest edit script for ``a`` -> ``b``.
+
+    Returns None when that script is longer than about ``max_edits``.
+    """
+    n, m = len(a), len(b)
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    v1 = [-1] * size
+    v2 = [-1] * size
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(min(max_d, max_edits // 2 + 1)):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[x1] == b[y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < size and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return x1, y1
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[n - x2 - 1] == b[m - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= n - x2:
+                        return x1, offset + x1 - k1_offset
+    return None
+
+
+def _matches(a: Sequence, b: Sequence, i0: int, j0: int, out: List[Tuple[int, int, int]], max_edits: int) -> None:
+    """Appends ``(i, j, length)`` runs of equal items, offset by ``i0``/``j0``.
+
+    Leaves out the middle, so it reads as one replacement, when that needs
+    more than ``max_edits`` edits.
+    """
+    prefix = 0
+    limit = min(len(a), len(b))
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+
+    if prefix:
+        out.append((i0, j0, prefix))
+    a_mid = a[prefix:len(a) - suffix]
+    b_mid = b[prefix:len(b) - suffix]
+    if a_mid and b_mid:
+        split = _bisect(a_mid, b_mid, max_edits)
+        if split is not None:
+            x, y = split
+            _matches(a_mid[:x], b_mid[:y], i0 + prefix, j0 + prefix, out, max_edits)
+            _matches(a_mid[x:], b_mid[y:], i0 + prefix + x, j0 + prefix + y, out, max_edits)
+    if suffix:
+        out.append((i0 + len(a) - suffix, j0 + len(b) - suffix, suffix))
+
+
+def opcodes(a: Sequence, b: Sequence) -> List[Opcode]:
+    """Edit script in ``difflib.SequenceMatcher.get_opcodes`` format."""
+    runs: List[Tuple[int, int, int]] = []
+    _matches(a, b, 0, 0, runs, settings.DIFF_MAX_EDITS)
+    runs.append((len(a), len(b), 0))
+
+    result: List[Opcode] = []
+    i = j = 0
+    for ai, bj, size in runs:
+        if i < ai and j < bj:
+            result.append(("replace", i, ai, j, bj))
+        elif i < ai:
+            result.append(("delete", i, ai, j, bj))
+        elif j < bj:
+            result.append(("insert", i, ai, j, bj))
+        if size:
+            if result and result[-1][0] == "equal":
+                tag, i1, _, j1, _ = result.pop()
+                result.append(("equal", i1, ai + size, j1, bj + size))
+            else:
+                result.append(("equal", ai, ai + size, bj, bj + size))
+        i, j = ai + size, bj + size
+    return result
+
+
+def _grouped(codes: List[Opcode], context: int) -> List[List[Opcode]]:
+    """Splits opcodes into hunks with ``context`` equal lines around changes."""
+    if not codes or (len(codes) == 1 and codes[0][0] == "equal"):
+        return []
+    codes = list(codes)
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    groups: List[List[Opcode]] = []
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > context * 2:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        groups.append(group)
+    return groups
+
+
+def word_segments(old: str, new: str) -> Tuple[List[dict], List[dict]]:
+    """Word-level segments for a changed line pair, as ``(old, new)``."""
+    a = _WORD_RE.findall(old)
+    b = _WORD_RE.findall(new)
+    left: List[dict] = []
+    right: List[dict] = []
+
+    def push(side: List[dict], kind: str, text: str) -> None:
+        if not text:
+            return
+        if side and side[-1]["type"] == kind:
+            side[-1]["text"] += text
+        else:
+            side.append({"type": kind, "text": text})
+
+    for tag, i1, i2, j1, j2 in opcodes(a, b):
+        if tag == "equal":
+            push(left, "equal", "".join(a[i1:i2]))
+            push(right, "equal", "".join(b[j1:j2]))
+        else:
+            push(left, "delete", "".join(a[i1:i2]))
+            push(right, "insert", "".join(b[j1:j2]))
+    return left, right
+
+
+def _line(kind: str, old_number: Optional[int], new_number: Optional[int], content: str,
+          segments: Optional[List[dict]] = None) -> dict:
+    return {
+        "type": kind,
+        "old_number": old_number,
+        "new_number": new_number,
+        "content": content,
+        "segments": segments,
+    }
+
+
+def _build_hunk(group: List[Opcode], a: List[str], b: List[str]) -> dict:
+    lines: List[dict] = []
+    rows: List[dict] = []
+    for tag, i1, i2, j1, j2 in group:
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                line = _line("context", i1 + offset + 1, j1 + offset + 1, a[i1 + offset])
+                lines.append(line)
+                rows.append({"left": line, "right": line})
+            continue
+
+        removed = [_line("remove", i + 1, None, a[i]) for i in range(i1, i2)]
+        added = [_line("add", None, j + 1, b[j]) for j in range(j1, j2)]
+        for old, new in zip(removed, added):
+            old["segments"], new["segments"] = word_segments(old["content"], new["content"])
+        lines.extend(removed)
+        lines.extend(added)
+        for idx in range(max(len(removed), len(added))):
+            rows.append({
+                "left": removed[idx] if idx < len(removed) else None,
+                "right": added[idx] if idx < len(added) else None,
+            })
+
+    first, last = group[0], group[-1]
+    return {
+        "old_start": first[1] + 1,
+        "old_lines": last[2] - first[1],
+        "new_start": first[3] + 1,
+        "new_lines": last[4] - first[3],
+        "lines": lines,
+        "rows": rows,
+    }
+
+
+def compute(old: str, new: str, context: int = 3) -> dict:
+    """Full diff of two texts: hunks plus addition/deletion totals."""
+    a = old.splitlines()
+    b = new.splitlines()
+    codes = opcodes(a, b)
+    additions = sum(j2 - j1 for tag, _, _, j1, j2 in codes if tag in ("insert", "replace"))
+    deletions = sum(i2 - i1 for tag, i1, i2, _, _ in codes if tag in ("delete", "replace"))
+    return {
+        "additions": additions,
+        "deletions": deletions,
+        "hunks": [_build_hunk(group, a, b) for group in _grouped(codes, context)],
+    }
+
+
+class DiffCache:
+    """Computed diffs keyed by both content hashes."""
+
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(maxsize, ttl=math.inf)
+
+    def get_or_compute(self, old_hash: bytes, new_hash: bytes, old: str, new: str, context: int) -> dict:
+        """Diff of ``old`` -> ``new``, whose stored digests (see core.blobs) are given."""
+        key = (old_hash, new_hash, context)
+        result = self._entries.get(key)
+        if result is None:
+            result = compute(old, new, context)
+            result["old_hash"], result["new_hash"] = old_hash.hex(), new_hash.hex()
+            self._entries.put(key, result)
+        return result
+
+
+diff_cache = DiffCache(settings.DIFF_CACHE_SIZE)
@@ -0,0 +1,157 @@
+"""Live repository events, pushed to browsers as Server-Sent Events.
+
+Writes that viewers should see at once (a comment, a DUR approved or
+rejected, a document edited) call ``publish_event`` inside their transaction.
+As with ``invalidate_responses`` it queues a ``NOTIFY repo_events``, so every
+worker receives the event once the transaction commits, and never one that
+rolled back.  Each worker's ``EventBroker`` subscribes to the channel on the
+shared LISTEN connection (core.notify) and fans each event out to the streams
+open on that repository, encoding it once however many there are.
+
+Events say what changed, not what it now holds: clients refetch through the
+regular endpoints, which check access as usual.  A stream holds no database
+connection; an idle one costs a small queue and a keep-alive comment every
+``EVENTS_KEEPALIVE_SECONDS``.  A client more than ``EVENTS_QUEUE_SIZE``
+events behind gets ``reset`` instead, and refetches what it shows.
+
+Access is checked when a stream opens, so streams end whenever it may have
+changed: on ``repo_access_changed`` (core.permissions) those of the
+repository, or of the one member; on ``user_changed`` (core.principals)
+those of the user.  They also end when the LISTEN connection is lost or
+re-established, since those notifications and events may have been missed.
+The client reconnects, which checks access again, and refetches.
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from .notify import listener
+from .permissions import REPO_CHANNEL
+from .principals import USER_CHANNEL
+
+EVENTS_CHANNEL = "repo_events"
+# Browsers wait this long before reconnecting a dropped stream.
+RETRY_MS = 3000
+
+RESET = b"event: reset\ndata: {}\n\n"
+KEEPALIVE = b": keep-alive\n\n"
+
+
+def encode(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+class EventStream:
+    """Frames waiting to be sent to one client; ``None`` ends the stream."""
+
+    def __init__(self, maxsize: int, user_id: Optional[str]):
+        self.user_id = user_id
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def _drain(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def offer(self, frame: bytes) -> None:
+        if self._queue.full():
+            # Too far behind to catch up event by event.
+            self._drain()
+            frame = RESET
+        self._queue.put_nowait(frame)
+
+    def end(self) -> None:
+        # Pending events are moot; the client refetches when it reconnects.
+        self._drain()
+        self._queue.put_nowait(None)
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return KEEPALIVE
+
+
+class EventBroker:
+    """This worker's open streams by repository id, fed from NOTIFY."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._streams: Dict[str, Set[EventStream]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(streams) for streams in self._streams.values())
+
+    def open(self, repo_id: str, user_id: Optional[str]) -> EventStream:
+        stream = EventStream(self.queue_size, user_id)
+        self._streams.setdefault(repo_id, set()).add(stream)
+        return stream
+
+    def close(self, repo_id: str, stream: EventStream) -> None:
+        streams = self._streams.get(repo_id)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self._streams[repo_id]
+
+    def dispatch(self, payload: str) -> None:
+        """Handles ``<repo_id>:<event>:<json>`` from the channel."""
+        repo_id, _, rest = payload.partition(":")
+        streams = self._streams.get(repo_id)
+        if not streams:
+            return
+        event, _, data = rest.partition(":")
+        frame = encode(event, data)
+        for stream in streams:
+            stream.offer(frame)
+
+    def revoke_repo(self, payload: str) -> None:
+        """Handles ``<repo id>`` (every stream) or ``<repo id>:<user id>``."""
+        repo_id, _, user_id = payload.partition(":")
+        for stream in self._streams.get(repo_id, ()):
+            if not user_id or stream.user_id == user_id:
+                stream.end()
+
+    def revoke_user(self, user_id: str) -> None:
+        for streams in self._streams.values():
+            for stream in streams:
+                if stream.user_id == user_id:
+                    stream.end()
+
+    def reset(self) -> None:
+        for streams in self._streams.values():
+            for stream in streams:
+                stream.end()
+
+    async def stream(self, repo_id: str, user_id: Optional[str]) -> AsyncIterator[bytes]:
+        """The body of one client's event stream, ``user_id``'s or anonymous;
+        runs until it disconnects or the stream is ended."""
+        stream = self.open(repo_id, user_id)
+        try:
+            # Sent at once, so the response starts before the first event.
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while True:
+                frame = await stream.next(settings.EVENTS_KEEPALIVE_SECONDS)
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.close(repo_id, stream)
+
+
+broker = EventBroker(settings.EVENTS_QUEUE_SIZE)
+listener.subscribe(EVENTS_CHANNEL, broker.dispatch)
+listener.subscribe(REPO_CHANNEL, broker.revoke_repo)
+listener.subscribe(USER_CHANNEL, broker.revoke_user)
+listener.on_reset(broker.reset)
+
+
+async def publish_event(db: AsyncSession, repo_id: UUID, event: str, **data) -> None:
+    """Send ``event`` to the repository's streams once the current
+    transaction commits; call before committing the write."""
+    payload = f"{repo_id}:{event}:{json.dumps(data, default=str)}"
+    await db.execute(select(func.pg_notify(EVENTS_CHANNEL, payload)))
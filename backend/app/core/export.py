@@ -0,0 +1,230 @@
+"""Streaming repository export.
+
+``export_repository`` yields a gzipped tar archive chunk by chunk.  Rows come
+from server-side cursors (``yield_per``) as plain column tuples, so nothing
+accumulates in a session identity map, and each document's history is
+rebuilt one version at a time.  Peak memory is roughly one version's text
+plus the comments of one DUR, whatever the size of the repository.
+
+Layout, under ``<repo slug>/``::
+
+    repository.json
+    documents/<doc slug>/document.json
+    documents/<doc slug>/content.md
+    documents/<doc slug>/versions/000001.json   commit message, author, date
+    documents/<doc slug>/versions/000001.md     full text of that version
+    durs/<dur id>.json                          DUR metadata and its comments
+    durs/<dur id>.md                            proposed content
+"""
+import gzip
+import io
+import json
+import tarfile
+import time
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from ..database import AsyncSessionLocal
+from ..models.document import Document, DocumentVersion
+from ..models.dur import DUR, DURComment
+from ..models.repository import DocRepository
+from ..models.user import User
+from . import version_store
+
+YIELD_PER = 200
+FORMAT_VERSION = 1
+
+
+class _Buffer:
+    """File-like sink the archive writes into; drained after each member."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _Peekable:
+    """One-row lookahead over an async result, for merge-joining two cursors."""
+
+    def __init__(self, result):
+        self._iter = result.__aiter__()
+        self.head = None
+        self.done = False
+
+    async def advance(self):
+        try:
+            self.head = await self._iter.__anext__()
+        except StopAsyncIteration:
+            self.head, self.done = None, True
+        return self.head
+
+
+def _json(value) -> bytes:
+    def default(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        if isinstance(obj, UUID):
+            return str(obj)
+        raise TypeError(type(obj).__name__)
+
+    return json.dumps(value, default=default, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _mtime(value: Optional[datetime]) -> int:
+    # Whole seconds: a fractional mtime costs an extra PAX header per member.
+    return int(value.timestamp() if value else time.time())
+
+
+async def export_repository(repo_id: UUID) -> AsyncIterator[bytes]:
+    """Yields the archive for ``repo_id``; opens its own session because it
+    runs after the request's dependencies have been torn down."""
+    async for chunk in _archive(repo_id):
+        if chunk:
+            yield chunk
+
+
+async def _archive(repo_id: UUID) -> AsyncIterator[bytes]:
+    buffer = _Buffer()
+    gz = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6)
+    tar = tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add(name: str, data: bytes, mtime: int) -> None:
+        info = tarfile.TarInfo(f"{root}/{name}")
+        info.size = len(data)
+        info.mtime = mtime
+        info.mode = 0o644
+        tar.addfile(info, io.BytesIO(data))
+        # TarFile remembers every member for getmembers(); nothing reads them here.
+        tar.members.clear()
+
+    async with AsyncSessionLocal() as db:
+        # One snapshot for every cursor, so the archive is consistent.
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        repo = (await db.execute(
+            select(DocRepository.slug, DocRepository.name, DocRepository.description,
+                   DocRepository.is_public, DocRepository.created_at, User.username)
+            .join(User, User.id == DocRepository.owner_id)
+            .where(DocRepository.id == repo_id)
+        )).one()
+        root = repo.slug
+        add("repository.json", _json({
+            "format": FORMAT_VERSION,
+            "name": repo.name,
+            "slug": repo.slug,
+            "description": repo.description,
+            "is_public": repo.is_public,
+            "owner": repo.username,
+            "created_at": repo.created_at,
+            "exported_at": datetime.utcnow(),
+        }), _mtime(repo.created_at))
+        yield buffer.drain()
+
+        docs = await db.stream(
+            select(Document.id, Document.slug, Document.title, Document.current_content,
+                   Document.created_at, Document.updated_at, User.username)
+            .join(User, User.id == Document.created_by)
+            .where(Document.repo_id == repo_id)
+            .order_by(Document.id)
+            .execution_options(yield_per=YIELD_PER)
+        )
+        versions = _Peekable(await db.stream(
+            select(DocumentVersion.document_id, DocumentVersion.version_number, DocumentVersion.storage,
+                   DocumentVersion.payload, DocumentVersion.snapshot, DocumentVersion.commit_message,
+                   DocumentVersion.created_at, User.username)
+            .join(Document, Document.id == DocumentVersion.document_id)
+            .join(User, User.id == DocumentVersion.created_by)
+            .where(Document.repo_id == repo_id)
+            .order_by(DocumentVersion.document_id, DocumentVersion.version_number)
+            .execution_options(yield_per=YIELD_PER)
+        ))
+        await versions.advance()
+        async for doc in docs:
+            base = f"documents/{doc.slug}"
+            add(f"{base}/document.json", _json({
+                "title": doc.title,
+                "slug": doc.slug,
+                "created_by": doc.username,
+                "created_at": doc.created_at,
+                "updated_at": doc.updated_at,
+            }), _mtime(doc.updated_at))
+            add(f"{base}/content.md", doc.current_content.encode("utf-8"), _mtime(doc.updated_at))
+
+            # Both cursors are ordered by document id.
+            content = None
+            while not versions.done and versions.head.document_id == doc.id:
+                version = versions.head
+                content = version_store.rebuild(version, content)
+                name = f"{base}/versions/{version.version_number:06d}"
+                add(f"{name}.json", _json({
+                    "version_number": version.version_number,
+                    "commit_message": version.commit_message,
+                    "created_by": version.username,
+                    "created_at": version.created_at,
+                }), _mtime(version.created_at))
+                add(f"{name}.md", content.encode("utf-8"), _mtime(version.created_at))
+                yield buffer.drain()
+                await versions.advance()
+            yield buffer.drain()
+
+        reviewer = aliased(User)
+        creator = aliased(User)
+        durs = await db.stream(
+            select(DUR.id, DUR.title, DUR.description, DUR.proposed_content, DUR.status,
+                   DUR.created_at, DUR.reviewed_at, DUR.review_comment, Document.slug.label("document"),
+                   creator.username.label("created_by"), reviewer.username.label("reviewed_by"))
+            .join(Document, Document.id == DUR.document_id)
+            .join(creator, creator.id == DUR.created_by)
+            .outerjoin(reviewer, reviewer.id == DUR.reviewed_by)
+            .where(DUR.repo_id == repo_id)
+            .order_by(DUR.id)
+            .execution_options(yield_per=YIELD_PER)
+        )
+        comments = _Peekable(await db.stream(
+            select(DURComment.dur_id, DURComment.content, DURComment.created_at, User.username)
+            .join(DUR, DUR.id == DURComment.dur_id)
+            .join(User, User.id == DURComment.user_id)
+            .where(DUR.repo_id == repo_id)
+            .order_by(DURComment.dur_id, DURComment.created_at, DURComment.id)
+            .execution_options(yield_per=YIELD_PER)
+        ))
+        await comments.advance()
+        async for dur in durs:
+            thread = []
+            while not comments.done and comments.head.dur_id == dur.id:
+                comment = comments.head
+                thread.append({"user": comment.username, "content": comment.content, "created_at": comment.created_at})
+                await comments.advance()
+            add(f"durs/{dur.id}.json", _json({
+                "id": dur.id,
+                "document": dur.document,
+                "title": dur.title,
+                "description": dur.description,
+                "status": dur.status.value,
+                "created_by": dur.created_by,
+                "created_at": dur.created_at,
+                "reviewed_by": dur.reviewed_by,
+                "reviewed_at": dur.reviewed_at,
+                "review_comment": dur.review_comment,
+                "comments": thread,
+            }), _mtime(dur.reviewed_at or dur.created_at))
+            add(f"durs/{dur.id}.md", dur.proposed_content.encode("utf-8"), _mtime(dur.created_at))
+            yield buffer.drain()
+
+    tar.close()
+    gz.close()
+    yield buffer.drain()
@@ -0,0 +1,333 @@
+"""Bulk document import.
+
+``import_documents`` reads documents from an upload spooled to a temporary
+file, either NDJSON (one ``schemas.document.DocumentImport`` per line) or a
+tar archive, optionally gzipped, in the layout ``core.export`` writes.  Only
+the documents of an archive are imported; its ``repository.json`` and DURs
+are ignored.
+
+The upload is validated in full before anything is written, so a malformed
+line or member rejects the whole import.  Documents are then written in
+batches of ``IMPORT_BATCH_SIZE``, one transaction per batch:
+
+* slugs come from one query for the repository's existing slugs plus a
+  ``SlugAllocator``, re-checked with one query per batch in case a document
+  was created meanwhile.  Each batch first takes the advisory locks that
+  ``create_doc`` takes on the same bases, so none can be created between
+  the check and the ``COPY``; a batch that still hits the unique index
+  (a slug requested as ``notes-1`` while ``notes`` was being created) is
+  rolled back and written again with fresh slugs;
+* version payloads are encoded on a worker thread, off the event loop;
+* ``Document`` and ``DocumentVersion`` rows go in with ``COPY`` when the
+  driver supports it, and search entries with one ``INSERT ... SELECT``.
+
+A database error part way through leaves the batches before it committed.
+"""
+import json
+import tarfile
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Callable, Dict, Iterator, List, Optional
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException, Request
+from asyncpg.exceptions import UniqueViolationError
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.document import Document, DocumentVersion
+from ..schemas.document import DocumentImport, VersionImport
+from . import blobs
+from . import search as search_index
+from . import version_store
+from .metrics import versions_written
+from .profiling import run_in_threadpool
+from .slugs import INSERT_ATTEMPTS, UNIQUE_VIOLATION, SlugAllocator, lock_bases, slugify
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+ARCHIVE_TYPES = ("application/gzip", "application/x-gzip", "application/x-tar", "application/x-gtar")
+
+DOCUMENT_COLUMNS = ("id", "repo_id", "title", "slug", "content_hash", "head_version", "created_by",
+                    "created_at", "updated_at")
+VERSION_COLUMNS = ("id", "document_id", "version_number", "storage", "payload", "blob_hash", "commit_message",
+                   "created_by", "created_at")
+
+# Uploads larger than this are spooled to disk.
+SPOOL_MEMORY = 8 * 1024 * 1024
+# A batch also closes once its rows hold this much text and payload.
+BATCH_MAX_BYTES = 32 * 1024 * 1024
+
+
+def _invalid(where: str, message: str) -> HTTPException:
+    return HTTPException(status_code=422, detail=f"{where}: {message}")
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'document'}: {error['msg']}"
+        for error in exc.errors()[:3]
+    )
+
+
+def read_ndjson(upload) -> Iterator[DocumentImport]:
+    for number, line in enumerate(upload, 1):
+        if not line.strip():
+            continue
+        try:
+            yield DocumentImport.model_validate_json(line)
+        except ValidationError as exc:
+            raise _invalid(f"line {number}", _describe(exc))
+
+
+def read_archive(upload) -> Iterator[DocumentImport]:
+    """Documents under ``.../documents/<slug>/`` in archive order.
+
+    Read as a stream, so each document's files must be contiguous, which
+    holds for ``core.export`` and for ``tar`` run over a directory.
+    """
+    current: Optional[str] = None
+    files: Dict[str, bytes] = {}
+    done = set()
+    try:
+        with tarfile.open(fileobj=upload, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                parts = PurePosixPath(member.name).parts
+                if "documents" not in parts[:-2]:
+                    continue
+                at = parts.index("documents")
+                key = "/".join(parts[:at + 2])
+                if key != current:
+                    if current is not None:
+                        yield _archive_document(current, files)
+                        done.add(current)
+                    if key in done:
+                        raise _invalid(member.name, "files of one document must be contiguous in the archive")
+                    current, files = key, {}
+                files["/".join(parts[at + 2:])] = tar.extractfile(member).read()
+    except (tarfile.TarError, EOFError, OSError, zlib.error) as exc:
+        raise _invalid("archive", str(exc) or type(exc).__name__)
+    if current is not None:
+        yield _archive_document(current, files)
+
+
+def _archive_document(key: str, files: Dict[str, bytes]) -> DocumentImport:
+    def text(name: str) -> str:
+        try:
+            return files[name].decode("utf-8")
+        except UnicodeDecodeError:
+            raise _invalid(f"{key}/{name}", "not valid UTF-8")
+
+    def metadata(name: str) -> dict:
+        if name not in files:
+            return {}
+        try:
+            value = json.loads(text(name))
+        except ValueError as exc:
+            raise _invalid(f"{key}/{name}", str(exc))
+        if not isinstance(value, dict):
+            raise _invalid(f"{key}/{name}", "expected a JSON object")
+        return value
+
+    numbers = []
+    for name in files:
+        path = PurePosixPath(name)
+        if path.parent.name == "versions" and path.suffix == ".md":
+            if not path.stem.isdigit():
+                raise _invalid(f"{key}/{name}", "version files are named by number")
+            numbers.append(int(path.stem))
+    versions = []
+    for number in sorted(numbers):
+        base = f"versions/{number:06d}"
+        meta = metadata(f"{base}.json")
+        versions.append({
+            "content": text(f"{base}.md"),
+            "commit_message": meta.get("commit_message"),
+            "created_at": meta.get("created_at"),
+        })
+
+    meta = metadata("document.json")
+    name = key.rsplit("/", 1)[-1]
+    data = {
+        "title": meta.get("title") or name,
+        "slug": meta.get("slug") or name,
+        "content": text("content.md") if "content.md" in files else None,
+        "versions": versions,
+        "created_at": meta.get("created_at"),
+    }
+    try:
+        return DocumentImport.model_validate(data)
+    except ValidationError as exc:
+        raise _invalid(key, _describe(exc))
+
+
+def reader_for(content_type: str) -> Callable[[object], Iterator[DocumentImport]]:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in NDJSON_TYPES:
+        return read_ndjson
+    if media_type in ARCHIVE_TYPES:
+        return read_archive
+    raise HTTPException(
+        status_code=415,
+        detail=f"Send NDJSON ({NDJSON_TYPES[0]}) or a tar archive ({', '.join(ARCHIVE_TYPES)})",
+    )
+
+
+async def spool(request: Request) -> tempfile.SpooledTemporaryFile:
+    """Copies the request body to a temporary file, enforcing ``IMPORT_MAX_SIZE``."""
+    upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_SIZE:
+                raise HTTPException(status_code=413, detail=f"Imports are limited to {settings.IMPORT_MAX_SIZE} bytes")
+            upload.write(chunk)
+    except BaseException:
+        upload.close()
+        raise
+    upload.seek(0)
+    return upload
+
+
+@dataclass
+class _Batch:
+    documents: List[list] = field(default_factory=list)
+    versions: List[tuple] = field(default_factory=list)
+    # Current texts of the documents, by digest; see core.blobs.
+    blobs: Dict[bytes, str] = field(default_factory=dict)
+    # Slug each document asked for; the one it gets is set by ``_write``.
+    requested: List[str] = field(default_factory=list)
+    renamed: int = 0
+    size: int = 0
+
+
+def _next_batch(items: Iterator[DocumentImport], repo_id: UUID, user_id: UUID) -> _Batch:
+    """Encodes up to ``IMPORT_BATCH_SIZE`` documents into rows; runs on a worker thread."""
+    batch = _Batch()
+    now = datetime.utcnow()
+    for item in items:
+        doc_id = uuid4()
+        history = item.versions or [VersionImport(content=item.content, commit_message="Initial version")]
+        previous = None
+        for number, version in enumerate(history, 1):
+            content_hash = blobs.digest(version.content)
+            # Only texts earlier in the batch are known to be stored.
+            stored = content_hash in batch.blobs
+            storage, payload = version_store.encode_version(number, version.content, previous, stored)
+            batch.versions.append((uuid4(), doc_id, number, storage, payload, content_hash if stored else None,
+                                   version.commit_message, user_id, version.created_at or now))
+            batch.size += len(payload or b"")
+            previous = version.content
+
+        created_at = item.created_at or history[0].created_at or now
+        updated_at = history[-1].created_at or created_at
+        batch.documents.append([doc_id, repo_id, item.title, None, content_hash, len(history), user_id,
+                                created_at, updated_at])
+        batch.requested.append(item.slug or slugify(item.title))
+        if content_hash not in batch.blobs:
+            batch.blobs[content_hash] = previous
+            batch.size += len(previous)
+        if len(batch.documents) >= settings.IMPORT_BATCH_SIZE or batch.size >= BATCH_MAX_BYTES:
+            break
+    return batch
+
+
+async def _copy(db: AsyncSession, table, columns: tuple, rows: list) -> None:
+    connection = await db.connection()
+    driver = (await connection.get_raw_connection()).driver_connection
+    if hasattr(driver, "copy_records_to_table"):
+        await driver.copy_records_to_table(table.name, records=rows, columns=columns)
+    else:
+        await db.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+async def _write(db: AsyncSession, batch: _Batch, slugs: SlugAllocator, repo_id: UUID) -> None:
+    batch.renamed = 0
+    for row, requested in zip(batch.documents, batch.requested):
+        row[3] = slugs.allocate(requested)
+        batch.renamed += row[3] != requested
+    # Also opens the transaction, so the COPYs below run inside it.
+    await lock_bases(db, Document.slug, batch.requested)
+    while True:
+        clashes = set(await db.scalars(select(Document.slug).where(
+            Document.repo_id == repo_id,
+            Document.slug.in_([row[3] for row in batch.documents]),
+        )))
+        if not clashes:
+            break
+        for row, requested in zip(batch.documents, batch.requested):
+            if row[3] in clashes:
+                batch.renamed += row[3] == requested
+                row[3] = slugs.allocate(requested)
+    await blobs.store(db, batch.blobs)
+    await _copy(db, Document.__table__, DOCUMENT_COLUMNS, batch.documents)
+    await _copy(db, DocumentVersion.__table__, VERSION_COLUMNS, batch.versions)
+    await search_index.index_documents(db, [row[0] for row in batch.documents])
+
+
+def _is_unique_violation(exc: Exception) -> bool:
+    # asyncpg's own error from COPY, or SQLAlchemy's from the executemany fallback.
+    if isinstance(exc, IntegrityError):
+        return getattr(exc.orig, "pgcode", None) == UNIQUE_VIOLATION
+    return isinstance(exc, UniqueViolationError)
+
+
+async def _taken_slugs(db: AsyncSession, repo_id: UUID) -> SlugAllocator:
+    return SlugAllocator(set(await db.scalars(select(Document.slug).where(Document.repo_id == repo_id))))
+
+
+def _validate(read, upload) -> int:
+    count = sum(1 for _ in read(upload))
+    upload.seek(0)
+    return count
+
+
+async def import_documents(db: AsyncSession, repo_id: UUID, user_id: UUID, upload, read) -> dict:
+    """Imports every document ``read`` (from ``reader_for``) finds in
+    ``upload`` into the repository; returns counts and throughput."""
+    started = time.perf_counter()
+    if not await run_in_threadpool(_validate, read, upload):
+        raise _invalid("upload", "no documents found")
+
+    slugs = await _taken_slugs(db, repo_id)
+    # Hand the connection back while the first batch is encoded.
+    await db.commit()
+    items = read(upload)
+    totals = {"documents": 0, "versions": 0, "renamed": 0, "batches": 0}
+    while True:
+        batch = await run_in_threadpool(_next_batch, items, repo_id, user_id)
+        if not batch.documents:
+            break
+        for _ in range(INSERT_ATTEMPTS):
+            try:
+                await _write(db, batch, slugs, repo_id)
+                await db.commit()
+                break
+            except (IntegrityError, UniqueViolationError) as exc:
+                if not _is_unique_violation(exc):
+                    raise
+                await db.rollback()
+                slugs = await _taken_slugs(db, repo_id)
+        else:
+            raise HTTPException(status_code=409, detail="Could not find free slugs, try again")
+        versions_written.inc("import", amount=len(batch.versions))
+        totals["documents"] += len(batch.documents)
+        totals["versions"] += len(batch.versions)
+        totals["renamed"] += batch.renamed
+        totals["batches"] += 1
+
+    seconds = time.perf_counter() - started
+    return {
+        **totals,
+        "seconds": round(seconds, 3),
+        "documents_per_second": round(totals["documents"] / seconds, 1),
+    }
@@ -0,0 +1,102 @@
+"""Server-side Markdown rendering for document and version views.
+
+Text is rendered by cmark-gfm (GitHub Flavored Markdown, as ``marked``
+rendered it in the browser) and the HTML is cleaned with nh3, which keeps
+only allowlisted tags, attributes and URL schemes, so raw HTML in a document
+cannot run script.  Headings get GitHub-style ``id`` slugs and make up the
+table of contents; every ``id`` is prefixed with ``ID_PREFIX`` so a document
+cannot shadow the page's own.
+
+Output depends only on the text, so it is cached by content hash in an LRU
+of ``RENDER_CACHE_SIZE`` entries per worker.  Previews of unsaved text are
+rendered without it, so drafts do not evict the renders of documents.  ``RENDERER_VERSION`` is part of
+the validators of rendered responses; bump it whenever the same text would
+render differently.
+"""
+import html
+import math
+import re
+from typing import Dict, List
+
+import cmarkgfm
+import nh3
+from cmarkgfm.cmark import Options
+
+from ..config import settings
+from ..schemas.document import RenderedMarkdown, TocEntry
+from .cache import TTLCache, content_hash
+from .profiling import run_in_threadpool
+
+RENDERER_VERSION = 1
+ID_PREFIX = "user-content-"
+
+EXTENSIONS = ["table", "strikethrough", "autolink", "tasklist"]
+
+_TAGS = nh3.ALLOWED_TAGS | {"input"}
+_ATTRIBUTES = {
+    **nh3.ALLOWED_ATTRIBUTES,
+    **{f"h{level}": {"id"} for level in range(1, 7)},
+    "code": {"class"},
+    "input": {"checked", "disabled"},
+}
+# Task list items; whatever the text says, a checkbox is all it can be.
+_TAG_ATTRIBUTE_VALUES = {"input": {"type": {"checkbox"}}}
+_SET_TAG_ATTRIBUTE_VALUES = {"input": {"disabled": ""}}
+
+# Headings from Markdown, as cmark writes them; raw HTML headings keep their own ids.
+_HEADING_RE = re.compile(r"<h([1-6])>(.*?)</h\1>")
+_TAG_RE = re.compile(r"<[^>]*>")
+_SLUG_STRIP_RE = re.compile(r"[^\w\- ]")
+
+
+def _slug(text: str, seen: Dict[str, int]) -> str:
+    base = _SLUG_STRIP_RE.sub("", text.strip().lower()).replace(" ", "-") or "section"
+    count = seen.get(base, 0)
+    seen[base] = count + 1
+    return base if count == 0 else f"{base}-{count}"
+
+
+def render(text: str) -> RenderedMarkdown:
+    toc: List[TocEntry] = []
+    seen: Dict[str, int] = {}
+
+    def anchor(match: re.Match) -> str:
+        level, inner = match.groups()
+        title = html.unescape(_TAG_RE.sub("", inner))
+        slug = _slug(title, seen)
+        toc.append(TocEntry(level=int(level), text=title, id=ID_PREFIX + slug))
+        return f'<h{level} id="{slug}">{inner}</h{level}>'
+
+    raw = cmarkgfm.markdown_to_html_with_extensions(text, Options.CMARK_OPT_UNSAFE, EXTENSIONS)
+    clean = nh3.clean(
+        _HEADING_RE.sub(anchor, raw),
+        tags=_TAGS,
+        attributes=_ATTRIBUTES,
+        tag_attribute_values=_TAG_ATTRIBUTE_VALUES,
+        set_tag_attribute_values=_SET_TAG_ATTRIBUTE_VALUES,
+        id_prefix=ID_PREFIX,
+    )
+    return RenderedMarkdown(html=clean, toc=toc)
+
+
+render_cache = TTLCache(settings.RENDER_CACHE_SIZE, ttl=math.inf)
+
+
+def _render_and_store(key: str, text: str) -> RenderedMarkdown:
+    rendered = render(text)
+    render_cache.put(key, rendered)
+    return rendered
+
+
+async def rendered(text: str) -> RenderedMarkdown:
+    """``render(text)``, from the cache or rendered off the event loop."""
+    key = content_hash(text)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached
+    return await run_in_threadpool(_render_and_store, key, text)
+
+
+async def preview(text: str) -> RenderedMarkdown:
+    """``render(text)`` off the event loop, bypassing the cache."""
+    return await run_in_threadpool(render, text)
@@ -0,0 +1,371 @@
+"""Prometheus metrics for ``/metrics``.
+
+Counters and histograms are plain dicts updated from the event loop thread,
+which is the only writer, so recording takes no lock.  Gauges (requests in
+flight, pool and bcrypt queue state, threadpool use, open event streams) are
+read from their owners when collected.
+
+Each uvicorn worker has its own registry.  With ``METRICS_DIR`` set, every
+worker writes a snapshot of its samples to ``<dir>/<pid>-<start>.json`` every
+``METRICS_FLUSH_SECONDS``, and ``/metrics`` sums the snapshots of all
+workers with its own live samples.  Counters and histograms of workers that
+exited still count, as they must for ``rate()``; their gauges do not.  Clear
+the directory when the service starts.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from anyio import to_thread
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+from ..database import pool_status
+from .events import broker
+from .passwords import password_hasher
+from .pool_metrics import WAIT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Open to merged, from a minute to a month.
+MERGE_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600, 30 * 24 * 3600)
+# Snapshots older than this many flush intervals are from workers that died.
+STALE_FLUSHES = 3
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]
+
+
+class Family:
+    def __init__(self, name: str, kind: str, help: str, samples: Optional[List[Sample]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = samples if samples is not None else []
+
+    def to_json(self) -> dict:
+        return {"name": self.name, "kind": self.kind, "help": self.help,
+                "samples": [[name, list(labels), value] for name, labels, value in self.samples]}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Family":
+        samples = [(name, tuple(tuple(pair) for pair in labels), value) for name, labels, value in data["samples"]]
+        return cls(data["name"], data["kind"], data["help"], samples)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self) -> Family:
+        return Family(self.name, "counter", self.help, [
+            (self.name, tuple(zip(self.labels, values)), value) for values, value in self._values.items()
+        ])
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # Per label values: a count per bucket plus +Inf, then the sum.
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts = self._values.get(label_values)
+        if counts is None:
+            counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> Family:
+        family = Family(self.name, "histogram", self.help)
+        for values, counts in self._values.items():
+            family.samples += histogram_samples(self.name, tuple(zip(self.labels, values)),
+                                                self.buckets, counts[:-1], counts[-1])
+        return family
+
+
+def histogram_samples(name: str, labels: Labels, buckets: tuple, counts: list, total: float) -> List[Sample]:
+    """Cumulative ``_bucket`` samples plus ``_sum`` and ``_count`` from a
+    count per bucket (the last one for +Inf)."""
+    samples, cumulative = [], 0
+    for bound, count in zip([*map(str, buckets), "+Inf"], counts):
+        cumulative += count
+        samples.append((f"{name}_bucket", labels + (("le", bound),), cumulative))
+    samples += [(f"{name}_sum", labels, total), (f"{name}_count", labels, cumulative)]
+    return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], List[Family]]] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple, labels: Tuple[str, ...] = ()) -> Histogram:
+        metric = Histogram(name, help, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], List[Family]]) -> Callable[[], List[Family]]:
+        """Registers ``collect``, called on the event loop for gauges and
+        counters kept elsewhere."""
+        self._collectors.append(collect)
+        return collect
+
+    def collect(self) -> List[Family]:
+        families = [metric.collect() for metric in self._metrics]
+        for collect in self._collectors:
+            families += collect()
+        return families
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "dochub_http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "dochub_http_request_duration_seconds", "Time until the response body was sent.",
+    LATENCY_BUCKETS, ("method", "route"))
+versions_written = registry.counter(
+    "dochub_document_versions_written_total", "Document versions committed.", ("source",))
+merge_seconds = registry.histogram(
+    "dochub_dur_merge_seconds", "Time from opening a DUR to merging it.", MERGE_BUCKETS)
+response_cache_lookups = registry.counter(
+    "dochub_response_cache_lookups_total", "Anonymous reads by response cache outcome.", ("result",))
+
+
+class MetricsMiddleware:
+    # Across instances, in case the app is mounted more than once.
+    in_flight = 0
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        MetricsMiddleware.in_flight += 1
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            MetricsMiddleware.in_flight -= 1
+            # Route templates keep the label set small; unmatched paths share one.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc(scope["method"], route, str(status))
+            http_duration.observe(time.perf_counter() - t0, scope["method"], route)
+
+
+def _gauge(name: str, help: str, samples: List[Sample]) -> Family:
+    return Family(name, "gauge", help, samples)
+
+
+@registry.collector
+def _collect_http() -> List[Family]:
+    return [_gauge("dochub_http_requests_in_flight", "HTTP requests being handled.",
+                   [("dochub_http_requests_in_flight", (), MetricsMiddleware.in_flight)])]
+
+
+@registry.collector
+def _collect_pools() -> List[Family]:
+    pools = pool_status()
+    families = [
+        Family("dochub_db_pool_checkouts_total", "counter", "Connections checked out of the pool."),
+        Family("dochub_db_pool_overflow_events_total", "counter", "Checkouts that opened an overflow connection."),
+        Family("dochub_db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection."),
+        Family("dochub_db_pool_checkout_wait_seconds", "histogram", "Wait for a pooled connection."),
+    ]
+    gauges = [
+        ("size", _gauge("dochub_db_pool_size", "Configured pool size.", [])),
+        ("in_use", _gauge("dochub_db_pool_connections_in_use", "Connections checked out.", [])),
+        ("idle", _gauge("dochub_db_pool_connections_idle", "Connections idle in the pool.", [])),
+        ("overflow", _gauge("dochub_db_pool_overflow", "Overflow connections open.", [])),
+    ]
+    for name, stats in pools.items():
+        labels = (("pool", name),)
+        for family, key in zip(families, ("checkouts", "overflow_events", "timeouts")):
+            family.samples.append((family.name, labels, stats[key]))
+        families[3].samples += histogram_samples(families[3].name, labels, WAIT_BUCKETS,
+                                                 list(stats["wait_buckets"].values()), stats["wait_seconds_total"])
+        # NullPool (PgBouncer mode) has no gauges.
+        for key, family in gauges:
+            if key in stats:
+                family.samples.append((family.name, labels, stats[key]))
+    return families + [family for _, family in gauges]
+
+
+@registry.collector
+def _collect_threadpool() -> List[Family]:
+    limiter = to_thread.current_default_thread_limiter()
+    return [
+        _gauge("dochub_threadpool_threads_busy", "Threadpool threads running work.",
+               [("dochub_threadpool_threads_busy", (), limiter.borrowed_tokens)]),
+        _gauge("dochub_threadpool_threads_max", "Threadpool size.",
+               [("dochub_threadpool_threads_max", (), limiter.total_tokens)]),
+        _gauge("dochub_threadpool_tasks_waiting", "Calls waiting for a threadpool thread.",
+               [("dochub_threadpool_tasks_waiting", (), limiter.statistics().tasks_waiting)]),
+    ]
+
+
+@registry.collector
+def _collect_event_streams() -> List[Family]:
+    return [_gauge("dochub_event_streams_open", "Live event streams connected to this worker.",
+                   [("dochub_event_streams_open", (), len(broker))])]
+
+
+@registry.collector
+def _collect_password_hashing() -> List[Family]:
+    stats = password_hasher.snapshot()
+    families = [
+        _gauge("dochub_password_hash_workers", "bcrypt worker processes.", []),
+        _gauge("dochub_password_hash_in_flight", "bcrypt calls running or queued.", []),
+        _gauge("dochub_password_hash_queued", "bcrypt calls waiting for a worker.", []),
+        Family("dochub_password_hash_completed_total", "counter", "bcrypt calls finished."),
+        Family("dochub_password_hash_rejected_total", "counter", "Sign-ins refused with 503 because the queue was full."),
+        Family("dochub_password_hash_seconds_total", "counter", "Time bcrypt calls spent queued and running."),
+    ]
+    for family, key in zip(families, ("workers", "in_flight", "queued", "completed", "rejected", "seconds_total")):
+        family.samples.append((family.name, (), stats[key]))
+    return families
+
+
+def merge(snapshots: List[List[Family]]) -> List[Family]:
+    """Sums samples with the same name and labels across workers."""
+    merged: Dict[str, Family] = {}
+    values: Dict[str, Dict[Tuple[str, Labels], float]] = {}
+    for families in snapshots:
+        for family in families:
+            if family.name not in merged:
+                merged[family.name] = Family(family.name, family.kind, family.help)
+                values[family.name] = {}
+            totals = values[family.name]
+            for name, labels, value in family.samples:
+                totals[(name, labels)] = totals.get((name, labels), 0) + value
+    for name, family in merged.items():
+        family.samples = [(sample, labels, value) for (sample, labels), value in values[name].items()]
+    return list(merged.values())
+
+
+class Publisher:
+    """Writes this worker's snapshot to ``directory`` on an interval."""
+
+    def __init__(self, directory: Optional[str], interval: float):
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.json") if directory else None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.directory and self._task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.write(live=False)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.write(live=True)
+            except OSError as exc:
+                logger.warning("Could not write metrics snapshot: %s", exc)
+            await asyncio.sleep(self.interval)
+
+    def write(self, live: bool) -> None:
+        families = registry.collect()
+        if not live:
+            families = [family for family in families if family.kind != "gauge"]
+        snapshot = {"updated": time.time(), "families": [family.to_json() for family in families]}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path)
+
+    def _others(self) -> List[List[Family]]:
+        snapshots = []
+        stale = time.time() - STALE_FLUSHES * self.interval
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            if path == self.path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced, or removed
+            families = [Family.from_json(data) for data in snapshot["families"]]
+            if snapshot["updated"] < stale:
+                families = [family for family in families if family.kind != "gauge"]
+            snapshots.append(families)
+        return snapshots
+
+    def collect(self) -> List[Family]:
+        """This worker's live samples, summed with the other workers'."""
+        families = registry.collect()
+        if not self.directory:
+            return families
+        return merge([families, *self._others()])
+
+
+publisher = Publisher(settings.METRICS_DIR, settings.METRICS_FLUSH_SECONDS)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(families: List[Family]) -> str:
+    """Prometheus text exposition format 0.0.4."""
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.kind}")
+        lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in family.samples]
+    return "\n".join(lines) + "\n"
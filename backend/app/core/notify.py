@@ -0,0 +1,107 @@
+"""Postgres LISTEN/NOTIFY for in-process caches.
+
+Each worker process holds one dedicated asyncpg connection (outside the
+engine pools) that listens on the subscribed channels.  Handlers run on the
+event loop and must not block.  Reset hooks run whenever the connection is
+established or lost, because notifications sent while disconnected are gone;
+caches use ``listener.connected`` to decide whether they can trust themselves.
+
+The connection goes to ``DB_LISTEN_URL``, or ``DATABASE_URL`` without it.
+Behind PgBouncer (``DB_PGBOUNCER``) only the former will do: LISTEN through
+a transaction-mode pooler succeeds but never delivers anything, so without
+it the listener does not start and ``connected`` stays False.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5
+KEEPALIVE_SECONDS = 30
+
+
+def listen_dsn() -> Optional[str]:
+    """Where to LISTEN, or None where notifications would not arrive."""
+    url = settings.DB_LISTEN_URL or (None if settings.DB_PGBOUNCER else settings.DATABASE_URL)
+    if url is None:
+        return None
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class Listener:
+    def __init__(self, dsn: Optional[str]):
+        self.dsn = dsn
+        self.connected = False
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._reset_hooks: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        """Calls ``handler(payload)`` for every notification on ``channel``."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_reset(self, hook: Callable[[], None]) -> None:
+        self._reset_hooks.append(hook)
+
+    def start(self) -> None:
+        if self.dsn is None:
+            logger.warning("DB_PGBOUNCER is set without DB_LISTEN_URL; in-process caches are off")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _dispatch(self, connection, pid, channel: str, payload: str) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("Notification handler for %s failed", channel)
+
+    def _set_connected(self, connected: bool) -> None:
+        self.connected = connected
+        for hook in self._reset_hooks:
+            hook()
+
+    def _terminated(self, connection) -> None:
+        if self.connected:
+            self._set_connected(False)
+
+    async def _run(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                for channel in self._handlers:
+                    await conn.add_listener(channel, self._dispatch)
+                conn.add_termination_listener(self._terminated)
+                self._set_connected(True)
+                while not conn.is_closed():
+                    await asyncio.sleep(KEEPALIVE_SECONDS)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("LISTEN connection lost: %s", exc)
+            finally:
+                self._terminated(conn)
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(RETRY_SECONDS)
+
+
+listener = Listener(listen_dsn())
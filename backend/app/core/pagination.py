@@ -0,0 +1,85 @@
+"""Keyset (cursor) pagination for collection endpoints.
+
+A cursor encodes the sort-key values of the last row on a page; the next page
+is fetched with a row comparison on those keys, so it costs the same index
+range scan however deep the client pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+
+
+class PageParams:
+    """Query parameters shared by paginated endpoints."""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+        limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def _decode_value(key, value: Any) -> Any:
+    python_type = key.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(keys: Sequence, row) -> str:
+    values = [_encode_value(getattr(row, key.key)) for key in keys]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(keys: Sequence, cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [_decode_value(key, value) for key, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(
+    db: AsyncSession, stmt, keys: Sequence, page: PageParams, descending: bool = False
+) -> Tuple[list, Optional[str]]:
+    """Applies keyset ordering to the ``select()`` ``stmt`` and returns ``(items, next_cursor)``.
+
+    ``keys`` must be mapped attributes that together are unique, e.g.
+    ``(Document.created_at, Document.id)``.
+    """
+    if page.cursor is not None:
+        values = decode_cursor(keys, page.cursor)
+        after = tuple_(*[literal(value, key.type) for key, value in zip(keys, values)])
+        if descending:
+            stmt = stmt.where(tuple_(*keys) < after)
+        else:
+            stmt = stmt.where(tuple_(*keys) > after)
+    order = [key.desc() if descending else key.asc() for key in keys]
+    result = await db.execute(stmt.order_by(*order).limit(page.limit + 1))
+    items = list(result.scalars().all())
+
+    next_cursor = None
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        next_cursor = encode_cursor(keys, items[-1])
+    return items, next_cursor
@@ -0,0 +1,119 @@
+"""bcrypt on a dedicated process pool.
+
+Hashes run in ``BCRYPT_WORKERS`` spawned processes at lowered CPU priority,
+so a burst of sign-ins queues behind them instead of taking the event loop
+and the request threadpool with it.  At most ``BCRYPT_MAX_QUEUE`` calls may
+wait for a worker; beyond that callers get 503 with ``Retry-After`` rather
+than an ever-growing backlog of requests that will time out anyway.
+
+A worker that dies (OOM kill, segfault) breaks the whole pool; the next call
+to notice replaces it and retries once.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from ..config import settings
+from .security import get_password_hash, hash_rounds, verify_password
+
+
+def _lower_priority() -> None:
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_queue: int, rounds: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.in_flight = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds_total = 0.0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def queued(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # fork would copy the event loop, engine pools and LISTEN socket
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+            )
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # Calls failing on the same broken pool replace it only once.
+        if self._executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        # in_flight is only touched from the event loop, so needs no lock.
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many sign-ins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        t0 = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.seconds_total += time.perf_counter() - t0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_rounds(hashed_password) != self.rounds
+
+    def snapshot(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "seconds_total": self.seconds_total,
+        }
+
+
+password_hasher = PasswordHasher(
+    settings.BCRYPT_WORKERS or max((os.cpu_count() or 2) // 2, 1),
+    settings.BCRYPT_MAX_QUEUE,
+    settings.BCRYPT_ROUNDS,
+)
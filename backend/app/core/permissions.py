@@ -0,0 +1,101 @@
+"""Repository membership lookups for access checks.
+
+``member_role`` answers "what role does this user hold in this repo" for
+``check_repo_access``.  Answers are memoized on the request's session (so a
+handler that checks several times queries once) and in a per-worker
+TTL/LRU shared across requests.
+
+Every write that can change an answer calls ``invalidate_roles`` inside its
+transaction: it evicts locally right away and queues a
+``NOTIFY repo_access_changed``, which Postgres delivers to every worker,
+this one included, when the transaction commits.  As with principals, the
+shared cache is only consulted while the LISTEN connection is up.
+"""
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.repository import MemberRole, RepositoryMember
+from .cache import TTLCache
+from .notify import listener
+from .profiling import span
+
+REPO_CHANNEL = "repo_access_changed"
+
+_MISSING = object()
+
+
+class PermissionCache:
+    def __init__(self, maxsize: int, ttl: float):
+        # (repo id, user id) -> MemberRole, or None for non-members
+        self._roles = TTLCache(maxsize, ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return listener.connected
+
+    @property
+    def generation(self) -> int:
+        return self._roles.generation
+
+    def get(self, key):
+        return self._roles.get(key, _MISSING) if self.enabled else _MISSING
+
+    def put(self, key, role: Optional[MemberRole], generation: int) -> None:
+        if self.enabled:
+            self._roles.put(key, role, generation=generation)
+
+    def evict(self, payload: str) -> None:
+        """Handles ``<repo id>`` (every user) or ``<repo id>:<user id>``."""
+        repo_id, _, user_id = payload.partition(":")
+        if user_id:
+            self._roles.pop((repo_id, user_id))
+        else:
+            self._roles.pop_where(lambda key: key[0] == repo_id)
+
+    def clear(self) -> None:
+        self._roles.clear()
+
+
+permission_cache = PermissionCache(settings.PERMISSION_CACHE_SIZE, settings.PERMISSION_CACHE_TTL)
+listener.subscribe(REPO_CHANNEL, permission_cache.evict)
+listener.on_reset(permission_cache.clear)
+
+
+def _request_memo(db: AsyncSession) -> dict:
+    return db.info.setdefault("repo_roles", {})
+
+
+async def member_role(db: AsyncSession, repo_id: UUID, user_id: UUID) -> Optional[MemberRole]:
+    key = (str(repo_id), str(user_id))
+    memo = _request_memo(db)
+    if key in memo:
+        return memo[key]
+    with span("perm"):
+        role = permission_cache.get(key)
+        if role is _MISSING:
+            generation = permission_cache.generation
+            role = await db.scalar(select(RepositoryMember.role).where(
+                RepositoryMember.repo_id == repo_id,
+                RepositoryMember.user_id == user_id,
+            ))
+            permission_cache.put(key, role, generation)
+    memo[key] = role
+    return role
+
+
+async def invalidate_roles(db: AsyncSession, repo_id: UUID, user_id: Optional[UUID] = None) -> None:
+    """Forget cached roles in ``repo_id`` (only ``user_id``'s, if given) everywhere.
+
+    Call before committing the change; the broadcast is sent on commit.
+    """
+    payload = f"{repo_id}:{user_id}" if user_id is not None else str(repo_id)
+    memo = _request_memo(db)
+    for key in list(memo):
+        if key[0] == str(repo_id) and (user_id is None or key[1] == str(user_id)):
+            del memo[key]
+    permission_cache.evict(payload)
+    await db.execute(select(func.pg_notify(REPO_CHANNEL, payload)))
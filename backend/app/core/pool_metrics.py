@@ -0,0 +1,89 @@
+"""Connection pool instrumentation.
+
+``instrumented(QueuePool, stats)`` returns a pool class that times every
+checkout (including the wait for a free connection) and counts overflow
+connections and checkout timeouts into ``stats``.  ``snapshot()`` adds the
+live pool gauges so callers get one dict per engine.
+"""
+import threading
+import time
+from typing import Dict, Type
+
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool
+
+# Upper bounds, in seconds, of the checkout wait histogram.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait: float, overflowed: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.overflow_events += overflowed
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            self.wait_buckets[_bucket(wait)] += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool: Pool) -> Dict:
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_buckets": dict(zip([str(b) for b in WAIT_BUCKETS] + ["+Inf"], self.wait_buckets)),
+            }
+        # NullPool (PgBouncer mode) keeps no connections and has no gauges.
+        if hasattr(pool, "checkedout"):
+            stats.update(
+                size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+def _bucket(wait: float) -> int:
+    for index, bound in enumerate(WAIT_BUCKETS):
+        if wait <= bound:
+            return index
+    return len(WAIT_BUCKETS)
+
+
+def instrumented(pool_class: Type[Pool], stats: PoolStats) -> Type[Pool]:
+    """Subclass of ``pool_class`` reporting into ``stats``.
+
+    ``stats`` is a class attribute so it survives ``Pool.recreate()`` on
+    ``engine.dispose()``.
+    """
+
+    def _do_get(self):
+        overflow_before = self.overflow() if hasattr(self, "overflow") else 0
+        t0 = time.perf_counter()
+        try:
+            conn = pool_class._do_get(self)
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        overflow_after = self.overflow() if hasattr(self, "overflow") else 0
+        self.stats.record_checkout(time.perf_counter() - t0, overflow_after > max(overflow_before, 0))
+        return conn
+
+    return type(f"Instrumented{pool_class.__name__}", (pool_class,), {"stats": stats, "_do_get": _do_get})
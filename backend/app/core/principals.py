@@ -0,0 +1,79 @@
+"""Cached identity resolution for authenticated requests.
+
+``get_current_user`` resolves a bearer token to a ``Principal`` (id plus the
+flags permission checks read) instead of a ``User`` row.  Decoded tokens and
+principals are kept in bounded LRUs, so a warm request needs no JWT decode
+and no query.
+
+A trigger on ``users`` (migration 004) sends ``NOTIFY user_changed`` when
+``is_active`` or ``is_admin`` changes or a user is deleted, and every worker
+evicts that user on receipt.  The cache is only consulted while this
+worker's LISTEN connection is up, and entries also expire after
+``AUTH_CACHE_TTL`` seconds.
+"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+from ..config import settings
+from ..models.user import User
+from .cache import TTLCache
+from .notify import listener
+
+USER_CHANNEL = "user_changed"
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: UUID
+    is_active: bool
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, is_active=user.is_active, is_admin=user.is_admin)
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        # access token -> user id, held no longer than the token's own expiry
+        self._tokens = TTLCache(maxsize, ttl)
+        # user id -> Principal
+        self._principals = TTLCache(maxsize, ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return listener.connected
+
+    def user_id_for(self, token: str) -> Optional[str]:
+        return self._tokens.get(token) if self.enabled else None
+
+    def remember_token(self, token: str, user_id: str, expires_at: float) -> None:
+        if self.enabled:
+            self._tokens.put(token, user_id, ttl=expires_at - time.time())
+
+    @property
+    def generation(self) -> int:
+        return self._principals.generation
+
+    def get(self, user_id: str) -> Optional[Principal]:
+        return self._principals.get(str(user_id)) if self.enabled else None
+
+    def put(self, user: User, generation: int) -> Principal:
+        principal = Principal.from_user(user)
+        if self.enabled:
+            self._principals.put(str(user.id), principal, generation=generation)
+        return principal
+
+    def evict(self, user_id: str) -> None:
+        self._principals.pop(str(user_id))
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._principals.clear()
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+listener.subscribe(USER_CHANNEL, principal_cache.evict)
+listener.on_reset(principal_cache.clear)
@@ -0,0 +1,276 @@
+"""Per-request timings: a ``Server-Timing`` header, a log line and slow-request stacks.
+
+``ProfilingMiddleware`` records for every HTTP request
+
+* ``total``: until the response starts (the header goes out with it); the
+  log line has the time until the body is complete;
+* ``db``: SQL statements and their time, from ``query_counter``;
+* ``auth``, ``perm``, ``serialize``: time inside ``span(name)`` blocks, i.e.
+  token decoding plus principal loading, repository role lookups, and
+  FastAPI validating and serializing the handler's return value;
+* ``threadpool-wait`` and ``threadpool``: how long work handed to
+  ``run_in_threadpool`` waited for a thread, and ran on it.
+
+Spans overlap; ``auth`` includes the query that loads the user.  Each request
+logs one JSON object at INFO on this module's logger.
+
+With ``slow_ms`` set, a sampler thread records the stack of whichever
+profiled request is running on the event loop (or on a threadpool thread for
+it) every ``PROFILE_INTERVAL_MS``.  Requests slower than ``slow_ms`` are
+written to ``directory`` in collapsed-stack format, one ``frame;frame count``
+line per distinct stack, as read by ``flamegraph.pl`` and speedscope.
+Samples show where a request used the CPU; its waits are in the timings.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+import fastapi.routing
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import settings
+from .query_counter import QueryCounter, count_queries
+
+logger = logging.getLogger(__name__)
+
+# Server-Timing order of the span metrics.
+SPANS = ("auth", "perm", "serialize", "threadpool-wait", "threadpool")
+MAX_STACK_DEPTH = 128
+
+
+class Profile:
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        # Collapsed stack -> samples; written by the sampler thread.
+        self.samples: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Adds the time spent in the block to the current request's ``name``."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - t0)
+
+
+_serialize_response = None
+
+
+def time_serialization() -> None:
+    """Wraps FastAPI's response validation and serialization in a ``serialize``
+    span; called by ``ProfilingMiddleware``, and only wraps once.
+
+    FastAPI has no hook around it, so this replaces the function its request
+    handlers look up at call time.  Without it there is no ``serialize`` span.
+    """
+    global _serialize_response
+    if _serialize_response is not None:
+        return
+    original = getattr(fastapi.routing, "serialize_response", None)
+    if original is None:
+        logger.warning("fastapi.routing.serialize_response is gone; not timing serialization")
+        return
+
+    async def timed(*args, **kwargs):
+        with span("serialize"):
+            return await original(*args, **kwargs)
+
+    _serialize_response = original
+    fastapi.routing.serialize_response = timed
+
+
+def _frame_name(code) -> str:
+    path = "/".join(code.co_filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Samples the stacks of attached requests from a daemon thread.
+
+    Tasks and threads are attached and detached on their own thread; the
+    sampler only reads the maps, and a sample racing a detach is harmless.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._tasks: Dict[asyncio.Task, Profile] = {}
+        self._threads: Dict[int, Profile] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def attach(self, profile: Profile) -> None:
+        """Samples the calling task for ``profile``, starting the thread if needed."""
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+            self._thread.start()
+        self._tasks[asyncio.current_task()] = profile
+
+    def detach(self) -> None:
+        self._tasks.pop(asyncio.current_task(), None)
+
+    def attach_thread(self, profile: Profile) -> None:
+        self._threads[threading.get_ident()] = profile
+
+    def detach_thread(self) -> None:
+        self._threads.pop(threading.get_ident(), None)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            profile = self._tasks.get(asyncio.current_task(self._loop))
+            if profile is not None and self._loop_thread in frames:
+                self._record(profile, frames[self._loop_thread])
+            for ident, profile in list(self._threads.items()):
+                if ident in frames:
+                    self._record(profile, frames[ident])
+
+    @staticmethod
+    def _record(profile: Profile, frame) -> None:
+        stack = _collapse(frame)
+        profile.samples[stack] = profile.samples.get(stack, 0) + 1
+
+
+sampler = Sampler(settings.PROFILE_INTERVAL_MS / 1000)
+
+
+async def run_in_threadpool(func, *args):
+    """``starlette.concurrency.run_in_threadpool``, timing the wait for a
+    thread and the run on it for the current request."""
+    profile = _current.get()
+    if profile is None:
+        return await _run_in_threadpool(func, *args)
+    submitted = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        profile.add("threadpool-wait", started - submitted)
+        sampler.attach_thread(profile)
+        try:
+            return func(*args)
+        finally:
+            sampler.detach_thread()
+            profile.add("threadpool", time.perf_counter() - started)
+
+    return await _run_in_threadpool(timed)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def server_timing(profile: Profile, queries: QueryCounter, total: float) -> str:
+    metrics = [f"total;dur={_ms(total)}", f'db;dur={_ms(queries.seconds)};desc="{queries.count} queries"']
+    metrics += [f"{name};dur={_ms(profile.spans[name])}" for name in SPANS if name in profile.spans]
+    return ", ".join(metrics)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, server_timing: bool = True, slow_ms: float = 0,
+                 directory: str = "profiles") -> None:
+        self.app = app
+        self.server_timing = server_timing
+        self.slow_seconds = slow_ms / 1000
+        self.directory = directory
+        time_serialization()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = Profile()
+        token = _current.set(profile)
+        if self.slow_seconds:
+            sampler.attach(profile)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(profile, queries, time.perf_counter() - t0))
+            await send(message)
+
+        try:
+            with count_queries() as queries:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - t0
+            if self.slow_seconds:
+                sampler.detach()
+            _current.reset(token)
+            self._report(scope, status, elapsed, profile, queries)
+
+    def _report(self, scope: Scope, status: int, elapsed: float, profile: Profile, queries: QueryCounter) -> None:
+        dump = None
+        if self.slow_seconds and elapsed >= self.slow_seconds and profile.samples:
+            dump = self._dump(scope, elapsed, dict(profile.samples))
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        record = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(scope.get("route"), "path", None),
+            "status": status,
+            "total_ms": _ms(elapsed),
+            "db_queries": queries.count,
+            "db_ms": _ms(queries.seconds),
+        }
+        record.update({f"{name}_ms": _ms(seconds) for name, seconds in profile.spans.items()})
+        if dump:
+            record["profile"] = dump
+        logger.info(json.dumps(record))
+
+    def _dump(self, scope: Scope, elapsed: float, samples: Dict[str, int]) -> str:
+        name = re.sub(r"[^\w.-]+", "_", f"{scope['method']} {scope['path']}").strip("_")[:100]
+        path = os.path.join(self.directory, f"{time.time_ns() // 1_000_000}-{os.getpid()}-{_ms(elapsed):.0f}ms-{name}.folded")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{stack} {count}\n")
+        logger.warning("Slow request %s %s took %.0f ms; stacks in %s", scope["method"], scope["path"],
+                       elapsed * 1000, path)
+        return path
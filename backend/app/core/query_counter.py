@@ -0,0 +1,80 @@
+"""Counts and times SQL statements issued while handling a request.
+
+``QueryCountMiddleware`` reports the count in the ``X-Query-Count`` response
+header; ``count_queries()`` does the same for code outside a request, e.g.
+benchmarks and tests::
+
+    with count_queries() as counter:
+        client.get("/api/repos/ops/durs")
+    assert counter.count <= 6
+
+Counters nest: a statement is recorded by every enclosing ``count_queries()``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from ..database import async_engine, engine
+
+
+class QueryCounter:
+    def __init__(self, parent: Optional["QueryCounter"] = None):
+        self.parent = parent
+        self.count = 0
+        # From sending the statement until the driver returned, so includes
+        # the event loop's turns to other tasks on the async engine.
+        self.seconds = 0.0
+
+
+# Holds a mutable counter so increments made in copied contexts (the task or
+# threadpool that runs a handler) are visible to the middleware that owns it.
+_current: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    if counter is None:
+        return
+    if context is not None:
+        context._query_started = time.perf_counter()
+    while counter is not None:
+        counter.count += 1
+        counter = counter.parent
+
+
+def _time(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    started = getattr(context, "_query_started", None)
+    if counter is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    while counter is not None:
+        counter.seconds += elapsed
+        counter = counter.parent
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _count)
+    event.listen(_engine, "after_cursor_execute", _time)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    counter = QueryCounter(_current.get())
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+class QueryCountMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers["X-Query-Count"] = str(counter.count)
+        return response
@@ -0,0 +1,300 @@
+"""Shared cache of anonymous responses for public repositories.
+
+Anonymous ``list_repos``, ``get_repo``, ``list_docs`` and ``get_doc`` are
+served from stored JSON bodies keyed by route, parameters and the state
+version of what they show: ``repos`` for the repository list, ``repo:<slug>``
+for a repository and its documents.  Only successful responses are stored,
+and anonymous requests only succeed on public repositories.
+
+Writes that change what anonymous readers see call ``invalidate_responses``
+inside their transaction.  As with ``invalidate_roles`` it queues a
+``NOTIFY response_cache``, which every worker receives once the transaction
+commits and answers by bumping that scope's version.  Readers take the
+version before they query, so a body built from the state a write replaces
+is filed under the retired version and never served again; entries also
+expire after ``RESPONSE_CACHE_TTL``.  Until a worker has the notification
+(milliseconds), it may still serve the previous body.
+
+Backends:
+
+* ``LocalBackend`` (default): an LRU of ``RESPONSE_CACHE_SIZE`` bodies per
+  worker, with versions kept in process;
+* ``RedisBackend`` (``RESPONSE_CACHE_URL=redis://host:port/db``): bodies and
+  versions in any server speaking the Redis protocol, shared by all workers.
+  Every worker increments the version on notification; it only has to change.
+
+Concurrent misses on one key within a worker wait for the first one to build
+the body instead of all querying (request coalescing).  The cache is only
+used while this worker's LISTEN connection is up; each reconnect starts a
+new epoch, since notifications sent while disconnected are lost.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from .cache import TTLCache
+from .conditional import REVALIDATE, is_fresh, not_modified
+from .metrics import response_cache_lookups
+from .notify import listener
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = "response_cache"
+REPOS = "repos"
+KEY_PREFIX = "dochub:"
+REDIS_TIMEOUT = 1.0
+REDIS_MAX_IDLE = 16
+
+
+def repo_scope(slug: str) -> str:
+    return f"repo:{slug}"
+
+
+class BackendError(Exception):
+    pass
+
+
+class LocalBackend:
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl)
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+
+    async def version(self, scope: str) -> str:
+        return f"{self._epoch}.{self._versions.get(scope, 0)}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries.put(key, value, ttl)
+
+    def bump(self, scope: str) -> None:
+        self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def reset(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+
+
+def _encode_command(args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts += [f"${len(data)}\r\n".encode(), data, b"\r\n"]
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise BackendError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        if rest == b"-1":
+            return None
+        return (await reader.readexactly(int(rest) + 2))[:-2]
+    if kind == b"*":
+        if rest == b"-1":
+            return None
+        return [await _read_reply(reader) for _ in range(int(rest))]
+    raise BackendError(f"Unexpected reply {line!r}")
+
+
+class RedisBackend:
+    """Minimal Redis protocol client: a few commands over pooled connections."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        # Fire-and-forget increments, referenced until done.
+        self._pending: Set[asyncio.Task] = set()
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = (reader, writer)
+        if self.password:
+            await self._call(conn, "AUTH", self.password)
+        if self.db:
+            await self._call(conn, "SELECT", self.db)
+        return conn
+
+    @staticmethod
+    async def _call(conn, *args):
+        reader, writer = conn
+        writer.write(_encode_command(args))
+        await writer.drain()
+        return await _read_reply(reader)
+
+    async def execute(self, *args):
+        conn = None
+        try:
+            conn = self._idle.pop() if self._idle else await asyncio.wait_for(self._connect(), REDIS_TIMEOUT)
+            reply = await asyncio.wait_for(self._call(conn, *args), REDIS_TIMEOUT)
+        except BaseException as exc:
+            if conn is not None:
+                conn[1].close()
+            if isinstance(exc, (OSError, EOFError, asyncio.TimeoutError)):
+                raise BackendError(str(exc) or type(exc).__name__) from exc
+            raise
+        if len(self._idle) < REDIS_MAX_IDLE:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        return reply
+
+    async def version(self, scope: str) -> str:
+        epoch, version = await self.execute("MGET", f"{KEY_PREFIX}epoch", f"{KEY_PREFIX}v:{scope}")
+        return f"{int(epoch or 0)}.{int(version or 0)}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.execute("GET", f"{KEY_PREFIX}r:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute("SET", f"{KEY_PREFIX}r:{key}", value, "PX", int(ttl * 1000))
+
+    def _incr(self, key: str) -> None:
+        async def incr():
+            try:
+                await self.execute("INCR", key)
+            except BackendError as exc:
+                logger.warning("Could not bump response cache version %s: %s", key, exc)
+
+        task = asyncio.get_running_loop().create_task(incr())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def bump(self, scope: str) -> None:
+        self._incr(f"{KEY_PREFIX}v:{scope}")
+
+    def reset(self) -> None:
+        self._incr(f"{KEY_PREFIX}epoch")
+
+
+class _BuildAbandoned(Exception):
+    """The request building a body was cancelled; a waiter takes over."""
+
+
+_adapters: Dict[object, TypeAdapter] = {}
+
+
+def _render(model, value) -> bytes:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self._building: Dict[str, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and listener.connected
+
+    def evict(self, scope: str) -> None:
+        self.backend.bump(scope)
+
+    def clear(self) -> None:
+        self.backend.reset()
+
+    async def serve(self, request: Request, scope: str, key: str, model,
+                    build: Callable[[], Awaitable], etag: Optional[Callable[[object], str]] = None) -> Response:
+        """The JSON ``model`` of ``await build()``, from the cache if possible.
+
+        ``key`` names the route and every parameter the body depends on.
+        With ``etag``, the response carries ``ETag`` and revalidation gets 304.
+        """
+
+        async def build_entry() -> bytes:
+            value = await build()
+            tag = etag(value) if etag else ""
+            return tag.encode() + b"\n" + _render(model, value)
+
+        entry = None
+        if self.enabled:
+            try:
+                full_key = f"{scope}:{await self.backend.version(scope)}:{key}"
+            except BackendError as exc:
+                logger.warning("Response cache unavailable: %s", exc)
+            else:
+                entry = await self._get_or_build(full_key, build_entry)
+        if entry is None:
+            entry = await build_entry()
+        tag, _, body = entry.partition(b"\n")
+        if not tag:
+            return Response(body, media_type="application/json")
+        tag = tag.decode()
+        if is_fresh(request, tag):
+            return not_modified(tag, REVALIDATE)
+        return Response(body, media_type="application/json", headers={"ETag": tag, "Cache-Control": REVALIDATE})
+
+    async def _get_or_build(self, key: str, build_entry: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            entry = await self.backend.get(key)
+        except BackendError as exc:
+            logger.warning("Response cache unavailable: %s", exc)
+            entry = None
+        if entry is not None:
+            response_cache_lookups.inc("hit")
+            return entry
+        while key in self._building:
+            response_cache_lookups.inc("coalesced")
+            try:
+                return await asyncio.shield(self._building[key])
+            except _BuildAbandoned:
+                continue
+        response_cache_lookups.inc("miss")
+        future = self._building[key] = asyncio.get_running_loop().create_future()
+        try:
+            entry = await build_entry()
+        except BaseException as exc:
+            # Waiters asked for the same thing, so they get the same error; if
+            # this request was cancelled instead, one of them builds.
+            future.set_exception(exc if isinstance(exc, Exception) else _BuildAbandoned())
+            future.exception()  # retrieved, in case nobody waited
+            raise
+        else:
+            future.set_result(entry)
+        finally:
+            del self._building[key]
+        try:
+            await self.backend.set(key, entry, self.ttl)
+        except BackendError as exc:
+            logger.warning("Response cache unavailable: %s", exc)
+        return entry
+
+
+def _backend():
+    if settings.RESPONSE_CACHE_URL:
+        return RedisBackend(settings.RESPONSE_CACHE_URL)
+    return LocalBackend(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL)
+
+
+response_cache = ResponseCache(_backend(), settings.RESPONSE_CACHE_TTL)
+listener.subscribe(CACHE_CHANNEL, response_cache.evict)
+listener.on_reset(response_cache.clear)
+
+
+async def invalidate_responses(db: AsyncSession, *scopes: str) -> None:
+    """Retire cached responses for ``scopes`` everywhere once the current
+    transaction commits; call before committing the write."""
+    await db.execute(select(*(func.pg_notify(CACHE_CHANNEL, scope) for scope in scopes)))
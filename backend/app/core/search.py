@@ -0,0 +1,172 @@
+"""Full-text search index over documents, DURs and DUR comments.
+
+Each searchable object has one row in ``search_entries`` holding a weighted
+``tsvector`` (title as A, body as B) behind a GIN index.  Rows are upserted in
+the same transaction as the write that changed the object, so the index never
+needs a rescan.
+"""
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import cast, func, literal, literal_column, select, text
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.document import Document
+from ..models.dur import DUR, DURComment
+from ..models.repository import DocRepository
+from ..models.search import SearchEntry
+
+DOCUMENT = "document"
+DUR_KIND = "dur"
+COMMENT = "comment"
+
+# to_tsvector rejects inputs whose vector exceeds 1MB; index the head of huge bodies.
+MAX_INDEXED_CHARS = 200_000
+
+
+def _config():
+    return cast(literal(settings.SEARCH_CONFIG), REGCONFIG)
+
+
+def _weight(label: str):
+    # Inlined: setweight() takes a "char", which a bound VARCHAR does not match.
+    return literal_column(f"'{label}'")
+
+
+def _vector(title: Optional[str], body: Optional[str]):
+    body_vector = func.setweight(func.to_tsvector(_config(), (body or "")[:MAX_INDEXED_CHARS]), _weight("B"))
+    if title is None:
+        return body_vector
+    return func.setweight(func.to_tsvector(_config(), title), _weight("A")).op("||")(body_vector)
+
+
+async def _upsert(db: AsyncSession, kind: str, object_id: UUID, repo_id: UUID, document_id: UUID,
+            dur_id: Optional[UUID], title: str, tsv) -> None:
+    values = dict(
+        kind=kind,
+        object_id=object_id,
+        repo_id=repo_id,
+        document_id=document_id,
+        dur_id=dur_id,
+        title=title,
+        tsv=tsv,
+        updated_at=datetime.utcnow(),
+    )
+    stmt = insert(SearchEntry).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SearchEntry.kind, SearchEntry.object_id],
+        set_={k: stmt.excluded[k] for k in ("title", "tsv", "updated_at")},
+    )
+    await db.execute(stmt)
+
+
+async def index_document(db: AsyncSession, doc: Document) -> None:
+    await _upsert(db, DOCUMENT, doc.id, doc.repo_id, doc.id, None, doc.title,
+            _vector(doc.title, doc.current_content))
+
+
+async def index_dur(db: AsyncSession, dur: DUR) -> None:
+    await _upsert(db, DUR_KIND, dur.id, dur.repo_id, dur.document_id, dur.id, dur.title,
+            _vector(dur.title, dur.description))
+
+
+async def index_comment(db: AsyncSession, comment: DURComment, dur: DUR) -> None:
+    # Comments are matched on their own text only; the DUR title is for display.
+    await _upsert(db, COMMENT, comment.id, dur.repo_id, dur.document_id, dur.id, dur.title,
+            _vector(None, comment.content))
+
+
+async def index_documents(db: AsyncSession, document_ids: List[UUID]) -> None:
+    """Indexes a batch of documents in one statement, for bulk writes."""
+    await db.execute(text("""
+        INSERT INTO search_entries (kind, object_id, repo_id, document_id, dur_id, title, tsv, updated_at)
+        SELECT 'document', d.id, d.repo_id, d.id, NULL, d.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), d.title), 'A') ||
+               setweight(to_tsvector(CAST(:cfg AS regconfig), left(b.content, :max_chars)), 'B'),
+               now()
+        FROM documents d JOIN blobs b ON b.hash = d.content_hash
+        WHERE d.id = ANY(:ids)
+        ON CONFLICT (kind, object_id) DO UPDATE
+        SET title = excluded.title, tsv = excluded.tsv, updated_at = excluded.updated_at
+    """), {"cfg": settings.SEARCH_CONFIG, "max_chars": MAX_INDEXED_CHARS, "ids": document_ids})
+
+
+async def rebuild(db: AsyncSession) -> None:
+    """Re-indexes everything, e.g. after changing ``SEARCH_CONFIG``."""
+    await db.execute(text("""
+        INSERT INTO search_entries (kind, object_id, repo_id, document_id, dur_id, title, tsv, updated_at)
+        SELECT 'document', d.id, d.repo_id, d.id, NULL, d.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), d.title), 'A') ||
+               setweight(to_tsvector(CAST(:cfg AS regconfig), left(b.content, :max_chars)), 'B'),
+               now()
+        FROM documents d JOIN blobs b ON b.hash = d.content_hash
+        UNION ALL
+        SELECT 'dur', r.id, r.repo_id, r.document_id, r.id, r.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), r.title), 'A') ||
+               setweight(to_tsvector(CAST(:cfg AS regconfig), coalesce(r.description, '')), 'B'),
+               now()
+        FROM durs r
+        UNION ALL
+        SELECT 'comment', c.id, r.repo_id, r.document_id, r.id, r.title,
+               setweight(to_tsvector(CAST(:cfg AS regconfig), left(c.content, :max_chars)), 'B'),
+               now()
+        FROM dur_comments c JOIN durs r ON r.id = c.dur_id
+        ON CONFLICT (kind, object_id) DO UPDATE
+        SET title = excluded.title, tsv = excluded.tsv, updated_at = excluded.updated_at
+    """), {"cfg": settings.SEARCH_CONFIG, "max_chars": MAX_INDEXED_CHARS})
+
+
+async def search(db: AsyncSession, q: str, visible, kind: Optional[str] = None, repo_id: Optional[UUID] = None,
+           limit: int = 20, offset: int = 0) -> List:
+    """Ranked matches for ``q`` restricted to repositories matching ``visible``.
+
+    ``visible`` is a SQL clause over ``DocRepository``, as built by
+    ``routers.repositories.visible_repos_clause``.  Hits are ordered by
+    the cheap ``ts_rank`` first, and only the best ``SEARCH_MAX_CANDIDATES``
+    get the cover-density ranking and the joins, which bounds latency for
+    terms that match most of the corpus without dropping their best hits.
+    """
+    query = func.websearch_to_tsquery(_config(), q)
+    candidates = (
+        select(
+            SearchEntry.kind,
+            SearchEntry.object_id,
+            SearchEntry.document_id,
+            SearchEntry.dur_id,
+            SearchEntry.title,
+            SearchEntry.tsv,
+            DocRepository.slug.label("repo_slug"),
+        )
+        .join(DocRepository, DocRepository.id == SearchEntry.repo_id)
+        .where(SearchEntry.tsv.op("@@")(query))
+        .where(visible)
+    )
+    if kind is not None:
+        candidates = candidates.where(SearchEntry.kind == kind)
+    if repo_id is not None:
+        candidates = candidates.where(SearchEntry.repo_id == repo_id)
+    candidates = candidates.order_by(func.ts_rank(SearchEntry.tsv, query).desc()).limit(
+        settings.SEARCH_MAX_CANDIDATES
+    ).subquery()
+
+    rank = func.ts_rank_cd(candidates.c.tsv, query).label("rank")
+    stmt = (
+        select(
+            candidates.c.kind,
+            candidates.c.object_id,
+            candidates.c.title,
+            candidates.c.dur_id,
+            candidates.c.repo_slug,
+            Document.slug.label("document_slug"),
+            Document.title.label("document_title"),
+            rank,
+        )
+        .join(Document, Document.id == candidates.c.document_id)
+        .order_by(rank.desc(), candidates.c.object_id)
+        .limit(limit)
+        .offset(offset)
+    )
+    return (await db.execute(stmt)).all()
@@ -9,8 +9,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+def get_password_hash(password: str, rounds: int = 12) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def hash_rounds(hashed_password: str) -> int:
+    """Work factor of a ``$2b$<rounds>$...`` hash."""
+    return int(hashed_password.split("$")[2])
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -0,0 +1,113 @@
+"""URL slugs for repositories and documents.
+
+Taken slugs get a numeric suffix: ``notes``, ``notes-1``, ``notes-2``...
+``next_free`` finds the next one with a single query, which the
+``text_pattern_ops`` slug indexes answer with a range scan.
+``insert_with_slug`` serializes creates of the same base with a transaction
+advisory lock, so concurrent requests see each other's slugs; bulk writers
+take the same locks with ``lock_bases``.
+"""
+import re
+from typing import Dict, Iterable, Set
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, case, cast, func, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+MAX_LENGTH = 200
+# Room kept for "-<number>" when a base has to be shortened.
+SUFFIX_ROOM = 10
+INSERT_ATTEMPTS = 3
+UNIQUE_VIOLATION = "23505"
+
+
+def slugify(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r'[^\w\s-]', '', text)
+    text = re.sub(r'[\s_-]+', '-', text)
+    return text.strip('-')
+
+
+class SlugAllocator:
+    """Hands out slugs that are unique within ``taken``, in memory, for bulk
+    writes that already loaded every slug in scope.
+
+    Remembers the last suffix used per base, so a thousand documents titled
+    "Notes" cost a thousand set lookups rather than half a million.
+    """
+
+    def __init__(self, taken: Set[str]):
+        self.taken = taken
+        self._next_suffix: Dict[str, int] = {}
+
+    def allocate(self, base: str) -> str:
+        base = base[:MAX_LENGTH] or "document"
+        slug = base
+        counter = self._next_suffix.get(base, 1)
+        while slug in self.taken:
+            suffix = f"-{counter}"
+            slug = base[:MAX_LENGTH - len(suffix)] + suffix
+            counter += 1
+        self._next_suffix[base] = counter
+        self.taken.add(slug)
+        return slug
+
+
+def _like_prefix(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def next_free(db: AsyncSession, column, base: str, *criteria) -> str:
+    """``base`` if no row matching ``criteria`` uses it, else ``base-N`` for
+    one more than the highest ``N`` in use."""
+    max_length = column.type.length
+    stem = base[:max_length - SUFFIX_ROOM]
+    suffix = func.substr(column, len(stem) + 2)
+    taken, highest = (await db.execute(
+        select(
+            func.count(case((column == base, 1))),
+            func.max(case((suffix.op("~")("^[0-9]{1,9}$"), cast(suffix, Integer)))),
+        ).where(*criteria, (column == base) | column.like(_like_prefix(stem) + "-%", escape="\\"))
+    )).one()
+    if not taken:
+        return base
+    return f"{stem}-{(highest or 0) + 1}"
+
+
+def _lock_key(column, base: str) -> str:
+    return f"{column.table.name}:{base[:column.type.length - SUFFIX_ROOM]}"
+
+
+async def lock_bases(db: AsyncSession, column, bases: Iterable[str]) -> None:
+    """Takes ``insert_with_slug``'s lock on every base, until the caller commits.
+
+    Locks are taken in sorted order, so two bulk writers cannot deadlock.
+    """
+    keys = sorted({_lock_key(column, base) for base in bases})
+    await db.execute(text(
+        "SELECT pg_advisory_xact_lock(hashtextextended(key, 0)) FROM unnest(CAST(:keys AS text[])) AS key"
+    ), {"keys": keys})
+
+
+async def insert_with_slug(db: AsyncSession, obj, column, base: str, *criteria) -> None:
+    """Adds and flushes ``obj`` under ``next_free(base)``.
+
+    The lock is held until the caller commits.  A writer holding another
+    base's lock can still take the slug first (``notes-1`` requested as
+    such, against ``notes``); then the insert fails on the unique index
+    inside a savepoint and a slug is picked again.
+    """
+    key = _lock_key(column, base)
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtextextended(key, 0))))
+    for _ in range(INSERT_ATTEMPTS):
+        obj.slug = await next_free(db, column, base, *criteria)
+        try:
+            async with db.begin_nested():
+                db.add(obj)
+        except IntegrityError as exc:
+            if getattr(exc.orig, "pgcode", None) != UNIQUE_VIOLATION:
+                raise
+        else:
+            return
+    raise HTTPException(status_code=409, detail="Could not find a free slug, try again")
@@ -0,0 +1,202 @@
+"""Delta-compressed storage for DocumentVersion history.
+
+Every version row holds either a full ``snapshot`` of the document text or a
+forward ``delta`` against the version before it.  A snapshot is written every
+``VERSION_SNAPSHOT_INTERVAL`` versions, so rebuilding any version applies at
+most ``VERSION_SNAPSHOT_INTERVAL - 1`` deltas.  Payloads are zlib-compressed.
+
+A version whose text is already a blob (see core.blobs), e.g. a merged DUR or
+a copy of another document, is instead a snapshot without payload that
+references the blob, whatever its number.
+"""
+import json
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.document import Document, DocumentVersion
+from . import blobs
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def encode_delta(old: str, new: str) -> bytes:
+    """Encode ``new`` as line operations against ``old``.
+
+    Ops are a JSON list where a positive int copies that many lines from the
+    base, a negative int skips that many base lines and a string is inserted
+    verbatim.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: list = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append("".join(b[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"))
+
+
+def apply_delta(old: str, delta: bytes) -> str:
+    a = old.splitlines(keepends=True)
+    out: List[str] = []
+    pos = 0
+    for op in json.loads(zlib.decompress(delta)):
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(a[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return "".join(out)
+
+
+def encode_snapshot(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"))
+
+
+def decode_snapshot(payload: bytes) -> str:
+    return zlib.decompress(payload).decode("utf-8")
+
+
+def is_snapshot_slot(version_number: int) -> bool:
+    return (version_number - 1) % settings.VERSION_SNAPSHOT_INTERVAL == 0
+
+
+def encode_version(
+    version_number: int, content: str, previous: Optional[str], stored: bool = False
+) -> Tuple[str, Optional[bytes]]:
+    """Returns ``(storage, payload)`` for a new version row.  ``stored`` says
+    ``content`` is a blob already; the row then references it and has no payload."""
+    if stored:
+        return SNAPSHOT, None
+    snapshot = encode_snapshot(content)
+    if previous is None or is_snapshot_slot(version_number):
+        return SNAPSHOT, snapshot
+    delta = encode_delta(previous, content)
+    # A rewrite can produce a delta larger than the text itself.
+    if len(delta) >= len(snapshot):
+        return SNAPSHOT, snapshot
+    return DELTA, delta
+
+
+async def new_version(
+    db: AsyncSession,
+    document_id: UUID,
+    version_number: int,
+    content: str,
+    previous: Optional[str],
+    created_by: UUID,
+    commit_message: Optional[str] = None,
+) -> DocumentVersion:
+    """Builds a version row holding ``content``, storing its blob.
+
+    ``previous`` must be the content of ``version_number - 1`` (the document's
+    ``current_content`` before the write), or None for the first version.
+    The blob is stored either way, since it becomes the document's text.
+    """
+    content_hash = blobs.digest(content)
+    stored = content_hash in await blobs.store(db, {content_hash: content})
+    storage, payload = encode_version(version_number, content, previous, stored)
+    version = DocumentVersion(
+        document_id=document_id,
+        version_number=version_number,
+        storage=storage,
+        payload=payload,
+        blob_hash=content_hash if stored else None,
+        commit_message=commit_message,
+        created_by=created_by,
+    )
+    version.content = content
+    return version
+
+
+async def append_version(
+    db: AsyncSession, doc: Document, content: str, created_by: UUID, commit_message: Optional[str] = None
+) -> DocumentVersion:
+    """Makes ``content`` the document's text; returns the version row recording it.
+
+    The number comes from ``doc.head_version``, so the caller must have loaded
+    ``doc`` with ``FOR UPDATE`` and keep the lock until commit.  Two writers
+    that skip the lock collide on the unique ``(document_id, version_number)``.
+    """
+    version = await new_version(
+        db,
+        document_id=doc.id,
+        version_number=doc.head_version + 1,
+        content=content,
+        previous=doc.current_content if doc.head_version else None,
+        created_by=created_by,
+        commit_message=commit_message,
+    )
+    doc.content_hash = blobs.digest(content)
+    doc.current_content = content
+    doc.updated_at = datetime.utcnow()
+    doc.head_version = version.version_number
+    return version
+
+
+def rebuild(version, previous: Optional[str]) -> str:
+    """Text of ``version`` (a row or anything with ``version_number``,
+    ``storage``, ``payload`` and, when it references a blob, ``snapshot``) given the
+    text of the version before it."""
+    if version.storage == SNAPSHOT:
+        return version.snapshot if version.payload is None else decode_snapshot(version.payload)
+    if previous is None:
+        raise ValueError(f"Version {version.version_number} has no base snapshot")
+    return apply_delta(previous, version.payload)
+
+
+def hydrate(versions: Iterable[DocumentVersion]) -> None:
+    """Fills ``content`` on a contiguous run of versions, in any order.
+
+    The run must start at a snapshot, which holds for full histories and for
+    chains returned by ``load_chain``.
+    """
+    content = None
+    for version in sorted(versions, key=lambda v: v.version_number):
+        content = rebuild(version, content)
+        version.content = content
+
+
+async def load_chain(
+    db: AsyncSession, document_id: UUID, version_number: int, *options
+) -> List[DocumentVersion]:
+    """Rows from the nearest snapshot at or below ``version_number`` up to it."""
+    base = select(func.max(DocumentVersion.version_number)).where(
+        DocumentVersion.document_id == document_id,
+        DocumentVersion.storage == SNAPSHOT,
+        DocumentVersion.version_number <= version_number,
+    ).scalar_subquery()
+    result = await db.execute(select(DocumentVersion).options(*options).where(
+        DocumentVersion.document_id == document_id,
+        DocumentVersion.version_number >= base,
+        DocumentVersion.version_number <= version_number,
+    ).order_by(DocumentVersion.version_number))
+    return list(result.scalars().all())
+
+
+async def get_version(
+    db: AsyncSession, document_id: UUID, version_number: int, *options
+) -> Optional[DocumentVersion]:
+    """Loads a single version with its ``content`` rebuilt.
+
+    ``options`` are loader options applied to the chain query.
+    """
+    chain = await load_chain(db, document_id, version_number, *options)
+    if not chain or chain[-1].version_number != version_number:
+        return None
+    hydrate(chain)
+    return chain[-1]
@@ -1,12 +1,65 @@
+from uuid import uuid4
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from .config import settings
+from .core.pool_metrics import PoolStats, instrumented
 
-engine = create_engine(settings.DATABASE_URL)
+pool_stats = {"sync": PoolStats("sync"), "async": PoolStats("async")}
+
+
+def _pool_options(pool_class, stats: PoolStats) -> dict:
+    options = dict(
+        poolclass=instrumented(pool_class, stats),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if pool_class is not NullPool:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+engine = create_engine(settings.DATABASE_URL, **_pool_options(QueuePool, pool_stats["sync"]))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Same database through asyncpg; the API routers use this path.
+if settings.DB_PGBOUNCER:
+    # PgBouncer hands each transaction to any server connection, so statements
+    # prepared on one may not exist (or clash by name) on the next.
+    async_engine = create_async_engine(
+        make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+        connect_args={
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        },
+        **_pool_options(NullPool, pool_stats["async"]),
+    )
+else:
+    async_engine = create_async_engine(
+        make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+        **_pool_options(AsyncAdaptedQueuePool, pool_stats["async"]),
+    )
+# Objects stay loaded after commit so responses can be serialized without
+# lazy loads, which are not possible outside the async session.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_status() -> dict:
+    """Checkout counters and live gauges for both engine pools."""
+    return {
+        "sync": pool_stats["sync"].snapshot(engine.pool),
+        "async": pool_stats["async"].snapshot(async_engine.sync_engine.pool),
+    }
+
 
 def get_db():
     db = SessionLocal()
@@ -14,3 +67,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
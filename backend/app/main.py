@@ -1,17 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 import os
 
 from .config import settings
-from .routers import auth, users, repositories, documents, durs
+from .core.compression import CompressionMiddleware, PrecompressedStaticFiles, SPAIndex
+from .core.metrics import MetricsMiddleware, publisher
+from .core.notify import listener
+from .core.passwords import password_hasher
+from .core.profiling import ProfilingMiddleware, sampler
+from .core.query_counter import QueryCountMiddleware
+from .routers import auth, users, repositories, documents, durs, search, admin, metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener.start()
+    publisher.start()
+    yield
+    await publisher.stop()
+    await listener.stop()
+    password_hasher.shutdown()
+    sampler.stop()
+
 
 app = FastAPI(
     title="DocHub API",
     description="Version-controlled documentation for tech teams",
     version="1.0.0",
+    lifespan=lifespan,
+)
+
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+# Added before the BaseHTTPMiddleware below so that it runs in the same task
+# as the handlers, which the sampler needs.
+app.add_middleware(
+    ProfilingMiddleware,
+    server_timing=settings.ENVIRONMENT == "development" or settings.SERVER_TIMING_HEADER,
+    slow_ms=settings.PROFILE_SLOW_MS,
+    directory=settings.PROFILE_DIR,
 )
+app.add_middleware(MetricsMiddleware)
 
 # CORS (only in development)
 if settings.ENVIRONMENT == "development":
@@ -21,7 +50,10 @@ if settings.ENVIRONMENT == "development":
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Query-Count", "Server-Timing"],
     )
+if settings.ENVIRONMENT == "development" or settings.QUERY_COUNT_HEADER:
+    app.add_middleware(QueryCountMiddleware)
 
 # Include API routers
 app.include_router(auth.router, prefix="/api")
@@ -29,16 +61,19 @@ app.include_router(users.router, prefix="/api")
 app.include_router(repositories.router, prefix="/api")
 app.include_router(documents.router, prefix="/api")
 app.include_router(durs.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+app.include_router(metrics.router)
 
 # Serve React frontend static files (production)
 static_dir = os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "dist")
 if os.path.isdir(static_dir):
-    app.mount("/assets", StaticFiles(directory=os.path.join(static_dir, "assets")), name="assets")
+    app.mount("/assets", PrecompressedStaticFiles(directory=os.path.join(static_dir, "assets")), name="assets")
+    spa_index = SPAIndex(os.path.join(static_dir, "index.html"))
 
     @app.get("/{full_path:path}", include_in_schema=False)
     async def serve_spa(full_path: str, request: Request):
-        index_path = os.path.join(static_dir, "index.html")
-        return FileResponse(index_path)
+        return spa_index.response(request)
 else:
     @app.get("/", include_in_schema=False)
     async def root():
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, LargeBinary, Text, select
+from ..database import Base
+
+
+class Blob(Base):
+    """A text stored once however many rows hold it; see core.blobs."""
+
+    __tablename__ = "blobs"
+
+    # SHA-256 of the UTF-8 text.
+    hash = Column(LargeBinary, primary_key=True)
+    content = Column(Text, nullable=False)
+    # Rows referencing this text, kept by triggers; the blob goes at zero.
+    refcount = Column(Integer, nullable=False, default=0)
+
+
+def blob_content(hash_column):
+    """The text ``hash_column`` references, for a ``column_property``."""
+    return select(Blob.content).where(Blob.hash == hash_column).correlate_except(Blob).scalar_subquery()
@@ -1,22 +1,36 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Integer, LargeBinary, UniqueConstraint, text
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, query_expression, relationship
 from ..database import Base
+from .blob import blob_content
 
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # text_pattern_ops: prefix LIKE for slug allocation, see core.slugs.
+        Index("uq_documents_repo_slug", "repo_id", "slug", unique=True, postgresql_ops={"slug": "text_pattern_ops"}),
+        # Keyset order of GET /repos/{slug}/docs.
+        Index("ix_documents_repo_created", "repo_id", "created_at", "id"),
+        # Checked when a blob is dropped.
+        Index("ix_documents_content_hash", "content_hash"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
     title = Column(String(200), nullable=False)
-    slug = Column(String(200), nullable=False, index=True)
-    current_content = Column(Text, nullable=False, default="")
+    slug = Column(String(200), nullable=False)
+    content_hash = Column(LargeBinary, ForeignKey("blobs.hash"), nullable=False)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Number of the latest version; see core.version_store.append_version.
+    head_version = Column(Integer, nullable=False, default=0)
+
+    # Text of content_hash; written through core.version_store, which sets both.
+    current_content = column_property(blob_content(content_hash), expire_on_flush=False)
 
     # Relationships
     repository = relationship("DocRepository", back_populates="documents")
@@ -24,14 +38,27 @@ class Document(Base):
     versions = relationship("DocumentVersion", back_populates="document", cascade="all, delete-orphan", order_by="DocumentVersion.version_number")
     durs = relationship("DUR", back_populates="document")
 
+    # Populated only by list queries via with_expression(); see routers.documents.
+    content_size = query_expression()
+    excerpt = query_expression()
+
 
 class DocumentVersion(Base):
     __tablename__ = "document_versions"
+    __table_args__ = (
+        UniqueConstraint("document_id", "version_number", name="uq_document_versions_document_version"),
+        # Checked when a blob is dropped.
+        Index("ix_document_versions_blob_hash", "blob_hash", postgresql_where=text("blob_hash IS NOT NULL")),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False)
-    content = Column(Text, nullable=False)
     version_number = Column(Integer, nullable=False)
+    # "snapshot" (full text, in payload or blob_hash) or "delta" (against the
+    # previous version), see core.version_store
+    storage = Column(String(10), nullable=False)
+    payload = Column(LargeBinary, nullable=True)
+    blob_hash = Column(LargeBinary, ForeignKey("blobs.hash"), nullable=True)
     commit_message = Column(String(500), nullable=True)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -39,3 +66,9 @@ class DocumentVersion(Base):
     # Relationships
     document = relationship("Document", back_populates="versions")
     creator = relationship("User", back_populates="created_versions")
+
+    snapshot = column_property(blob_content(blob_hash))
+    stored_size = query_expression()
+
+    # Rebuilt text, filled in by core.version_store; not a column.
+    content = None
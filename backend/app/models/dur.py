@@ -1,10 +1,11 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum as SAEnum
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, LargeBinary, text, Enum as SAEnum
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, query_expression, relationship
 import enum
 from ..database import Base
+from .blob import blob_content
 
 
 class DURStatus(str, enum.Enum):
@@ -16,13 +17,21 @@ class DURStatus(str, enum.Enum):
 
 class DUR(Base):
     __tablename__ = "durs"
+    __table_args__ = (
+        # Keyset order of GET /repos/{slug}/durs; reviewed DURs pile up, so
+        # the open queue gets its own small index.
+        Index("ix_durs_repo_created", "repo_id", "created_at", "id"),
+        Index("ix_durs_repo_open_created", "repo_id", "created_at", "id", postgresql_where=text("status = 'open'")),
+        # Checked when a blob is dropped.
+        Index("ix_durs_proposed_hash", "proposed_hash"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), nullable=False)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=False, index=True)
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
-    proposed_content = Column(Text, nullable=False)
+    proposed_hash = Column(LargeBinary, ForeignKey("blobs.hash"), nullable=False)
     status = Column(SAEnum(DURStatus), nullable=False, default=DURStatus.open)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     reviewed_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
@@ -37,9 +46,16 @@ class DUR(Base):
     reviewer = relationship("User", back_populates="reviewed_durs", foreign_keys=[reviewed_by])
     comments = relationship("DURComment", back_populates="dur", cascade="all, delete-orphan", order_by="DURComment.created_at")
 
+    # Text of proposed_hash; set both when creating a DUR, see core.blobs.
+    proposed_content = column_property(blob_content(proposed_hash), expire_on_flush=False)
+    proposed_size = query_expression()
+
 
 class DURComment(Base):
     __tablename__ = "dur_comments"
+    __table_args__ = (
+        Index("ix_dur_comments_dur_created", "dur_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     dur_id = Column(UUID(as_uuid=True), ForeignKey("durs.id"), nullable=False)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Enum as SAEnum
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Index, Enum as SAEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import enum
@@ -15,10 +15,15 @@ class MemberRole(str, enum.Enum):
 
 class DocRepository(Base):
     __tablename__ = "repositories"
+    __table_args__ = (
+        # text_pattern_ops: prefix LIKE for slug allocation, see core.slugs.
+        Index("ix_repositories_slug", "slug", postgresql_ops={"slug": "text_pattern_ops"}),
+        Index("ix_repositories_created", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False)
-    slug = Column(String(100), unique=True, nullable=False, index=True)
+    slug = Column(String(100), unique=True, nullable=False)
     description = Column(String(500), nullable=True)
     is_public = Column(Boolean, default=True, nullable=False)
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -35,7 +40,7 @@ class RepositoryMember(Base):
     __tablename__ = "repository_members"
 
     repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id"), primary_key=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True, index=True)
     role = Column(SAEnum(MemberRole), nullable=False, default=MemberRole.viewer)
 
     # Relationships
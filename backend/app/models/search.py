@@ -0,0 +1,24 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
+from ..database import Base
+
+
+class SearchEntry(Base):
+    """One searchable object (document, DUR or DUR comment), maintained by core.search."""
+
+    __tablename__ = "search_entries"
+    __table_args__ = (
+        Index("ix_search_entries_tsv", "tsv", postgresql_using="gin"),
+        # Document entries have no DUR; only DUR deletes look this up.
+        Index("ix_search_entries_dur_id", "dur_id", postgresql_where=text("dur_id IS NOT NULL")),
+    )
+
+    kind = Column(String(20), primary_key=True)
+    object_id = Column(UUID(as_uuid=True), primary_key=True)
+    repo_id = Column(UUID(as_uuid=True), ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False, index=True)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    dur_id = Column(UUID(as_uuid=True), ForeignKey("durs.id", ondelete="CASCADE"), nullable=True)
+    title = Column(String(200), nullable=False)
+    tsv = Column(TSVECTOR, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from ..database import pool_status
+from ..core.principals import Principal
+from ..core.deps import get_current_admin_user
+from ..core.passwords import password_hasher
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/db-pool")
+async def get_db_pool(current_user: Principal = Depends(get_current_admin_user)):
+    """Connection pool usage for the sync and async engines of this worker."""
+    return pool_status()
+
+
+@router.get("/password-hashing")
+async def get_password_hashing(current_user: Principal = Depends(get_current_admin_user)):
+    """bcrypt pool queue depth and throughput for this worker."""
+    return password_hasher.snapshot()
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..models.user import User
+from ..core.principals import Principal
 from ..schemas.user import UserCreate, UserOut, Token, TokenRefresh, LoginRequest
-from ..core.security import (
-    verify_password, get_password_hash, create_access_token, create_refresh_token, decode_token
-)
+from ..core.security import create_access_token, create_refresh_token, decode_token
+from ..core.passwords import password_hasher
 from ..core.deps import get_current_user
 from datetime import timedelta
 from ..config import settings
@@ -14,31 +15,43 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=UserOut, status_code=201)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check username/email uniqueness
-    if db.query(User).filter(User.username == user_data.username).first():
+    if await db.scalar(select(User).where(User.username == user_data.username)):
         raise HTTPException(status_code=400, detail="Username already taken")
-    if db.query(User).filter(User.email == user_data.email).first():
+    if await db.scalar(select(User).where(User.email == user_data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
+    # Release the connection while bcrypt runs.
+    await db.commit()
 
     user = User(
         username=user_data.username,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await password_hasher.hash(user_data.password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
 @router.post("/login", response_model=Token)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == login_data.username).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == login_data.username))
+    # Release the connection while bcrypt runs.
+    await db.commit()
+    if not user or not await password_hasher.verify(login_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Account is inactive")
+    if password_hasher.needs_rehash(user.hashed_password):
+        # BCRYPT_ROUNDS changed since this hash was made. Best effort: the
+        # next login retries if the pool is saturated now.
+        try:
+            user.hashed_password = await password_hasher.hash(login_data.password)
+            await db.commit()
+        except HTTPException:
+            pass
 
     access_token = create_access_token(data={"sub": str(user.id)})
     refresh_token = create_refresh_token(data={"sub": str(user.id)})
@@ -46,13 +59,13 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/refresh", response_model=Token)
-def refresh(token_data: TokenRefresh, db: Session = Depends(get_db)):
+async def refresh(token_data: TokenRefresh, db: AsyncSession = Depends(get_async_db)):
     payload = decode_token(token_data.refresh_token)
     if payload is None or payload.get("type") != "refresh":
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
     user_id = payload.get("sub")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="User not found or inactive")
 
@@ -62,5 +75,8 @@ def refresh(token_data: TokenRefresh, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=UserOut)
-def get_me(current_user: User = Depends(get_current_user)):
-    return current_user
+async def get_me(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.scalar(select(User).where(User.id == current_user.id))
@@ -1,187 +1,341 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from uuid import UUID
-import re
-from datetime import datetime
-from ..database import get_db
-from ..models.user import User
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, joinedload, with_expression
+from typing import Literal, Optional
+from uuid import UUID, uuid4
+from ..database import get_async_db
+from ..core.principals import Principal
 from ..models.repository import DocRepository, RepositoryMember, MemberRole
 from ..models.document import Document, DocumentVersion
 from ..schemas.document import (
-    DocumentCreate, DocumentUpdate, DocumentOut, DocumentWithCreator,
-    DocumentVersionOut
+    DocumentCreate, DocumentUpdate, DocumentOut, DocumentWithCreator, DocumentSummary,
+    DocumentVersionOut, DocumentVersionSummary, ImportResult, MarkdownPreview, RenderedMarkdown
 )
+from ..schemas.page import Page
 from ..core.deps import get_current_user, get_optional_user
+from ..core.pagination import PageParams, paginate
+from ..core import blobs, version_store
+from ..core.events import publish_event
+from ..core.conditional import (
+    IMMUTABLE, REVALIDATE, check_if_match, is_conditional, is_fresh, make_etag, not_modified, set_validators
+)
+from ..core import search as search_index
+from ..core import importer
+from ..core import markdown
+from ..core.metrics import versions_written
+from ..core.response_cache import invalidate_responses, repo_scope, response_cache
+from ..core.slugs import insert_with_slug, slugify
 from .repositories import get_repo_or_404, check_repo_access, require_repo_role
 
 router = APIRouter(prefix="/repos", tags=["documents"])
 
+EXCERPT_CHARS = 200
 
-def slugify(text: str) -> str:
-    text = text.lower()
-    text = re.sub(r'[^\w\s-]', '', text)
-    text = re.sub(r'[\s_-]+', '-', text)
-    return text.strip('-')
+Format = Literal["markdown", "html"]
+FORMAT_QUERY = Query("markdown", description="html adds the body as sanitized HTML and its table of contents")
 
 
-def get_doc_or_404(repo_id: UUID, doc_slug: str, db: Session) -> Document:
-    doc = db.query(Document).filter(
+async def get_doc_or_404(repo_id: UUID, doc_slug: str, db: AsyncSession, *options, lock: bool = False) -> Document:
+    """``lock`` takes the row lock that writes need before ``append_version``."""
+    stmt = select(Document).options(*options).where(
         Document.repo_id == repo_id,
         Document.slug == doc_slug,
-    ).first()
+    )
+    if lock:
+        stmt = stmt.with_for_update()
+    doc = await db.scalar(stmt)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     return doc
 
 
-@router.get("/{slug}/docs", response_model=List[DocumentWithCreator])
-def list_docs(
+def representation_etag(format: Format, *parts) -> str:
+    """ETag of a document or version view; the Markdown one is also what If-Match compares."""
+    if format == "html":
+        parts += ("html", markdown.RENDERER_VERSION)
+    return make_etag(*parts)
+
+
+async def with_html(model, obj, text: str):
+    """``obj`` as ``model`` with ``html`` and ``toc`` rendered from ``text``."""
+    out = model.model_validate(obj)
+    page = await markdown.rendered(text)
+    out.html, out.toc = page.html, page.toc
+    return out
+
+
+@router.get("/{slug}/docs", response_model=Page[DocumentSummary])
+async def list_docs(
     slug: str,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    excerpt: bool = Query(False, description=f"Include the first {EXCERPT_CHARS} characters of each body"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    return db.query(Document).filter(Document.repo_id == repo.id).all()
+    async def build():
+        repo = await get_repo_or_404(slug, db)
+        await check_repo_access(repo, current_user, db)
+        # octet_length reads the stored size without detoasting the body.
+        options = [
+            joinedload(Document.creator),
+            defer(Document.current_content),
+            with_expression(Document.content_size, func.octet_length(Document.current_content)),
+        ]
+        if excerpt:
+            options.append(with_expression(Document.excerpt, func.left(Document.current_content, EXCERPT_CHARS)))
+        stmt = select(Document).options(*options).where(Document.repo_id == repo.id)
+        items, next_cursor = await paginate(db, stmt, (Document.created_at, Document.id), page)
+        return {"items": items, "next_cursor": next_cursor}
+
+    if current_user is None:
+        key = f"list_docs:{excerpt}:{page.cursor}:{page.limit}"
+        return await response_cache.serve(request, repo_scope(slug), key, Page[DocumentSummary], build)
+    return await build()
 
 
 @router.post("/{slug}/docs", response_model=DocumentOut, status_code=201)
-def create_doc(
+async def create_doc(
     slug: str,
     data: DocumentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.editor)
-
-    doc_slug = data.slug or slugify(data.title)
-    base_slug = doc_slug
-    counter = 1
-    while db.query(Document).filter(Document.repo_id == repo.id, Document.slug == doc_slug).first():
-        doc_slug = f"{base_slug}-{counter}"
-        counter += 1
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.editor)
 
+    # The version goes first: it stores the blob, and tells apart a text
+    # that was already stored, e.g. a copied document.
+    doc_id = uuid4()
+    version = await version_store.new_version(
+        db,
+        document_id=doc_id,
+        version_number=1,
+        content=data.current_content,
+        previous=None,
+        created_by=current_user.id,
+        commit_message="Initial version",
+    )
     doc = Document(
+        id=doc_id,
         repo_id=repo.id,
         title=data.title,
-        slug=doc_slug,
+        content_hash=blobs.digest(data.current_content),
         current_content=data.current_content,
+        head_version=1,
         created_by=current_user.id,
     )
-    db.add(doc)
-    db.flush()
-
-    # Create initial version
-    version = DocumentVersion(
-        document_id=doc.id,
-        content=data.current_content,
-        version_number=1,
-        commit_message="Initial version",
-        created_by=current_user.id,
-    )
+    await insert_with_slug(db, doc, Document.slug, data.slug or slugify(data.title), Document.repo_id == repo.id)
     db.add(version)
-    db.commit()
-    db.refresh(doc)
+    await search_index.index_document(db, doc)
+    if repo.is_public:
+        await invalidate_responses(db, repo_scope(repo.slug))
+    await db.commit()
+    versions_written.inc("create")
+    await db.refresh(doc)
     return doc
 
 
+@router.post("/{slug}/import", response_model=ImportResult, status_code=201)
+async def import_docs(
+    slug: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Creates documents, with optional history, from an NDJSON body or a
+    tar archive in the export layout; see ``core.importer``."""
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.editor)
+    read = importer.reader_for(request.headers.get("content-type", ""))
+    # Don't hold a pool connection while the upload arrives.
+    await db.commit()
+    try:
+        with await importer.spool(request) as upload:
+            return await importer.import_documents(db, repo.id, current_user.id, upload, read)
+    finally:
+        # Batches commit one by one, and those before a failure stay.
+        if repo.is_public:
+            await db.rollback()
+            await invalidate_responses(db, repo_scope(repo.slug))
+            await db.commit()
+
+
 @router.get("/{slug}/docs/{doc_slug}", response_model=DocumentWithCreator)
-def get_doc(
+async def get_doc(
     slug: str,
     doc_slug: str,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    response: Response,
+    format: Format = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    return get_doc_or_404(repo.id, doc_slug, db)
+    if current_user is None:
+        async def build():
+            repo = await get_repo_or_404(slug, db)
+            await check_repo_access(repo, None, db)
+            doc = await get_doc_or_404(repo.id, doc_slug, db, joinedload(Document.creator))
+            if format == "html":
+                return await with_html(DocumentWithCreator, doc, doc.current_content)
+            return doc
+
+        return await response_cache.serve(
+            request, repo_scope(slug), f"get_doc:{doc_slug}:{format}", DocumentWithCreator, build,
+            etag=lambda doc: representation_etag(format, doc.id, doc.updated_at),
+        )
+
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    # A revalidating client most likely has the body already.
+    conditional = is_conditional(request)
+    options = [joinedload(Document.creator)]
+    if conditional:
+        options.append(defer(Document.current_content))
+    doc = await get_doc_or_404(repo.id, doc_slug, db, *options)
+    etag = representation_etag(format, doc.id, doc.updated_at)
+    if is_fresh(request, etag):
+        return not_modified(etag, REVALIDATE)
+    if conditional:
+        await db.refresh(doc, ["current_content"])
+    set_validators(response, etag, REVALIDATE)
+    if format == "html":
+        return await with_html(DocumentWithCreator, doc, doc.current_content)
+    return doc
 
 
 @router.put("/{slug}/docs/{doc_slug}", response_model=DocumentOut)
-def update_doc(
+async def update_doc(
     slug: str,
     doc_slug: str,
     data: DocumentUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.editor)
-    doc = get_doc_or_404(repo.id, doc_slug, db)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.editor)
+    doc = await get_doc_or_404(repo.id, doc_slug, db, lock=True)
+    # Checked on the locked row, so no other write can land in between.
+    check_if_match(request, make_etag(doc.id, doc.updated_at))
+    if data.base_version is not None and data.base_version != doc.head_version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Document is at version {doc.head_version}, not {data.base_version}",
+        )
 
     if data.title is not None:
         doc.title = data.title
 
     if data.current_content is not None:
-        doc.current_content = data.current_content
-        doc.updated_at = datetime.utcnow()
-
-        # Get latest version number
-        latest = db.query(DocumentVersion).filter(
-            DocumentVersion.document_id == doc.id
-        ).order_by(DocumentVersion.version_number.desc()).first()
-        next_version = (latest.version_number + 1) if latest else 1
-
-        version = DocumentVersion(
-            document_id=doc.id,
-            content=data.current_content,
-            version_number=next_version,
-            commit_message=data.commit_message or f"Update version {next_version}",
+        db.add(await version_store.append_version(
+            db,
+            doc,
+            data.current_content,
             created_by=current_user.id,
-        )
-        db.add(version)
+            commit_message=data.commit_message or f"Update version {doc.head_version + 1}",
+        ))
 
-    db.commit()
-    db.refresh(doc)
+    if data.title is not None or data.current_content is not None:
+        await search_index.index_document(db, doc)
+        if repo.is_public:
+            await invalidate_responses(db, repo_scope(repo.slug))
+        await publish_event(db, repo.id, "document", id=doc.id, slug=doc.slug, head_version=doc.head_version)
+    await db.commit()
+    if data.current_content is not None:
+        versions_written.inc("edit")
+    await db.refresh(doc)
     return doc
 
 
 @router.delete("/{slug}/docs/{doc_slug}", status_code=204)
-def delete_doc(
+async def delete_doc(
     slug: str,
     doc_slug: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.admin)
-    doc = get_doc_or_404(repo.id, doc_slug, db)
-    db.delete(doc)
-    db.commit()
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.admin)
+    doc = await get_doc_or_404(repo.id, doc_slug, db)
+    if repo.is_public:
+        await invalidate_responses(db, repo_scope(repo.slug))
+    await db.delete(doc)
+    await db.commit()
 
 
-@router.get("/{slug}/docs/{doc_slug}/versions", response_model=List[DocumentVersionOut])
-def get_versions(
+@router.get("/{slug}/docs/{doc_slug}/versions", response_model=Page[DocumentVersionSummary])
+async def get_versions(
     slug: str,
     doc_slug: str,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    doc = get_doc_or_404(repo.id, doc_slug, db)
-    return db.query(DocumentVersion).filter(
-        DocumentVersion.document_id == doc.id
-    ).order_by(DocumentVersion.version_number.desc()).all()
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    doc = await get_doc_or_404(repo.id, doc_slug, db, defer(Document.current_content))
+    stmt = select(DocumentVersion).options(
+        joinedload(DocumentVersion.creator),
+        defer(DocumentVersion.payload),
+        defer(DocumentVersion.snapshot),
+        # A snapshot's blob may be shared; this is its size, not its share.
+        with_expression(DocumentVersion.stored_size, func.coalesce(
+            func.octet_length(DocumentVersion.payload), func.pg_column_size(DocumentVersion.snapshot))),
+    ).where(DocumentVersion.document_id == doc.id)
+    # Version numbers are unique per document, so the unique index serves the keyset.
+    items, next_cursor = await paginate(db, stmt, (DocumentVersion.version_number,), page, descending=True)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/{slug}/docs/{doc_slug}/versions/{version_number}", response_model=DocumentVersionOut)
-def get_version(
+async def get_version(
     slug: str,
     doc_slug: str,
     version_number: int,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    response: Response,
+    format: Format = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    doc = get_doc_or_404(repo.id, doc_slug, db)
-    version = db.query(DocumentVersion).filter(
-        DocumentVersion.document_id == doc.id,
-        DocumentVersion.version_number == version_number,
-    ).first()
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    doc = await get_doc_or_404(repo.id, doc_slug, db, defer(Document.current_content))
+    # Versions are never rewritten, so the row id identifies the representation.
+    # Rendered HTML changes with the renderer (and its sanitizer), so it is revalidated.
+    cache_control = IMMUTABLE if format == "markdown" else REVALIDATE
+    if is_conditional(request):
+        version_id = await db.scalar(select(DocumentVersion.id).where(
+            DocumentVersion.document_id == doc.id,
+            DocumentVersion.version_number == version_number,
+        ))
+        if version_id is not None:
+            etag = representation_etag(format, version_id)
+            if is_fresh(request, etag):
+                return not_modified(etag, cache_control)
+    version = await version_store.get_version(
+        db, doc.id, version_number, joinedload(DocumentVersion.creator)
+    )
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
+    set_validators(response, representation_etag(format, version.id), cache_control)
+    if format == "html":
+        return await with_html(DocumentVersionOut, version, version.content)
     return version
+
+
+@router.post("/{slug}/preview", response_model=RenderedMarkdown)
+async def preview_markdown(
+    slug: str,
+    data: MarkdownPreview,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Renders unsaved text the way ``?format=html`` does, for editor previews."""
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    # Release the connection while the text renders.
+    await db.commit()
+    return await markdown.preview(data.content)
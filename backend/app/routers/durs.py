@@ -1,152 +1,242 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, joinedload, with_expression
+from typing import Literal, Optional
 from uuid import UUID
 from datetime import datetime
-from ..database import get_db
-from ..models.user import User
+from ..database import get_async_db
+from ..core.principals import Principal
 from ..models.repository import MemberRole
-from ..models.document import Document, DocumentVersion
+from ..models.document import Document
 from ..models.dur import DUR, DURComment, DURStatus
 from ..schemas.dur import (
-    DURCreate, DUROut, DURWithUsers, DURReview, DURCommentCreate, DURCommentOut
+    DURCreate, DUROut, DURWithUsers, DURSummary, DURReview, DURCommentCreate, DURCommentOut, DURDiff
 )
+from ..schemas.page import Page
 from ..core.deps import get_current_user, get_optional_user
+from ..core.pagination import PageParams, paginate
+from ..core import blobs, version_store
+from ..core.diff import diff_cache
+from ..core.events import publish_event
+from ..core.metrics import merge_seconds, versions_written
+from ..core.response_cache import invalidate_responses, repo_scope
+from ..core.profiling import run_in_threadpool
+from ..core.conditional import REVALIDATE, is_conditional, is_fresh, make_etag, not_modified, set_validators
+from ..core import search as search_index
 from .repositories import get_repo_or_404, check_repo_access, require_repo_role
 from .documents import get_doc_or_404
 
 router = APIRouter(prefix="/repos", tags=["durs"])
 
 
-@router.get("/{slug}/durs", response_model=List[DURWithUsers])
-def list_durs(
+def _with_users():
+    """Loader options for the relationships DURWithUsers and DURSummary serialize."""
+    return (
+        joinedload(DUR.creator),
+        joinedload(DUR.reviewer),
+        joinedload(DUR.document).load_only(Document.id, Document.slug, Document.title),
+    )
+
+
+@router.get("/{slug}/durs", response_model=Page[DURSummary])
+async def list_durs(
     slug: str,
     status: Optional[DURStatus] = Query(None),
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-
-    query = db.query(DUR).filter(DUR.repo_id == repo.id)
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+
+    stmt = select(DUR).options(
+        *_with_users(),
+        defer(DUR.proposed_content),
+        with_expression(DUR.proposed_size, func.octet_length(DUR.proposed_content)),
+    ).where(DUR.repo_id == repo.id)
     if status:
-        query = query.filter(DUR.status == status)
-    return query.order_by(DUR.created_at.desc()).all()
+        stmt = stmt.where(DUR.status == status)
+    items, next_cursor = await paginate(db, stmt, (DUR.created_at, DUR.id), page, descending=True)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.post("/{slug}/durs", response_model=DUROut, status_code=201)
-def create_dur(
+async def create_dur(
     slug: str,
     data: DURCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
 
     # Verify document exists in this repo
-    doc = db.query(Document).filter(
+    doc = await db.scalar(select(Document).where(
         Document.id == data.document_id,
         Document.repo_id == repo.id,
-    ).first()
+    ))
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found in this repository")
 
+    proposed_hash = blobs.digest(data.proposed_content)
+    await blobs.store(db, {proposed_hash: data.proposed_content})
     dur = DUR(
         repo_id=repo.id,
         document_id=data.document_id,
         title=data.title,
         description=data.description,
+        proposed_hash=proposed_hash,
         proposed_content=data.proposed_content,
         created_by=current_user.id,
         status=DURStatus.open,
     )
     db.add(dur)
-    db.commit()
-    db.refresh(dur)
+    await db.flush()
+    await search_index.index_dur(db, dur)
+    await db.commit()
+    await db.refresh(dur)
     return dur
 
 
 @router.get("/{slug}/durs/{dur_id}", response_model=DURWithUsers)
-def get_dur(
+async def get_dur(
     slug: str,
     dur_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-
-    dur = db.query(DUR).filter(DUR.id == dur_id, DUR.repo_id == repo.id).first()
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+
+    conditional = is_conditional(request)
+    options = list(_with_users())
+    if conditional:
+        options.append(defer(DUR.proposed_content))
+    dur = await db.scalar(
+        select(DUR).options(*options).where(DUR.id == dur_id, DUR.repo_id == repo.id)
+    )
     if not dur:
         raise HTTPException(status_code=404, detail="DUR not found")
+    # Proposed content is fixed at creation; only the review and the linked
+    # document's title/slug can change what this returns.
+    etag = make_etag(dur.id, dur.status.value, dur.reviewed_at, dur.document.slug, dur.document.title)
+    if is_fresh(request, etag):
+        return not_modified(etag, REVALIDATE)
+    if conditional:
+        await db.refresh(dur, ["proposed_content"])
+    set_validators(response, etag, REVALIDATE)
     return dur
 
 
+@router.get("/{slug}/durs/{dur_id}/diff", response_model=DURDiff)
+async def get_dur_diff(
+    slug: str,
+    dur_id: UUID,
+    view: Literal["unified", "split"] = Query("unified"),
+    context: int = Query(3, ge=0, le=50),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
+):
+    """Diff of the current document against the DUR's proposed content, paginated by hunk."""
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+
+    dur = await db.scalar(select(DUR).where(DUR.id == dur_id, DUR.repo_id == repo.id))
+    if not dur:
+        raise HTTPException(status_code=404, detail="DUR not found")
+    doc = await db.scalar(select(Document).where(Document.id == dur.document_id))
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Large diffs take a while to compute; do it off the event loop.
+    result = await run_in_threadpool(
+        diff_cache.get_or_compute, doc.content_hash, dur.proposed_hash, doc.current_content, dur.proposed_content, context,
+    )
+    start = (page - 1) * page_size
+    hunks = []
+    for hunk in result["hunks"][start:start + page_size]:
+        hunk = dict(hunk)
+        hunk.pop("rows" if view == "unified" else "lines")
+        hunks.append(hunk)
+    return DURDiff(
+        view=view,
+        old_hash=result["old_hash"],
+        new_hash=result["new_hash"],
+        additions=result["additions"],
+        deletions=result["deletions"],
+        total_hunks=len(result["hunks"]),
+        page=page,
+        page_size=page_size,
+        hunks=hunks,
+    )
+
+
 @router.post("/{slug}/durs/{dur_id}/approve", response_model=DUROut)
-def approve_dur(
+async def approve_dur(
     slug: str,
     dur_id: UUID,
     data: DURReview,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.editor)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.editor)
 
-    dur = db.query(DUR).filter(DUR.id == dur_id, DUR.repo_id == repo.id).first()
+    # Locked before the status check, so concurrent reviews of one DUR take turns.
+    dur = await db.scalar(select(DUR).where(DUR.id == dur_id, DUR.repo_id == repo.id).with_for_update())
     if not dur:
         raise HTTPException(status_code=404, detail="DUR not found")
     if dur.status != DURStatus.open:
         raise HTTPException(status_code=400, detail="DUR is not open")
 
-    doc = db.query(Document).filter(Document.id == dur.document_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == dur.document_id).with_for_update())
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Update document content
-    doc.current_content = dur.proposed_content
-    doc.updated_at = datetime.utcnow()
-
-    # Get latest version number
-    latest = db.query(DocumentVersion).filter(
-        DocumentVersion.document_id == doc.id
-    ).order_by(DocumentVersion.version_number.desc()).first()
-    next_version = (latest.version_number + 1) if latest else 1
-
-    # Create new version
-    version = DocumentVersion(
-        document_id=doc.id,
-        content=dur.proposed_content,
-        version_number=next_version,
-        commit_message=f"Merged DUR: {dur.title}",
+    db.add(await version_store.append_version(
+        db,
+        doc,
+        dur.proposed_content,
         created_by=current_user.id,
-    )
-    db.add(version)
+        commit_message=f"Merged DUR: {dur.title}",
+    ))
+    await search_index.index_document(db, doc)
+    if repo.is_public:
+        await invalidate_responses(db, repo_scope(repo.slug))
 
     # Update DUR status
     dur.status = DURStatus.merged
     dur.reviewed_by = current_user.id
     dur.reviewed_at = datetime.utcnow()
     dur.review_comment = data.review_comment
+    await publish_event(db, repo.id, "dur", id=dur.id, status=dur.status.value, document_id=doc.id)
+    await publish_event(db, repo.id, "document", id=doc.id, slug=doc.slug, head_version=doc.head_version)
 
-    db.commit()
-    db.refresh(dur)
+    await db.commit()
+    versions_written.inc("merge")
+    merge_seconds.observe((dur.reviewed_at - dur.created_at).total_seconds())
+    await db.refresh(dur)
     return dur
 
 
 @router.post("/{slug}/durs/{dur_id}/reject", response_model=DUROut)
-def reject_dur(
+async def reject_dur(
     slug: str,
     dur_id: UUID,
     data: DURReview,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.editor)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.editor)
 
-    dur = db.query(DUR).filter(DUR.id == dur_id, DUR.repo_id == repo.id).first()
+    # Locked before the status check, so concurrent reviews of one DUR take turns.
+    dur = await db.scalar(select(DUR).where(DUR.id == dur_id, DUR.repo_id == repo.id).with_for_update())
     if not dur:
         raise HTTPException(status_code=404, detail="DUR not found")
     if dur.status != DURStatus.open:
@@ -156,24 +246,25 @@ def reject_dur(
     dur.reviewed_by = current_user.id
     dur.reviewed_at = datetime.utcnow()
     dur.review_comment = data.review_comment
+    await publish_event(db, repo.id, "dur", id=dur.id, status=dur.status.value, document_id=dur.document_id)
 
-    db.commit()
-    db.refresh(dur)
+    await db.commit()
+    await db.refresh(dur)
     return dur
 
 
 @router.post("/{slug}/durs/{dur_id}/comments", response_model=DURCommentOut, status_code=201)
-def add_comment(
+async def add_comment(
     slug: str,
     dur_id: UUID,
     data: DURCommentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
 
-    dur = db.query(DUR).filter(DUR.id == dur_id, DUR.repo_id == repo.id).first()
+    dur = await db.scalar(select(DUR).where(DUR.id == dur_id, DUR.repo_id == repo.id))
     if not dur:
         raise HTTPException(status_code=404, detail="DUR not found")
 
@@ -183,23 +274,40 @@ def add_comment(
         content=data.content,
     )
     db.add(comment)
-    db.commit()
-    db.refresh(comment)
+    await db.flush()
+    await search_index.index_comment(db, comment, dur)
+    await publish_event(db, repo.id, "comment", id=comment.id, dur_id=dur_id)
+    await db.commit()
+    await db.refresh(comment, ["user"])
     return comment
 
 
-@router.get("/{slug}/durs/{dur_id}/comments", response_model=List[DURCommentOut])
-def get_comments(
+@router.get("/{slug}/durs/{dur_id}/comments", response_model=Page[DURCommentOut])
+async def get_comments(
     slug: str,
     dur_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
 
-    dur = db.query(DUR).filter(DUR.id == dur_id, DUR.repo_id == repo.id).first()
-    if not dur:
+    dur_exists = await db.scalar(select(DUR.id).where(DUR.id == dur_id, DUR.repo_id == repo.id))
+    if not dur_exists:
         raise HTTPException(status_code=404, detail="DUR not found")
 
-    return db.query(DURComment).filter(DURComment.dur_id == dur_id).order_by(DURComment.created_at).all()
+    # Comments are append-only, so their count and newest timestamp version the thread.
+    count, newest = (await db.execute(
+        select(func.count(), func.max(DURComment.created_at)).where(DURComment.dur_id == dur_id)
+    )).one()
+    etag = make_etag(dur_id, count, newest, page.cursor, page.limit)
+    if is_fresh(request, etag):
+        return not_modified(etag, REVALIDATE)
+    set_validators(response, etag, REVALIDATE)
+
+    stmt = select(DURComment).options(joinedload(DURComment.user)).where(DURComment.dur_id == dur_id)
+    items, next_cursor = await paginate(db, stmt, (DURComment.created_at, DURComment.id), page)
+    return {"items": items, "next_cursor": next_cursor}
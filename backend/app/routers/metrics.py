@@ -0,0 +1,40 @@
+import hmac
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database import get_async_db
+from ..models.dur import DUR, DURStatus
+from ..core.metrics import Family, publisher, render
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Prometheus scrape endpoint, summed over all workers."""
+    if settings.METRICS_TOKEN is not None:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    elif not settings.METRICS_PUBLIC:
+        raise HTTPException(status_code=404, detail="Not Found")
+    families = publisher.collect()
+    # Database-wide, so asked once per scrape rather than summed per worker.
+    # Left out while the database is unreachable; the rest still gets scraped.
+    try:
+        open_durs = await db.scalar(select(func.count()).select_from(DUR).where(DUR.status == DURStatus.open))
+    except (SQLAlchemyError, OSError) as exc:
+        logger.warning("Leaving dochub_durs_open out of the scrape: %s", exc)
+    else:
+        families.append(Family("dochub_durs_open", "gauge", "DURs waiting for review.",
+                               [("dochub_durs_open", (), open_durs)]))
+    return PlainTextResponse(render(families), media_type=CONTENT_TYPE)
@@ -1,35 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Optional
 from uuid import UUID
-import re
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
+from ..core.principals import Principal
 from ..models.repository import DocRepository, RepositoryMember, MemberRole
 from ..schemas.repository import (
     RepositoryCreate, RepositoryUpdate, RepositoryOut, RepositoryWithOwner,
     MemberAdd, MemberOut
 )
+from ..schemas.page import Page
 from ..core.deps import get_current_user, get_optional_user
+from ..core.pagination import PageParams, paginate
+from ..core.permissions import invalidate_roles, member_role
+from ..core.events import broker
+from ..core.export import export_repository
+from ..core.response_cache import REPOS, invalidate_responses, repo_scope, response_cache
+from ..core.slugs import insert_with_slug, slugify
 
 router = APIRouter(prefix="/repos", tags=["repositories"])
 
 
-def slugify(text: str) -> str:
-    text = text.lower()
-    text = re.sub(r'[^\w\s-]', '', text)
-    text = re.sub(r'[\s_-]+', '-', text)
-    return text.strip('-')
-
-
-def get_repo_or_404(slug: str, db: Session) -> DocRepository:
-    repo = db.query(DocRepository).filter(DocRepository.slug == slug).first()
+async def get_repo_or_404(slug: str, db: AsyncSession, *options) -> DocRepository:
+    repo = await db.scalar(select(DocRepository).options(*options).where(DocRepository.slug == slug))
     if not repo:
         raise HTTPException(status_code=404, detail="Repository not found")
     return repo
 
 
-def check_repo_access(repo: DocRepository, user: Optional[User], db: Session) -> Optional[MemberRole]:
+async def check_repo_access(repo: DocRepository, user: Optional[Principal], db: AsyncSession) -> Optional[MemberRole]:
     """Returns the user's role in this repo, or None if no access."""
     if repo.is_public:
         if user is None:
@@ -38,20 +41,31 @@ def check_repo_access(repo: DocRepository, user: Optional[User], db: Session) ->
         raise HTTPException(status_code=401, detail="Authentication required")
     if str(repo.owner_id) == str(user.id) or user.is_admin:
         return MemberRole.admin
-    member = db.query(RepositoryMember).filter(
-        RepositoryMember.repo_id == repo.id,
-        RepositoryMember.user_id == user.id,
-    ).first()
-    if member:
-        return member.role
+    role = await member_role(db, repo.id, user.id)
+    if role:
+        return role
     if repo.is_public:
         return None  # authenticated but not member: read-only
     raise HTTPException(status_code=403, detail="Access denied")
 
 
-def require_repo_role(repo: DocRepository, user: User, db: Session, min_role: MemberRole) -> MemberRole:
+def visible_repos_clause(user: Optional[Principal]):
+    """SQL filter on DocRepository matching the repos check_repo_access lets the user read."""
+    if user is None:
+        return DocRepository.is_public == True
+    if user.is_admin:
+        return true()
+    member_repo_ids = select(RepositoryMember.repo_id).where(RepositoryMember.user_id == user.id)
+    return or_(
+        DocRepository.is_public == True,
+        DocRepository.owner_id == user.id,
+        DocRepository.id.in_(member_repo_ids),
+    )
+
+
+async def require_repo_role(repo: DocRepository, user: Principal, db: AsyncSession, min_role: MemberRole) -> MemberRole:
     """Require at minimum a certain role. Returns actual role."""
-    role = check_repo_access(repo, user, db)
+    role = await check_repo_access(repo, user, db)
     role_order = {MemberRole.viewer: 0, MemberRole.editor: 1, MemberRole.admin: 2}
     if role is None:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
@@ -60,80 +74,74 @@ def require_repo_role(repo: DocRepository, user: User, db: Session, min_role: Me
     return role
 
 
-@router.get("", response_model=List[RepositoryWithOwner])
-def list_repos(
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+@router.get("", response_model=Page[RepositoryWithOwner])
+async def list_repos(
+    request: Request,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    if current_user is None:
-        return db.query(DocRepository).filter(DocRepository.is_public == True).all()
-
-    if current_user.is_admin:
-        return db.query(DocRepository).all()
-
-    # Public repos + repos user is member of or owns
-    from sqlalchemy import or_
-    member_repo_ids = [m.repo_id for m in db.query(RepositoryMember).filter(
-        RepositoryMember.user_id == current_user.id
-    ).all()]
-
-    repos = db.query(DocRepository).filter(
-        or_(
-            DocRepository.is_public == True,
-            DocRepository.owner_id == current_user.id,
-            DocRepository.id.in_(member_repo_ids),
+    async def build():
+        # Public repos + repos user is member of or owns (everything for admins)
+        stmt = select(DocRepository).options(joinedload(DocRepository.owner)).where(
+            visible_repos_clause(current_user)
         )
-    ).all()
-    return repos
+        items, next_cursor = await paginate(db, stmt, (DocRepository.created_at, DocRepository.id), page)
+        return {"items": items, "next_cursor": next_cursor}
+
+    if current_user is None:
+        key = f"list_repos:{page.cursor}:{page.limit}"
+        return await response_cache.serve(request, REPOS, key, Page[RepositoryWithOwner], build)
+    return await build()
 
 
 @router.post("", response_model=RepositoryOut, status_code=201)
-def create_repo(
+async def create_repo(
     data: RepositoryCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    slug = data.slug or slugify(data.name)
-    # Ensure uniqueness
-    base_slug = slug
-    counter = 1
-    while db.query(DocRepository).filter(DocRepository.slug == slug).first():
-        slug = f"{base_slug}-{counter}"
-        counter += 1
-
     repo = DocRepository(
         name=data.name,
-        slug=slug,
         description=data.description,
         is_public=data.is_public,
         owner_id=current_user.id,
     )
-    db.add(repo)
-    db.commit()
-    db.refresh(repo)
+    await insert_with_slug(db, repo, DocRepository.slug, data.slug or slugify(data.name))
+    if repo.is_public:
+        await invalidate_responses(db, REPOS)
+    await db.commit()
+    await db.refresh(repo)
     return repo
 
 
 @router.get("/{slug}", response_model=RepositoryWithOwner)
-def get_repo(
+async def get_repo(
     slug: str,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_optional_user),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    return repo
+    async def build():
+        repo = await get_repo_or_404(slug, db, joinedload(DocRepository.owner))
+        await check_repo_access(repo, current_user, db)
+        return repo
+
+    if current_user is None:
+        return await response_cache.serve(request, repo_scope(slug), "get_repo", RepositoryWithOwner, build)
+    return await build()
 
 
 @router.put("/{slug}", response_model=RepositoryOut)
-def update_repo(
+async def update_repo(
     slug: str,
     data: RepositoryUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.admin)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.admin)
+    was_public = repo.is_public
 
     if data.name is not None:
         repo.name = data.name
@@ -142,83 +150,137 @@ def update_repo(
     if data.is_public is not None:
         repo.is_public = data.is_public
 
-    db.commit()
-    db.refresh(repo)
+    await invalidate_roles(db, repo.id)
+    if was_public or repo.is_public:
+        await invalidate_responses(db, REPOS, repo_scope(repo.slug))
+    await db.commit()
+    await db.refresh(repo)
     return repo
 
 
 @router.delete("/{slug}", status_code=204)
-def delete_repo(
+async def delete_repo(
     slug: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
+    repo = await get_repo_or_404(slug, db)
     if str(repo.owner_id) != str(current_user.id) and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only the owner can delete this repository")
-    db.delete(repo)
-    db.commit()
+    await invalidate_roles(db, repo.id)
+    if repo.is_public:
+        await invalidate_responses(db, REPOS, repo_scope(repo.slug))
+    await db.delete(repo)
+    await db.commit()
+
+
+@router.get("/{slug}/export")
+async def export_repo(
+    slug: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
+):
+    """Streams a .tar.gz of every document with its full history, and all DURs with comments."""
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    return StreamingResponse(
+        export_repository(repo.id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{repo.slug}.tar.gz"'},
+    )
 
 
-@router.get("/{slug}/members", response_model=List[MemberOut])
-def get_members(
+@router.get("/{slug}/events")
+async def repo_events(
     slug: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    check_repo_access(repo, current_user, db)
-    return db.query(RepositoryMember).filter(RepositoryMember.repo_id == repo.id).all()
+    """Server-Sent Events for the repository: ``comment``, ``dur`` and
+    ``document`` name what changed; ``reset`` means refetch everything.
+
+    The stream ends when the caller's access may have changed; reconnecting
+    checks it again.
+    """
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    # The stream stays open for as long as the page does; don't hold a pool
+    # connection for it.
+    await db.commit()
+    return StreamingResponse(
+        broker.stream(str(repo.id), str(current_user.id) if current_user else None),
+        media_type="text/event-stream",
+        # no-transform and X-Accel-Buffering keep proxies from buffering events.
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{slug}/members", response_model=Page[MemberOut])
+async def get_members(
+    slug: str,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    repo = await get_repo_or_404(slug, db)
+    await check_repo_access(repo, current_user, db)
+    stmt = select(RepositoryMember).options(joinedload(RepositoryMember.user)).where(
+        RepositoryMember.repo_id == repo.id
+    )
+    items, next_cursor = await paginate(db, stmt, (RepositoryMember.user_id,), page)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.post("/{slug}/members", response_model=MemberOut, status_code=201)
-def add_member(
+async def add_member(
     slug: str,
     data: MemberAdd,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.admin)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.admin)
 
     # Check user exists
-    target_user = db.query(User).filter(User.id == data.user_id).first()
+    target_user = await db.scalar(select(User).where(User.id == data.user_id))
     if not target_user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Check already a member
-    existing = db.query(RepositoryMember).filter(
+    existing = await db.scalar(select(RepositoryMember).where(
         RepositoryMember.repo_id == repo.id,
         RepositoryMember.user_id == data.user_id,
-    ).first()
+    ))
+    await invalidate_roles(db, repo.id, data.user_id)
     if existing:
         existing.role = data.role
-        db.commit()
-        db.refresh(existing)
+        await db.commit()
+        await db.refresh(existing, ["role", "user"])
         return existing
 
     member = RepositoryMember(repo_id=repo.id, user_id=data.user_id, role=data.role)
     db.add(member)
-    db.commit()
-    db.refresh(member)
+    await db.commit()
+    await db.refresh(member, ["user"])
     return member
 
 
 @router.delete("/{slug}/members/{user_id}", status_code=204)
-def remove_member(
+async def remove_member(
     slug: str,
     user_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    repo = get_repo_or_404(slug, db)
-    require_repo_role(repo, current_user, db, MemberRole.admin)
+    repo = await get_repo_or_404(slug, db)
+    await require_repo_role(repo, current_user, db, MemberRole.admin)
 
-    member = db.query(RepositoryMember).filter(
+    member = await db.scalar(select(RepositoryMember).where(
         RepositoryMember.repo_id == repo.id,
         RepositoryMember.user_id == user_id,
-    ).first()
+    ))
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
-    db.delete(member)
-    db.commit()
+    await invalidate_roles(db, repo.id, user_id)
+    await db.delete(member)
+    await db.commit()
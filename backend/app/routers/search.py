@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+from ..database import get_async_db
+from ..core.principals import Principal
+from ..schemas.search import SearchResults
+from ..core.deps import get_optional_user
+from ..core import search as search_index
+from .repositories import get_repo_or_404, check_repo_access, visible_repos_clause
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[Literal["document", "dur", "comment"]] = Query(None),
+    repo: Optional[str] = Query(None, description="Restrict to one repository slug"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[Principal] = Depends(get_optional_user),
+):
+    repo_id = None
+    if repo is not None:
+        scoped = await get_repo_or_404(repo, db)
+        await check_repo_access(scoped, current_user, db)
+        repo_id = scoped.id
+
+    rows = await search_index.search(
+        db, q, visible_repos_clause(current_user),
+        kind=kind, repo_id=repo_id, limit=limit, offset=offset,
+    )
+    return SearchResults(query=q, limit=limit, offset=offset, results=rows)
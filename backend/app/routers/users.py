@@ -1,30 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from uuid import UUID
-from ..database import get_db
+from ..database import get_async_db
 from ..models.user import User
+from ..core.principals import Principal
 from ..schemas.user import UserOut
+from ..schemas.page import Page
 from ..core.deps import get_current_admin_user, get_current_user
+from ..core.pagination import PageParams, paginate
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
-@router.get("", response_model=List[UserOut])
-def list_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user),
+@router.get("", response_model=Page[UserOut])
+async def list_users(
+    username: Optional[str] = Query(None, description="Exact username match"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user),
 ):
-    return db.query(User).all()
+    stmt = select(User)
+    if username is not None:
+        stmt = stmt.where(User.username == username)
+    items, next_cursor = await paginate(db, stmt, (User.created_at, User.id), page)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/{user_id}", response_model=UserOut)
-def get_user(
+async def get_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
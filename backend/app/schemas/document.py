@@ -1,7 +1,8 @@
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import datetime, timezone
 from uuid import UUID
 from typing import Optional, List
+from ..config import settings
 from .user import UserOut
 
 
@@ -18,12 +19,30 @@ class DocumentUpdate(BaseModel):
     title: Optional[str] = None
     current_content: Optional[str] = None
     commit_message: Optional[str] = None
+    # head_version the edit started from; a newer head rejects it with 409.
+    base_version: Optional[int] = None
+
+
+class TocEntry(BaseModel):
+    level: int
+    text: str
+    id: str
+
+
+class RenderedMarkdown(BaseModel):
+    html: str
+    toc: List[TocEntry]
+
+
+class MarkdownPreview(BaseModel):
+    content: str = Field(max_length=settings.PREVIEW_MAX_LENGTH)
 
 
 class DocumentOut(DocumentBase):
     id: UUID
     repo_id: UUID
     slug: str
+    head_version: int
     created_by: UUID
     created_at: datetime
     updated_at: datetime
@@ -33,6 +52,26 @@ class DocumentOut(DocumentBase):
 
 class DocumentWithCreator(DocumentOut):
     creator: UserOut
+    # Sanitized HTML and headings of current_content, with ?format=html.
+    html: Optional[str] = None
+    toc: Optional[List[TocEntry]] = None
+
+    model_config = {"from_attributes": True}
+
+
+class DocumentSummary(BaseModel):
+    """List item without the document body."""
+    id: UUID
+    repo_id: UUID
+    title: str
+    slug: str
+    head_version: int
+    created_by: UUID
+    created_at: datetime
+    updated_at: datetime
+    creator: UserOut
+    content_size: Optional[int] = None
+    excerpt: Optional[str] = None
 
     model_config = {"from_attributes": True}
 
@@ -49,5 +88,71 @@ class DocumentVersionOut(DocumentVersionBase):
     created_by: UUID
     created_at: datetime
     creator: UserOut
+    # Sanitized HTML and headings of content, with ?format=html.
+    html: Optional[str] = None
+    toc: Optional[List[TocEntry]] = None
 
     model_config = {"from_attributes": True}
+
+
+class DocumentVersionSummary(BaseModel):
+    """History entry without the version text; fetch a single version for that."""
+    id: UUID
+    document_id: UUID
+    version_number: int
+    commit_message: Optional[str] = None
+    storage: str
+    stored_size: Optional[int] = None
+    created_by: UUID
+    created_at: datetime
+    creator: UserOut
+
+    model_config = {"from_attributes": True}
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC.
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class VersionImport(BaseModel):
+    content: str
+    commit_message: Optional[str] = Field(None, max_length=500)
+    created_at: Optional[datetime] = None
+
+    _created_at = field_validator("created_at")(_naive_utc)
+
+
+class DocumentImport(BaseModel):
+    """One document of a bulk import: its text, or its history oldest first.
+
+    With ``versions`` the document's content is that of the last version.
+    """
+    title: str = Field(min_length=1, max_length=200)
+    slug: Optional[str] = Field(None, min_length=1, max_length=200)
+    content: Optional[str] = None
+    versions: List[VersionImport] = []
+    created_at: Optional[datetime] = None
+
+    _created_at = field_validator("created_at")(_naive_utc)
+
+    @model_validator(mode="after")
+    def _content_or_history(self):
+        if not self.versions:
+            if self.content is None:
+                raise ValueError("either content or versions is required")
+        elif self.content is not None and self.content != self.versions[-1].content:
+            raise ValueError("content must match the last version")
+        return self
+
+
+class ImportResult(BaseModel):
+    documents: int
+    versions: int
+    # Documents whose slug was taken and got a numbered one instead.
+    renamed: int
+    batches: int
+    seconds: float
+    documents_per_second: float
@@ -50,6 +50,26 @@ class DURWithUsers(DUROut):
     model_config = {"from_attributes": True}
 
 
+class DURSummary(BaseModel):
+    """List item without ``proposed_content``."""
+    id: UUID
+    repo_id: UUID
+    document_id: UUID
+    title: str
+    description: Optional[str] = None
+    status: DURStatus
+    created_by: UUID
+    reviewed_by: Optional[UUID] = None
+    created_at: datetime
+    reviewed_at: Optional[datetime] = None
+    proposed_size: Optional[int] = None
+    creator: UserOut
+    reviewer: Optional[UserOut] = None
+    document: DocumentBrief
+
+    model_config = {"from_attributes": True}
+
+
 class DURCommentCreate(BaseModel):
     content: str
 
@@ -63,3 +83,42 @@ class DURCommentOut(BaseModel):
     user: UserOut
 
     model_config = {"from_attributes": True}
+
+
+class DiffSegment(BaseModel):
+    type: str
+    text: str
+
+
+class DiffLine(BaseModel):
+    type: str
+    old_number: Optional[int] = None
+    new_number: Optional[int] = None
+    content: str
+    segments: Optional[List[DiffSegment]] = None
+
+
+class DiffRow(BaseModel):
+    left: Optional[DiffLine] = None
+    right: Optional[DiffLine] = None
+
+
+class DiffHunk(BaseModel):
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    lines: Optional[List[DiffLine]] = None
+    rows: Optional[List[DiffRow]] = None
+
+
+class DURDiff(BaseModel):
+    view: str
+    old_hash: str
+    new_hash: str
+    additions: int
+    deletions: int
+    total_hunks: int
+    page: int
+    page_size: int
+    hunks: List[DiffHunk]
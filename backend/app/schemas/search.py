@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from uuid import UUID
+from typing import Optional, List
+
+
+class SearchResult(BaseModel):
+    kind: str
+    object_id: UUID
+    title: str
+    repo_slug: str
+    document_slug: str
+    document_title: str
+    dur_id: Optional[UUID] = None
+    rank: float
+
+    model_config = {"from_attributes": True}
+
+
+class SearchResults(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    results: List[SearchResult]
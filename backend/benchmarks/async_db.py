@@ -0,0 +1,147 @@
+"""Sync vs async database path under concurrent load.
+
+Starts uvicorn in a subprocess serving the API plus a ``/bench/sync/repos``
+route that runs the same query as ``GET /api/repos`` as a plain ``def``
+handler on ``get_db`` (Starlette threadpool, psycopg2), then drives both with
+the same number of concurrent clients and reports latency percentiles and
+throughput.  Run it against a scratch database that has been migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.async_db --clients 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import SessionLocal, get_db
+from app.main import app
+from app.models.repository import DocRepository
+from app.models.user import User
+from app.schemas.page import Page
+from app.schemas.repository import RepositoryWithOwner
+
+
+@app.get("/bench/sync/repos", response_model=Page[RepositoryWithOwner], include_in_schema=False)
+def sync_repos(limit: int = 50, db: Session = Depends(get_db)):
+    items = (
+        db.query(DocRepository)
+        .options(joinedload(DocRepository.owner))
+        .filter(DocRepository.is_public == True)
+        .order_by(DocRepository.created_at, DocRepository.id)
+        .limit(limit)
+        .all()
+    )
+    return {"items": items, "next_cursor": None}
+
+
+PATHS = {
+    "sync": "/bench/sync/repos",
+    "async": "/api/repos",
+}
+
+
+def seed(repos: int) -> None:
+    if repos <= 0:
+        return
+    with SessionLocal() as db:
+        owner = User(username=f"bench-{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex[:8]}@example.com",
+                     hashed_password="x")
+        db.add(owner)
+        db.flush()
+        db.execute(insert(DocRepository), [
+            dict(id=uuid.uuid4(), name=f"Bench {i}", slug=f"bench-{uuid.uuid4().hex[:12]}",
+                 is_public=True, owner_id=owner.id, created_at=datetime.utcnow())
+            for i in range(repos)
+        ])
+        db.commit()
+
+
+async def load(url: str, clients: int, requests: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                t0 = time.perf_counter()
+                try:
+                    response = await client.get(url, params={"limit": 20})
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def wait_until_up(base: str, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            httpx.get(base + PATHS["async"], timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=10_000, help="requests per path")
+    parser.add_argument("--repos", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--only", choices=sorted(PATHS), default=None)
+    args = parser.parse_args()
+
+    seed(args.repos)
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.async_db:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log"],
+        env=dict(os.environ, ENVIRONMENT="benchmark"),
+    )
+    try:
+        wait_until_up(base, server)
+        report: dict = {"clients": args.clients}
+        for name, path in PATHS.items():
+            if args.only not in (None, name):
+                continue
+            asyncio.run(load(base + path, min(args.clients, 50), 200))  # warm the pools
+            report[name] = asyncio.run(load(base + path, args.clients, args.requests))
+        print(json.dumps(report, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Storage saved by content-addressed blobs (migration 008) on a generated history.
+
+Migrates the empty database at ``DATABASE_URL`` to revision 007 and writes
+``--docs`` documents in that layout.  Each goes through ``--events`` changes:
+direct edits, DURs that are merged or rejected, and reverts to the text two
+versions back.  It then measures the tables holding text, upgrades to head,
+checks that every version still rebuilds to the text it was written with,
+and measures again.  Sizes are after ``VACUUM FULL`` and include TOAST and
+indexes.
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.blob_storage --docs 300
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+
+from app.core.version_store import encode_version, hydrate
+from app.database import engine
+from benchmarks.version_store import evolve
+
+TEXT_TABLES = ("documents", "document_versions", "durs", "blobs")
+WORDS = (
+    "alert", "backup", "check", "cluster", "config", "database", "deploy", "disk", "dashboard", "escalate",
+    "failover", "host", "incident", "latency", "load", "logs", "memory", "metrics", "node", "on-call",
+    "outage", "page", "primary", "queue", "replica", "restart", "restore", "rollback", "service", "traffic",
+    "the", "a", "if", "then", "and", "or", "before", "after", "until", "when", "is", "are", "to", "from",
+    "with", "on", "in", "of", "for", "not", "verify", "confirm", "wait", "run", "stop", "start", "notify",
+)
+
+users = sa.table("users", *(sa.column(c) for c in ("id", "username", "email", "hashed_password")))
+repositories = sa.table("repositories", *(sa.column(c) for c in ("id", "name", "slug", "owner_id")))
+documents = sa.table("documents", *(sa.column(c) for c in (
+    "id", "repo_id", "title", "slug", "current_content", "head_version", "created_by")))
+versions = sa.table("document_versions", *(sa.column(c) for c in (
+    "id", "document_id", "version_number", "storage", "payload", "commit_message", "created_by")))
+durs = sa.table("durs", *(sa.column(c) for c in (
+    "id", "repo_id", "document_id", "title", "proposed_content", "status", "created_by")))
+
+
+def generate(rng: random.Random, lines: int, events: int, merge: float, reject: float, revert: float):
+    """History of one document: its version texts and its DURs as ``(text, status)``."""
+    # Prose, so texts compress about as well as real runbooks do.
+    text = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) + ".\n" for _ in range(lines)]
+    history = ["".join(text)]
+    proposals = []
+    for _ in range(events):
+        roll = rng.random()
+        if roll < revert and len(history) > 2:
+            history.append(history[-3])
+            text = history[-1].splitlines(keepends=True)
+            continue
+        text = evolve(rng, text)
+        proposed = "".join(text)
+        if roll < revert + merge:
+            proposals.append((proposed, "merged"))
+        elif roll < revert + merge + reject:
+            proposals.append((proposed, "rejected"))
+            text = history[-1].splitlines(keepends=True)
+            continue
+        history.append(proposed)
+    return history, proposals
+
+
+def write_legacy(conn, args) -> dict:
+    """Writes the generated data in the revision 007 layout; returns the version texts."""
+    rng = random.Random(args.seed)
+    user_id, repo_id = uuid.uuid4(), uuid.uuid4()
+    conn.execute(users.insert().values(id=user_id, username="blob-bench", email="blob-bench@example.com",
+                                       hashed_password="-"))
+    conn.execute(repositories.insert().values(id=repo_id, name="Blob bench", slug="blob-bench", owner_id=user_id))
+    texts = {}
+    for n in range(args.docs):
+        doc_id = uuid.uuid4()
+        history, proposals = generate(rng, args.lines, args.events, args.merge, args.reject, args.revert)
+        texts[doc_id] = history
+        conn.execute(documents.insert().values(
+            id=doc_id, repo_id=repo_id, title=f"Runbook {n}", slug=f"runbook-{n}",
+            current_content=history[-1], head_version=len(history), created_by=user_id))
+        rows, previous = [], None
+        for number, content in enumerate(history, 1):
+            storage, payload = encode_version(number, content, previous)
+            rows.append(dict(id=uuid.uuid4(), document_id=doc_id, version_number=number, storage=storage,
+                             payload=payload, commit_message=f"Edit {number}", created_by=user_id))
+            previous = content
+        conn.execute(versions.insert(), rows)
+        if proposals:
+            conn.execute(durs.insert(), [
+                dict(id=uuid.uuid4(), repo_id=repo_id, document_id=doc_id, title=f"Change {i}",
+                     proposed_content=content, status=status, created_by=user_id)
+                for i, (content, status) in enumerate(proposals)
+            ])
+    return texts
+
+
+def measure() -> dict:
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        present = [t for t in TEXT_TABLES if conn.scalar(sa.text("SELECT to_regclass(:t)"), {"t": t})]
+        for table in present:
+            conn.execute(sa.text(f"VACUUM FULL {table}"))
+        return {t: conn.scalar(sa.text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": t})
+                for t in present}
+
+
+def verify(texts: dict) -> None:
+    with engine.connect() as conn:
+        for doc_id, history in texts.items():
+            rows = conn.execute(sa.text("""
+                SELECT v.version_number, v.storage, v.payload, b.content AS snapshot
+                FROM document_versions v LEFT JOIN blobs b ON b.hash = v.blob_hash
+                WHERE v.document_id = :id ORDER BY v.version_number
+            """), {"id": doc_id}).all()
+            chain = [SimpleNamespace(**row._mapping, content=None) for row in rows]
+            hydrate(chain)
+            assert [v.content for v in chain] == history, f"document {doc_id} does not rebuild"
+            current = conn.scalar(sa.text(
+                "SELECT b.content FROM documents d JOIN blobs b ON b.hash = d.content_hash WHERE d.id = :id"
+            ), {"id": doc_id})
+            assert current == history[-1], f"document {doc_id} lost its content"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--lines", type=int, default=200, help="initial lines per document")
+    parser.add_argument("--events", type=int, default=40, help="changes per document")
+    parser.add_argument("--merge", type=float, default=0.3, help="share of changes that are merged DURs")
+    parser.add_argument("--reject", type=float, default=0.1, help="share of changes that are rejected DURs")
+    parser.add_argument("--revert", type=float, default=0.05, help="share of changes that are reverts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = Config("alembic.ini")
+    command.upgrade(config, "007")
+    with engine.begin() as conn:
+        texts = write_legacy(conn, args)
+    before = measure()
+
+    started = time.perf_counter()
+    command.upgrade(config, "head")
+    migrate_seconds = time.perf_counter() - started
+    verify(texts)
+    after = measure()
+
+    with engine.connect() as conn:
+        blobs, references = conn.execute(sa.text("SELECT count(*), coalesce(sum(refcount), 0) FROM blobs")).one()
+    print(json.dumps({
+        "documents": args.docs,
+        "versions": sum(len(h) for h in texts.values()),
+        "blobs": blobs,
+        "blob_references": references,
+        "migrate_seconds": round(migrate_seconds, 2),
+        "bytes_before": before,
+        "bytes_after": after,
+        "total_before": sum(before.values()),
+        "total_after": sum(after.values()),
+        "reduction": round(1 - sum(after.values()) / sum(before.values()), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
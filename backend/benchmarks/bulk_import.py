@@ -0,0 +1,125 @@
+"""Bulk import throughput against one create per document.
+
+Starts uvicorn in a subprocess, builds an NDJSON body of ``--docs`` documents
+with ``--versions`` versions each, and imports it with
+``POST /api/repos/{slug}/import``.  For comparison, ``--baseline`` documents
+are created (and updated to the same number of versions) one request at a
+time through ``POST /docs`` and ``PUT /docs/{slug}``, the way a migration
+script had to before.  Run it against a scratch database that has been
+migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.bulk_import --docs 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.core.security import create_access_token
+from app.database import SessionLocal
+from app.models.repository import DocRepository
+from app.models.user import User
+from benchmarks.async_db import wait_until_up
+from benchmarks.search import WORDS
+
+
+def seed() -> tuple:
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        user = User(username=f"import-{tag}", email=f"import-{tag}@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        repos = []
+        for name in ("bulk", "baseline"):
+            repo = DocRepository(name=f"Import {name} {tag}", slug=f"import-{name}-{tag}", owner_id=user.id)
+            db.add(repo)
+            repos.append(repo)
+        db.commit()
+        return create_access_token(data={"sub": str(user.id)}), [repo.slug for repo in repos]
+
+
+def history(rng: random.Random, versions: int, lines: int) -> list:
+    """Texts of successive versions, each editing a few lines of the last."""
+    text = [" ".join(rng.choices(WORDS, k=10)) for _ in range(lines)]
+    texts = ["\n".join(text) + "\n"]
+    for _ in range(versions - 1):
+        for _ in range(3):
+            text[rng.randrange(len(text))] = " ".join(rng.choices(WORDS, k=10))
+        texts.append("\n".join(text) + "\n")
+    return texts
+
+
+def documents(count: int, versions: int, lines: int, seed_value: int):
+    rng = random.Random(seed_value)
+    for i in range(count):
+        title = f"{' '.join(rng.choices(WORDS, k=3)).title()} {i}"
+        yield title, history(rng, versions, lines)
+
+
+async def baseline(client: httpx.AsyncClient, slug: str, args) -> dict:
+    t0 = time.perf_counter()
+    for title, texts in documents(args.baseline, args.versions, args.lines, 1):
+        response = await client.post(f"/api/repos/{slug}/docs", json={"title": title, "current_content": texts[0]})
+        response.raise_for_status()
+        doc_slug = response.json()["slug"]
+        for text in texts[1:]:
+            (await client.put(f"/api/repos/{slug}/docs/{doc_slug}", json={"current_content": text})).raise_for_status()
+    seconds = time.perf_counter() - t0
+    return {"documents": args.baseline, "seconds": seconds, "documents_per_second": args.baseline / seconds}
+
+
+async def bulk(client: httpx.AsyncClient, slug: str, body: bytes) -> dict:
+    t0 = time.perf_counter()
+    response = await client.post(f"/api/repos/{slug}/import", content=body,
+                                 headers={"Content-Type": "application/x-ndjson"})
+    response.raise_for_status()
+    return {"wall_seconds": time.perf_counter() - t0, **response.json()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20_000)
+    parser.add_argument("--versions", type=int, default=1, help="versions per document")
+    parser.add_argument("--lines", type=int, default=40, help="lines per document")
+    parser.add_argument("--baseline", type=int, default=200, help="documents created one request at a time")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    token, (bulk_slug, baseline_slug) = seed()
+    body = "".join(
+        json.dumps({"title": title, "versions": [{"content": text} for text in texts]}) + "\n"
+        for title, texts in documents(args.docs, args.versions, args.lines, 0)
+    ).encode("utf-8")
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log"],
+        env=dict(os.environ, ENVIRONMENT="benchmark"),
+    )
+    try:
+        wait_until_up(base, server)
+
+        async def run() -> dict:
+            async with httpx.AsyncClient(base_url=base, timeout=None,
+                                         headers={"Authorization": f"Bearer {token}"}) as client:
+                return {
+                    "body_bytes": len(body),
+                    "bulk": await bulk(client, bulk_slug, body),
+                    "one_by_one": await baseline(client, baseline_slug, args),
+                }
+
+        print(json.dumps(asyncio.run(run()), indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
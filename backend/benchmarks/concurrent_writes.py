@@ -0,0 +1,150 @@
+"""Parallel writers on one document: version numbering under contention.
+
+Starts uvicorn in a subprocess and points ``--writers`` concurrent clients at
+a single document, in two rounds:
+
+* ``blind``: each client PUTs new content without a precondition; every
+  write must succeed and get its own version number;
+* ``optimistic``: each client reads ``head_version`` and PUTs with
+  ``base_version``, retrying on 409; no write may be lost.
+
+Afterwards the history must be numbered ``1..head_version`` without gaps or
+duplicates, hold one version per accepted write, and rebuild to the current
+content.  Exits non-zero otherwise.  Run it against a scratch database that
+has been migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.concurrent_writes --writers 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+from sqlalchemy import func, select
+
+from app.core.security import create_access_token
+from app.database import SessionLocal
+from app.models.document import Document, DocumentVersion
+from app.models.repository import DocRepository
+from app.models.user import User
+from benchmarks.async_db import wait_until_up
+
+
+def seed() -> tuple:
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        user = User(username=f"writer-{tag}", email=f"writer-{tag}@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        repo = DocRepository(name=f"Writers {tag}", slug=f"writers-{tag}", owner_id=user.id)
+        db.add(repo)
+        db.commit()
+        return create_access_token(data={"sub": str(user.id)}), repo.slug
+
+
+async def blind(client: httpx.AsyncClient, url: str, writer: int, writes: int, stats: dict) -> None:
+    for i in range(writes):
+        t0 = time.perf_counter()
+        response = await client.put(url, json={"current_content": f"blind {writer} {i}\n"})
+        stats["latencies"].append((time.perf_counter() - t0) * 1000)
+        stats["statuses"][response.status_code] = stats["statuses"].get(response.status_code, 0) + 1
+
+
+async def optimistic(client: httpx.AsyncClient, url: str, writer: int, writes: int, stats: dict) -> None:
+    for i in range(writes):
+        t0 = time.perf_counter()
+        while True:
+            head = (await client.get(url)).json()["head_version"]
+            response = await client.put(url, json={"current_content": f"optimistic {writer} {i}\n",
+                                                   "base_version": head})
+            stats["statuses"][response.status_code] = stats["statuses"].get(response.status_code, 0) + 1
+            if response.status_code != 409:
+                break
+        stats["latencies"].append((time.perf_counter() - t0) * 1000)
+
+
+async def round_(client: httpx.AsyncClient, url: str, writer, args) -> dict:
+    stats = {"latencies": [], "statuses": {}}
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(client, url, n, args.writes, stats) for n in range(args.writers)))
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(stats["latencies"])
+    return {
+        "statuses": stats["statuses"],
+        "writes_per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def check_history(repo_slug: str, accepted: int) -> list:
+    """Problems with the stored history, if any."""
+    with SessionLocal() as db:
+        doc = db.scalar(select(Document).join(DocRepository).where(
+            DocRepository.slug == repo_slug, Document.slug == "contended"))
+        count, distinct, low, high = db.execute(select(
+            func.count(), func.count(DocumentVersion.version_number.distinct()),
+            func.min(DocumentVersion.version_number), func.max(DocumentVersion.version_number),
+        ).where(DocumentVersion.document_id == doc.id)).one()
+    problems = []
+    if (count, distinct, low, high) != (doc.head_version, doc.head_version, 1, doc.head_version):
+        problems.append(f"versions {count} ({distinct} distinct, {low}..{high}) for head_version {doc.head_version}")
+    if count != accepted + 1:
+        problems.append(f"{count} versions for {accepted} accepted writes plus the initial one")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=10, help="writes per writer per round")
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    token, repo_slug = seed()
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log", "--timeout-keep-alive", "120"],
+        env=dict(os.environ, ENVIRONMENT="benchmark"),
+    )
+    try:
+        wait_until_up(base, server)
+
+        async def run() -> dict:
+            limits = httpx.Limits(max_connections=args.writers)
+            async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120,
+                                         headers={"Authorization": f"Bearer {token}"}) as client:
+                (await client.post(f"/api/repos/{repo_slug}/docs",
+                                   json={"title": "Contended", "current_content": "start\n"})).raise_for_status()
+                url = f"/api/repos/{repo_slug}/docs/contended"
+                report = {"writers": args.writers, "writes": args.writes}
+                for name, writer in (("blind", blind), ("optimistic", optimistic)):
+                    report[name] = await round_(client, url, writer, args)
+                doc = (await client.get(url)).json()
+                latest = (await client.get(f"{url}/versions/{doc['head_version']}")).json()
+                report["head_version"] = doc["head_version"]
+                report["head_matches_content"] = latest["content"] == doc["current_content"]
+                return report
+
+        report = asyncio.run(run())
+        accepted = sum(report[name]["statuses"].get(200, 0) for name in ("blind", "optimistic"))
+        problems = check_history(repo_slug, accepted)
+        if not report["head_matches_content"]:
+            problems.append("latest version does not rebuild to the current content")
+        report["problems"] = problems
+        print(json.dumps(report, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
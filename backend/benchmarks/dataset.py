@@ -0,0 +1,152 @@
+"""Synthetic dataset shared by the benchmarks that need a populated database.
+
+``seed`` writes users, repositories (half public) with members, documents
+with versions, DURs (every fifth open) and DUR comments, plus their search
+entries, with a handful of ``INSERT ... SELECT generate_series`` statements,
+then ANALYZEs.  Ids are ``md5(tag || kind || n)``, so a ``Dataset`` can name
+any seeded row, e.g. the owner of repository ``r``, without reading back.
+Every user's password is ``PASSWORD``.
+"""
+import argparse
+import hashlib
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.core import search as search_index
+from app.core.security import get_password_hash
+from app.database import AsyncSessionLocal, async_engine
+
+PASSWORD = "bench-password"
+CONTENT = "Runbook for the payments service.\n\nDeploy, verify the dashboard, roll back on errors.\n"
+MEMBER_ROLES = ("viewer", "editor", "admin")
+
+PROPOSED = CONTENT + "Page the on-call first.\n"
+
+SEED_STATEMENTS = [
+    """INSERT INTO users (id, username, email, hashed_password, is_active, is_admin, created_at)
+       SELECT md5(:tag || 'u' || n)::uuid, 'bench-' || :tag || '-' || n, 'bench-' || :tag || '-' || n || '@example.com',
+              :password, true, n = 1, now() - n * interval '1 minute'
+       FROM generate_series(1, :users) n""",
+    """INSERT INTO repositories (id, name, slug, description, is_public, owner_id, created_at)
+       SELECT md5(:tag || 'r' || n)::uuid, 'Bench ' || n, 'bench-' || :tag || '-' || n, NULL, n % 2 = 0,
+              md5(:tag || 'u' || (1 + n % :users))::uuid, now() - n * interval '1 minute'
+       FROM generate_series(1, :repos) n""",
+    """INSERT INTO repository_members (repo_id, user_id, role)
+       SELECT md5(:tag || 'r' || r)::uuid, md5(:tag || 'u' || (1 + (r + 97 * k) % :users))::uuid,
+              (ARRAY['viewer', 'editor', 'admin'])[1 + k % 3]::memberrole
+       FROM generate_series(1, :repos) r, generate_series(1, :members) k""",
+    """INSERT INTO blobs (hash, content)
+       VALUES (sha256(convert_to(:content, 'UTF8')), :content), (sha256(convert_to(:proposed, 'UTF8')), :proposed)
+       ON CONFLICT (hash) DO NOTHING""",
+    """INSERT INTO documents (id, repo_id, title, slug, content_hash, head_version, created_by, created_at, updated_at)
+       SELECT md5(:tag || 'd' || n)::uuid, md5(:tag || 'r' || (1 + (n - 1) % :repos))::uuid,
+              'Runbook ' || n, 'doc-' || n, sha256(convert_to(:content, 'UTF8')), :versions, md5(:tag || 'u' || (1 + n % :users))::uuid,
+              now() - n * interval '1 second', now() - n * interval '1 second'
+       FROM generate_series(1, :all_docs) n""",
+    """INSERT INTO document_versions (id, document_id, version_number, storage, blob_hash, commit_message, created_by, created_at)
+       SELECT gen_random_uuid(), md5(:tag || 'd' || n)::uuid, v, 'snapshot', sha256(convert_to(:content, 'UTF8')), 'Edit ' || v,
+              md5(:tag || 'u' || (1 + n % :users))::uuid, now() - n * interval '1 second'
+       FROM generate_series(1, :all_docs) n, generate_series(1, :versions) v""",
+    """INSERT INTO durs (id, repo_id, document_id, title, description, proposed_hash, status, created_by, created_at)
+       SELECT md5(:tag || 'p' || n)::uuid, md5(:tag || 'r' || (1 + (n - 1) % :repos))::uuid,
+              md5(:tag || 'd' || (1 + (n - 1) % :repos + :repos * (n % :docs)))::uuid,
+              'Fix step ' || n, 'Rollback step is wrong', sha256(convert_to(:proposed, 'UTF8')),
+              (ARRAY['open', 'merged', 'merged', 'rejected', 'merged'])[1 + (n - 1) / :repos % 5]::durstatus,
+              md5(:tag || 'u' || (1 + n % :users))::uuid, now() - n * interval '1 second'
+       FROM generate_series(1, :all_durs) n""",
+    """INSERT INTO dur_comments (id, dur_id, user_id, content, created_at)
+       SELECT gen_random_uuid(), md5(:tag || 'p' || (1 + (n - 1) % :all_durs))::uuid,
+              md5(:tag || 'u' || (1 + n % :users))::uuid, 'Looks right ' || n, now() - n * interval '1 second'
+       FROM generate_series(1, :all_comments) n""",
+]
+
+
+@dataclass
+class Dataset:
+    tag: str
+    users: int
+    repos: int
+    members: int
+    docs: int
+    versions: int
+    durs: int
+    comments: int
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, tag: str) -> "Dataset":
+        return cls(tag, args.users, args.repos, args.members, args.docs, args.versions, args.durs, args.comments)
+
+    def _id(self, kind: str, n: int) -> uuid.UUID:
+        return uuid.UUID(hashlib.md5(f"{self.tag}{kind}{n}".encode()).hexdigest())
+
+    # Users, repositories, documents and DURs are numbered from 1.
+    def user_id(self, n: int) -> uuid.UUID:
+        return self._id("u", n)
+
+    def username(self, n: int) -> str:
+        return f"bench-{self.tag}-{n}"
+
+    def repo_slug(self, r: int) -> str:
+        return f"bench-{self.tag}-{r}"
+
+    def is_public(self, r: int) -> bool:
+        return r % 2 == 0
+
+    def owner(self, r: int) -> int:
+        return 1 + r % self.users
+
+    def member(self, r: int, k: int) -> int:
+        """The ``k``-th member (1-based) of repository ``r``; their role is
+        ``MEMBER_ROLES[k % 3]``."""
+        return 1 + (r + 97 * k) % self.users
+
+    def doc_slug(self, r: int, j: int) -> str:
+        """Slug of the ``j``-th document (0-based) of repository ``r``."""
+        return f"doc-{r + self.repos * j}"
+
+    def doc_id(self, r: int, j: int) -> uuid.UUID:
+        return self._id("d", r + self.repos * j)
+
+    def dur_id(self, r: int, j: int) -> uuid.UUID:
+        """The ``j``-th DUR (0-based) of repository ``r``; open if ``j % 5 == 0``."""
+        return self._id("p", r + self.repos * j)
+
+
+def add_arguments(parser: argparse.ArgumentParser, **defaults) -> None:
+    sizes = dict(users=20_000, repos=20_000, members=4, docs=10, versions=5, durs=3, comments=4)
+    sizes.update(defaults)
+    parser.add_argument("--users", type=int, default=sizes["users"])
+    parser.add_argument("--repos", type=int, default=sizes["repos"])
+    parser.add_argument("--members", type=int, default=sizes["members"], help="members per repository")
+    parser.add_argument("--docs", type=int, default=sizes["docs"], help="documents per repository")
+    parser.add_argument("--versions", type=int, default=sizes["versions"], help="versions per document")
+    parser.add_argument("--durs", type=int, default=sizes["durs"], help="DURs per repository")
+    parser.add_argument("--comments", type=int, default=sizes["comments"], help="comments per DUR")
+
+
+async def exists(dataset: Dataset) -> bool:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(text("SELECT EXISTS (SELECT 1 FROM users WHERE id = :id)"),
+                               {"id": dataset.user_id(1)})
+
+
+async def seed(dataset: Dataset) -> None:
+    params = dict(
+        tag=dataset.tag, users=dataset.users, repos=dataset.repos, members=dataset.members,
+        docs=dataset.docs, versions=dataset.versions,
+        all_docs=dataset.repos * dataset.docs, all_durs=dataset.repos * dataset.durs,
+        all_comments=dataset.repos * dataset.durs * dataset.comments,
+        password=get_password_hash(PASSWORD, settings.BCRYPT_ROUNDS),
+        content=CONTENT, proposed=PROPOSED,
+    )
+    async with AsyncSessionLocal() as db:
+        for statement in SEED_STATEMENTS:
+            await db.execute(text(statement), params)
+        await search_index.rebuild(db)
+        await db.commit()
+    async with async_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
@@ -0,0 +1,143 @@
+"""Cost of idle event streams and the latency of fanning an event out to them.
+
+Starts uvicorn (one worker) in a subprocess and opens ``--streams``
+anonymous event streams on a public repository.  Reports the server's
+memory and CPU while they sit idle for ``--idle`` seconds, the database
+connections they hold, and how long ``--events`` comments take to reach
+every stream.  Run it against a scratch database migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.event_streams --streams 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+from sqlalchemy import text
+
+from app.core.security import create_access_token
+from app.database import SessionLocal
+from app.models.repository import DocRepository
+from app.models.user import User
+from benchmarks.async_db import wait_until_up
+
+
+def seed() -> tuple:
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        user = User(username=f"events-{tag}", email=f"events-{tag}@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        repo = DocRepository(name=f"Events {tag}", slug=f"events-{tag}", is_public=True, owner_id=user.id)
+        db.add(repo)
+        db.commit()
+        return repo.slug, create_access_token(data={"sub": str(user.id)})
+
+
+def server_usage(pid: int) -> tuple:
+    """Resident memory in bytes and CPU seconds of process ``pid``."""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu
+
+
+def connections() -> int:
+    with SessionLocal() as db:
+        return db.scalar(text("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()"))
+
+
+async def listen(client: httpx.AsyncClient, url: str, opened: asyncio.Semaphore, arrivals: dict) -> None:
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        opened.release()
+        async for line in response.aiter_lines():
+            if line.startswith("data: ") and '"id"' in line:
+                comment = json.loads(line[6:])["id"]
+                arrivals.setdefault(comment, []).append(time.perf_counter())
+
+
+async def run(base: str, slug: str, token: str, pid: int, args) -> dict:
+    limits = httpx.Limits(max_connections=args.streams + 10, max_keepalive_connections=10)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=None) as client:
+        auth = {"Authorization": f"Bearer {token}"}
+        doc = (await client.post(f"/api/repos/{slug}/docs", headers=auth,
+                                 json={"title": "Runbook", "current_content": "# Runbook\n"})).json()
+        dur = (await client.post(f"/api/repos/{slug}/durs", headers=auth,
+                                 json={"document_id": doc["id"], "title": "Change",
+                                       "proposed_content": "# Runbook\nStep\n"})).json()
+
+        rss_before, _ = server_usage(pid)
+        connections_before = connections()
+        opened, arrivals = asyncio.Semaphore(0), {}
+        t0 = time.perf_counter()
+        listeners = [asyncio.create_task(listen(client, f"/api/repos/{slug}/events", opened, arrivals))
+                     for _ in range(args.streams)]
+        for _ in range(args.streams):
+            await opened.acquire()
+        open_seconds = time.perf_counter() - t0
+
+        rss_open, cpu_start = server_usage(pid)
+        connections_open = connections()
+        await asyncio.sleep(args.idle)
+        _, cpu_end = server_usage(pid)
+
+        latencies = []
+        for _ in range(args.events):
+            sent = time.perf_counter()
+            comment = (await client.post(f"/api/repos/{slug}/durs/{dur['id']}/comments", headers=auth,
+                                         json={"content": "ping"})).json()
+            while len(arrivals.get(comment["id"], ())) < args.streams:
+                await asyncio.sleep(0.005)
+            times = arrivals[comment["id"]]
+            latencies.append({"first_ms": (min(times) - sent) * 1000, "last_ms": (max(times) - sent) * 1000})
+
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+    return {
+        "streams": args.streams,
+        "open_seconds": round(open_seconds, 2),
+        "rss_per_stream_bytes": (rss_open - rss_before) // args.streams,
+        "idle_cpu_percent": round((cpu_end - cpu_start) / args.idle * 100, 2),
+        "db_connections_added": connections_open - connections_before,
+        "delivery_first_ms_p50": statistics.median(l["first_ms"] for l in latencies),
+        "delivery_all_ms_p50": statistics.median(l["last_ms"] for l in latencies),
+        "delivery_all_ms_max": max(l["last_ms"] for l in latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=2000)
+    parser.add_argument("--idle", type=float, default=30, help="seconds to measure idle CPU over")
+    parser.add_argument("--events", type=int, default=20, help="comments to time delivery of")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    slug, token = seed()
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log"],
+        env=dict(os.environ, ENVIRONMENT="benchmark"),
+    )
+    try:
+        wait_until_up(base, server)
+        print(json.dumps(asyncio.run(run(base, slug, token, server.pid, args)), indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
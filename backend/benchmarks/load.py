@@ -0,0 +1,287 @@
+"""HTTP load test of the API: throughput, latency and SQL queries per endpoint.
+
+Seeds a ``benchmarks.dataset`` (unless ``--tag`` names one seeded earlier),
+starts uvicorn in a subprocess with ``QUERY_COUNT_HEADER`` on, and runs each
+scenario for ``--seconds`` with ``--clients`` concurrent clients, each
+repeating the scenario's session against random repositories:
+
+* ``browse``: a member lists repositories, opens one, lists and reads a
+  document and its history, lists open DURs and searches;
+* ``edit``: the owner reads a document and saves it with ``base_version``,
+  rereading on 409, and now and then creates one;
+* ``review``: an editor proposes a DUR and comments on it, then the owner
+  reads it, its diff and comments and approves or rejects it;
+* ``login``: every client signs in and loads ``/auth/me``, back to back.
+
+Prints JSON with, per scenario and endpoint, request and error counts,
+throughput, p50/p95/p99 latency and mean SQL queries per request (from
+``X-Query-Count``).  ``--output`` also writes it to a file; ``--compare``
+adds the relative change against such a file.  Writes stay in the
+database, so compare runs on freshly seeded databases of the same size:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.load --output before.json
+    # check out the other commit, recreate and migrate the database, then
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.load --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from app.core.security import create_access_token
+from benchmarks import dataset
+from benchmarks.async_db import wait_until_up
+from benchmarks.dataset import CONTENT, Dataset
+
+
+class Recorder:
+    """Latency, status and query count of every request, by endpoint."""
+
+    def __init__(self):
+        self.samples: Dict[str, list] = defaultdict(list)
+        self.tokens: Dict[int, str] = {}
+
+    def auth(self, data: Dataset, user: int) -> dict:
+        if user not in self.tokens:
+            self.tokens[user] = create_access_token(data={"sub": str(data.user_id(user))})
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                   ok=(200, 201, 204), **kwargs) -> Optional[httpx.Response]:
+        """``endpoint`` is the route template the sample is filed under;
+        statuses outside ``ok`` count as errors."""
+        t0 = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.samples[endpoint].append(((time.perf_counter() - t0) * 1000, type(exc).__name__, False, None))
+            return None
+        queries = response.headers.get("X-Query-Count")
+        self.samples[endpoint].append((
+            (time.perf_counter() - t0) * 1000, response.status_code, response.status_code in ok,
+            int(queries) if queries is not None else None,
+        ))
+        return response if response.status_code in ok else None
+
+
+async def browse(rec: Recorder, client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> None:
+    r = rng.randint(1, data.repos)
+    headers = rec.auth(data, data.member(r, 1))
+    repo = f"/api/repos/{data.repo_slug(r)}"
+    doc = f"{repo}/docs/{data.doc_slug(r, rng.randrange(data.docs))}"
+    await rec.call(client, "GET /repos", "GET", "/api/repos", params={"limit": 20}, headers=headers)
+    await rec.call(client, "GET /repos/{slug}", "GET", repo, headers=headers)
+    await rec.call(client, "GET /repos/{slug}/docs", "GET", f"{repo}/docs", params={"limit": 20}, headers=headers)
+    await rec.call(client, "GET /repos/{slug}/docs/{doc}", "GET", doc, headers=headers)
+    await rec.call(client, "GET /repos/{slug}/docs/{doc}/versions", "GET", f"{doc}/versions", headers=headers)
+    await rec.call(client, "GET /repos/{slug}/docs/{doc}/versions/{n}", "GET",
+                   f"{doc}/versions/{rng.randint(1, data.versions)}", headers=headers)
+    await rec.call(client, "GET /repos/{slug}/durs", "GET", f"{repo}/durs", params={"status": "open"}, headers=headers)
+    await rec.call(client, "GET /search", "GET", "/api/search",
+                   params={"q": f"runbook {rng.randint(1, data.repos * data.docs)}"}, headers=headers)
+
+
+async def edit(rec: Recorder, client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> None:
+    r = rng.randint(1, data.repos)
+    headers = rec.auth(data, data.owner(r))
+    repo = f"/api/repos/{data.repo_slug(r)}"
+    doc = f"{repo}/docs/{data.doc_slug(r, rng.randrange(data.docs))}"
+    for _ in range(5):
+        current = await rec.call(client, "GET /repos/{slug}/docs/{doc}", "GET", doc, headers=headers)
+        if current is None:
+            return
+        saved = await rec.call(client, "PUT /repos/{slug}/docs/{doc}", "PUT", doc, ok=(200, 409), headers=headers, json={
+            "current_content": current.json()["current_content"] + f"Checked {rng.random():.6f}\n",
+            "base_version": current.json()["head_version"],
+        })
+        if saved is None or saved.status_code == 200:
+            break
+    if rng.random() < 0.1:
+        await rec.call(client, "POST /repos/{slug}/docs", "POST", f"{repo}/docs", headers=headers,
+                       json={"title": "Load test notes", "current_content": CONTENT})
+
+
+async def review(rec: Recorder, client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> None:
+    r = rng.randint(1, data.repos)
+    editor, owner = rec.auth(data, data.member(r, 1)), rec.auth(data, data.owner(r))
+    durs = f"/api/repos/{data.repo_slug(r)}/durs"
+    created = await rec.call(client, "POST /repos/{slug}/durs", "POST", durs, headers=editor, json={
+        "document_id": str(data.doc_id(r, rng.randrange(data.docs))),
+        "title": "Fix the rollback step",
+        "proposed_content": CONTENT + "Page the on-call before rolling back.\n",
+    })
+    if created is None:
+        return
+    dur = f"{durs}/{created.json()['id']}"
+    await rec.call(client, "POST /repos/{slug}/durs/{id}/comments", "POST", f"{dur}/comments", headers=editor,
+                   json={"content": "Matches the incident timeline."})
+    await rec.call(client, "GET /repos/{slug}/durs/{id}", "GET", dur, headers=owner)
+    await rec.call(client, "GET /repos/{slug}/durs/{id}/diff", "GET", f"{dur}/diff", headers=owner)
+    await rec.call(client, "GET /repos/{slug}/durs/{id}/comments", "GET", f"{dur}/comments", headers=owner)
+    verdict = "approve" if rng.random() < 0.5 else "reject"
+    await rec.call(client, f"POST /repos/{{slug}}/durs/{{id}}/{verdict}", "POST", f"{dur}/{verdict}", headers=owner,
+                   json={"review_comment": "Thanks"})
+
+
+async def login(rec: Recorder, client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> None:
+    signed_in = await rec.call(client, "POST /auth/login", "POST", "/api/auth/login", json={
+        "username": data.username(rng.randint(1, data.users)), "password": dataset.PASSWORD,
+    })
+    if signed_in is not None:
+        await rec.call(client, "GET /auth/me", "GET", "/api/auth/me",
+                       headers={"Authorization": f"Bearer {signed_in.json()['access_token']}"})
+
+
+SCENARIOS: Dict[str, Callable] = {"browse": browse, "edit": edit, "review": review, "login": login}
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    latencies = sorted(sample[0] for sample in samples)
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not sample[2]),
+        "statuses": dict(Counter(str(sample[1]) for sample in samples)),
+        "requests_per_second": round(len(samples) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+async def run_scenario(base: str, name: str, data: Dataset, args) -> dict:
+    session = SCENARIOS[name]
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        async def phase(rec: Recorder, seconds: float, label: str) -> float:
+            deadline = time.perf_counter() + seconds
+
+            async def worker(n: int) -> None:
+                rng = random.Random(f"{args.seed}-{name}-{label}-{n}")
+                while time.perf_counter() < deadline:
+                    await session(rec, client, data, rng)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(worker(n) for n in range(args.clients)))
+            return time.perf_counter() - t0
+
+        await phase(Recorder(), args.warmup, "warmup")
+        rec = Recorder()
+        elapsed = await phase(rec, args.seconds, "measure")
+
+    every = [sample for samples in rec.samples.values() for sample in samples]
+    return {
+        "seconds": round(elapsed, 2),
+        **summarize(every, elapsed),
+        "endpoints": {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(rec.samples.items())},
+    }
+
+
+def change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    """Relative change in percent."""
+    if old is None or new is None or old == 0:
+        return None
+    return round((new - old) / old * 100, 1)
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    keys = ("requests_per_second", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+    changes = {}
+    for name, scenario in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        changes[name] = {key: change(before.get(key), scenario.get(key)) for key in keys}
+        changes[name]["endpoints"] = {
+            endpoint: {key: change(before["endpoints"][endpoint].get(key), stats.get(key)) for key in keys}
+            for endpoint, stats in scenario["endpoints"].items() if endpoint in before["endpoints"]
+        }
+    return {"commit": baseline.get("commit"), "percent_change": changes}
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    dataset.add_arguments(parser)
+    parser.add_argument("--tag", default=None, help="reuse the dataset seeded under this tag, or seed it")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=30, help="measured time per scenario")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured time before each scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the clients' random choices")
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--output", help="also write the report here")
+    parser.add_argument("--compare", help="a report from an earlier run to compare against")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    data = Dataset.from_args(args, args.tag or uuid.uuid4().hex[:8])
+
+    async def prepare() -> Optional[float]:
+        if await dataset.exists(data):
+            return None
+        t0 = time.perf_counter()
+        await dataset.seed(data)
+        return round(time.perf_counter() - t0, 1)
+
+    seeded = asyncio.run(prepare())
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers),
+         "--log-level", "warning", "--no-access-log", "--timeout-keep-alive", "120"],
+        env=dict(os.environ, ENVIRONMENT="benchmark", QUERY_COUNT_HEADER="true"),
+    )
+    try:
+        wait_until_up(base, server)
+        report = {
+            "commit": commit(),
+            "dataset": asdict(data),
+            "seed_seconds": seeded,
+            "clients": args.clients,
+            "workers": args.workers,
+            "scenarios": {name: asyncio.run(run_scenario(base, name, data, args)) for name in scenarios},
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["compared_to"] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Document read latency during a login burst.
+
+Starts uvicorn in a subprocess, measures ``GET /api/repos/{slug}/docs/{doc}``
+latency alone, then again while ``--logins`` clients sign in back to back.
+The burst runs twice: against ``/api/auth/login`` (bcrypt on the process
+pool) and against ``/bench/inline/login``, which checks the password on the
+request threadpool the way login used to.  Run it against a scratch database
+that has been migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.login_storm --logins 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.core.security import create_access_token, get_password_hash, verify_password
+from app.database import SessionLocal, get_async_db
+from app.main import app
+from app.core.blobs import digest
+from app.models.blob import Blob
+from app.models.document import Document
+from app.models.repository import DocRepository
+from app.models.user import User
+from app.schemas.user import LoginRequest, Token
+from benchmarks.async_db import wait_until_up
+
+
+@app.post("/bench/inline/login", response_model=Token, include_in_schema=False)
+async def inline_login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == login_data.username))
+    if not user or not await run_in_threadpool(verify_password, login_data.password, user.hashed_password):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    return Token(access_token=create_access_token(data={"sub": str(user.id)}), refresh_token="")
+
+
+def seed() -> tuple:
+    tag = uuid.uuid4().hex[:8]
+    with SessionLocal() as db:
+        user = User(username=f"storm-{tag}", email=f"storm-{tag}@example.com",
+                    hashed_password=get_password_hash("storm", settings.BCRYPT_ROUNDS))
+        db.add(user)
+        db.flush()
+        repo = DocRepository(name=f"Storm {tag}", slug=f"storm-{tag}", is_public=True, owner_id=user.id)
+        db.add(repo)
+        db.flush()
+        content = "# Readme\n" + "text\n" * 200
+        db.merge(Blob(hash=digest(content), content=content))
+        db.flush()
+        db.add(Document(repo_id=repo.id, title="Readme", slug="readme", content_hash=digest(content),
+                        created_by=user.id))
+        db.commit()
+        return user.username, f"/api/repos/{repo.slug}/docs/readme"
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+async def reads(client: httpx.AsyncClient, url: str, clients: int, seconds: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                response = await client.get(url)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+
+async def logins(client: httpx.AsyncClient, url: str, username: str, clients: int, stop: asyncio.Event) -> dict:
+    statuses: dict = {}
+
+    async def worker():
+        while not stop.is_set():
+            try:
+                response = await client.post(url, json={"username": username, "password": "storm"})
+                status = str(response.status_code)
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return statuses
+
+
+async def run(base: str, username: str, doc_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.readers + args.logins)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        await reads(client, doc_url, args.readers, 1)  # warm up
+        report = {"idle": await reads(client, doc_url, args.readers, args.seconds)}
+        for name, login_url in (("process_pool", "/api/auth/login"), ("inline_threadpool", "/bench/inline/login")):
+            stop = asyncio.Event()
+            storm = asyncio.create_task(logins(client, login_url, username, args.logins, stop))
+            await asyncio.sleep(1)  # let the burst build up
+            read_stats = await reads(client, doc_url, args.readers, args.seconds)
+            stop.set()
+            report[name] = {"reads": read_stats, "login_statuses": await storm}
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=10, help="concurrent document readers")
+    parser.add_argument("--seconds", type=float, default=10, help="read measurement window")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    username, doc_url = seed()
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.login_storm:app", "--port", str(args.port),
+         "--log-level", "warning", "--no-access-log"],
+        env=dict(os.environ, ENVIRONMENT="benchmark"),
+    )
+    try:
+        wait_until_up(base, server)
+        report = asyncio.run(run(base, username, doc_url, args))
+        print(json.dumps({"bcrypt_rounds": settings.BCRYPT_ROUNDS, **report}, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Fails if any API query plans a sequential scan on a large dataset.
+
+Seeds a ``benchmarks.dataset`` into the database at ``DATABASE_URL``, then
+calls every API endpoint in-process, reads and writes alike.  Each SQL
+statement an endpoint issues is captured and run through ``EXPLAIN``; a
+``Seq Scan`` node on a table of ``--min-rows`` rows or more is a failure,
+unless listed in ``EXPECTED_SCANS``.
+
+Deletes also fire foreign key triggers, whose lookups ``EXPLAIN`` does not
+show, so every foreign key must be the leading columns of some index, except
+those referencing tables in ``NEVER_DELETED``.  Exits non-zero on any
+failure.  Run it against a scratch database that has been migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.query_plans --repos 20000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import event, text
+
+from app.core.security import create_access_token
+from app.database import async_engine
+from app.main import app
+from benchmarks import dataset
+from benchmarks.dataset import CONTENT, Dataset
+
+# Referenced rows are never deleted through the API, so the foreign keys
+# pointing at them need no index for the constraint checks.
+NEVER_DELETED = {"users"}
+
+# Scans the planner chooses with every useful index in place, by (step, table).
+EXPECTED_SCANS = {
+    # The GIN index estimates hundreds of hits for any term it has no stats
+    # for, and at that size hashing the visible repositories once is costed
+    # below a primary key lookup per hit.
+    ("search", "repositories"),
+}
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+_statements: ContextVar[Optional[list]] = ContextVar("captured_statements", default=None)
+
+
+def _capture(conn, cursor, statement, parameters, context, executemany):
+    captured = _statements.get()
+    if captured is not None and statement.lstrip().upper().startswith(EXPLAINABLE):
+        captured.append((statement, parameters[0] if executemany else parameters))
+
+
+event.listen(async_engine.sync_engine, "before_cursor_execute", _capture)
+
+
+def steps(data: Dataset) -> list:
+    """``(name, principal, method, path, request kwargs)``; ``{doc}`` style
+    placeholders are filled from earlier responses."""
+    repo, private, doomed = data.repo_slug(2), data.repo_slug(1), data.repo_slug(4)
+    new_user = f"bench-{data.tag}-new"
+    docs = f"/api/repos/{repo}/docs"
+    durs = f"/api/repos/{repo}/durs"
+    ndjson = "".join(json.dumps({"title": f"Imported {i}", "content": CONTENT}) + "\n" for i in range(3))
+    return [
+        ("register", None, "POST", "/api/auth/register",
+         {"json": {"username": new_user, "email": f"{new_user}@example.com", "password": dataset.PASSWORD}}),
+        ("login", None, "POST", "/api/auth/login", {"json": {"username": new_user, "password": dataset.PASSWORD}}),
+        ("refresh", None, "POST", "/api/auth/refresh", {"json": {"refresh_token": "{refresh_token}"}}),
+        ("me", "owner", "GET", "/api/auth/me", {}),
+        ("list users", "admin", "GET", "/api/users", {}),
+        ("list users, page 2", "admin", "GET", "/api/users?cursor={next_cursor}", {}),
+        ("find user", "admin", "GET", f"/api/users?username={data.username(7)}", {}),
+        ("get user", "owner", "GET", f"/api/users/{data.user_id(7)}", {}),
+        ("list repos, anonymous", None, "GET", "/api/repos", {}),
+        ("list repos, page 2", None, "GET", "/api/repos?cursor={next_cursor}", {}),
+        ("list repos, member", "member", "GET", "/api/repos", {}),
+        ("list repos, admin", "admin", "GET", "/api/repos", {}),
+        ("create repo", "owner", "POST", "/api/repos", {"json": {"name": f"Plan {repo}"}}),
+        ("get repo", "member", "GET", f"/api/repos/{private}", {}),
+        ("update repo", "owner", "PUT", f"/api/repos/{repo}", {"json": {"description": "Payments runbooks"}}),
+        ("list members", "owner", "GET", f"/api/repos/{repo}/members?limit=2", {}),
+        ("list members, page 2", "owner", "GET", f"/api/repos/{repo}/members?limit=2&cursor={{next_cursor}}", {}),
+        ("add member", "owner", "POST", f"/api/repos/{repo}/members", {"json": {"user_id": str(data.user_id(11)), "role": "editor"}}),
+        ("remove member", "owner", "DELETE", f"/api/repos/{repo}/members/{data.user_id(11)}", {}),
+        ("list docs", "owner", "GET", f"{docs}?limit=5", {}),
+        ("list docs, page 2", "owner", "GET", f"{docs}?limit=5&excerpt=true&cursor={{next_cursor}}", {}),
+        ("create doc", "owner", "POST", docs, {"json": {"title": "Runbook 2", "current_content": CONTENT}}),
+        ("get doc", "owner", "GET", f"{docs}/{{slug}}", {}),
+        ("update doc", "owner", "PUT", f"{docs}/{{slug}}", {"json": {"current_content": CONTENT + "v2\n", "base_version": 1}}),
+        ("list versions", "owner", "GET", f"{docs}/doc-2/versions?limit=2", {}),
+        ("list versions, page 2", "owner", "GET", f"{docs}/doc-2/versions?limit=2&cursor={{next_cursor}}", {}),
+        ("get version", "owner", "GET", f"{docs}/doc-2/versions/{data.versions}", {}),
+        ("get version, revalidate", "owner", "GET", f"{docs}/doc-2/versions/1", {"headers": {"If-None-Match": '"x"'}}),
+        ("import", "owner", "POST", f"/api/repos/{repo}/import",
+         {"content": ndjson, "headers": {"Content-Type": "application/x-ndjson"}}),
+        ("delete doc", "owner", "DELETE", f"{docs}/imported-0", {}),
+        ("list durs", "owner", "GET", f"{durs}?limit=2", {}),
+        ("list durs, page 2", "owner", "GET", f"{durs}?limit=2&cursor={{next_cursor}}", {}),
+        ("list open durs", "owner", "GET", f"{durs}?status=open", {}),
+        ("list merged durs", "owner", "GET", f"{durs}?status=merged", {}),
+        ("create dur", "member", "POST", durs,
+         {"json": {"document_id": "{doc_id}", "title": "Fix rollback", "proposed_content": CONTENT + "v3\n"}}),
+        ("get dur", "owner", "GET", f"{durs}/{{dur_id}}", {}),
+        ("get dur, revalidate", "owner", "GET", f"{durs}/{{dur_id}}", {"headers": {"If-None-Match": '"x"'}}),
+        ("dur diff", "owner", "GET", f"{durs}/{{dur_id}}/diff", {}),
+        ("add comment", "member", "POST", f"{durs}/{{dur_id}}/comments", {"json": {"content": "Looks right"}}),
+        ("list comments", "owner", "GET", f"{durs}/{{dur_id}}/comments", {}),
+        ("approve dur", "owner", "POST", f"{durs}/{{dur_id}}/approve", {"json": {}}),
+        ("reject dur", "owner", "POST", f"{durs}/{{open_dur_id}}/reject", {"json": {}}),
+        # Selective terms; one matching most of the corpus is better served by
+        # hashing all repositories than by a lookup per hit.
+        ("search", "member", "GET", "/api/search?q=runbook 1234", {}),
+        ("search, anonymous", None, "GET", "/api/search?q=fix step 42&kind=dur", {}),
+        ("search one repo", "owner", "GET", f"/api/search?q=runbook&repo={repo}", {}),
+        ("export", "owner", "GET", f"/api/repos/{repo}/export", {}),
+        ("delete repo", "admin", "DELETE", f"/api/repos/{doomed}", {}),
+    ]
+
+
+def _fill(value, found: dict):
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return value.format(**found)
+    if isinstance(value, dict):
+        return {key: _fill(item, found) for key, item in value.items()}
+    return value
+
+
+def seq_scans(plan: dict, large: dict) -> List[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and large.get(plan["Relation Name"]):
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(seq_scans(child, large))
+    return found
+
+
+async def explain(statement: str, parameters) -> dict:
+    async with async_engine.connect() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        result = await driver.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *(parameters or ()))
+        await conn.rollback()
+    # SQLAlchemy registers a json codec on its asyncpg connections.
+    return result[0]["Plan"]
+
+
+async def unindexed_foreign_keys() -> List[str]:
+    async with async_engine.connect() as conn:
+        rows = (await conn.execute(text("""
+            SELECT c.conrelid::regclass::text, c.conname, c.confrelid::regclass::text
+            FROM pg_constraint c
+            WHERE c.contype = 'f' AND NOT EXISTS (
+                SELECT 1 FROM pg_index i
+                WHERE i.indrelid = c.conrelid
+                  AND (i.indkey::int2[])[0:cardinality(c.conkey) - 1] @> c.conkey
+            )
+        """))).all()
+    return [f"{table}.{name} (references {referenced})" for table, name, referenced in rows
+            if referenced not in NEVER_DELETED]
+
+
+async def run(data: Dataset, min_rows: int) -> dict:
+    async with async_engine.connect() as conn:
+        large = {name: rows >= min_rows for name, rows in (await conn.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        ))).all()}
+
+    tokens = {
+        "admin": create_access_token(data={"sub": str(data.user_id(1))}),
+        "owner": create_access_token(data={"sub": str(data.user_id(data.owner(2)))}),
+        # A member of the private repository 1 as well as the public 2.
+        "member": create_access_token(data={"sub": str(data.user_id(data.member(1, 1)))}),
+    }
+    found = {}
+    problems = []
+    statements = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://plans") as client:
+        for name, principal, method, path, kwargs in steps(data):
+            path = path.format(**found)
+            kwargs = _fill(kwargs, found)
+            headers = kwargs.pop("headers", {})
+            if principal:
+                headers["Authorization"] = f"Bearer {tokens[principal]}"
+            captured = []
+            token = _statements.set(captured)
+            try:
+                response = await client.request(method, path, headers=headers, **kwargs)
+            finally:
+                _statements.reset(token)
+            if response.status_code >= 400:
+                problems.append(f"{name}: {method} {path} returned {response.status_code} {response.text[:200]}")
+                continue
+            if response.headers.get("content-type", "").startswith("application/json") and response.content:
+                body = response.json()
+                if isinstance(body, dict):
+                    found["next_cursor"] = body.get("next_cursor") or found.get("next_cursor", "")
+                    for key in ("refresh_token", "slug"):
+                        if key in body and name != "create repo":
+                            found[key] = body[key]
+                    if name == "create doc":
+                        found["doc_id"] = body["id"]
+                    if name == "create dur":
+                        found["dur_id"] = body["id"]
+                    if name == "list open durs":
+                        found["open_dur_id"] = body["items"][0]["id"]
+            for statement, parameters in captured:
+                statements += 1
+                for table in seq_scans(await explain(statement, parameters), large):
+                    if (name, table) in EXPECTED_SCANS:
+                        continue
+                    problem = f"{name}: Seq Scan on {table}\n    {' '.join(statement.split())[:300]}"
+                    if problem not in problems:
+                        problems.append(problem)
+
+    problems.extend(f"unindexed foreign key {fk}" for fk in await unindexed_foreign_keys())
+    return {"statements": statements, "problems": problems}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    dataset.add_arguments(parser)
+    parser.add_argument("--min-rows", type=int, default=10_000,
+                        help="tables smaller than this may be scanned")
+    args = parser.parse_args()
+
+    data = Dataset.from_args(args, uuid.uuid4().hex[:8])
+
+    async def seed_and_run() -> dict:
+        t0 = time.perf_counter()
+        await dataset.seed(data)
+        seeded = time.perf_counter() - t0
+        return {"seed_seconds": round(seeded, 1), **await run(data, args.min_rows)}
+
+    report = asyncio.run(seed_and_run())
+    print(json.dumps({"seed_seconds": report["seed_seconds"], "statements": report["statements"],
+                      "problems": len(report["problems"])}, indent=2))
+    for problem in report["problems"]:
+        print(problem)
+    sys.exit(1 if report["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
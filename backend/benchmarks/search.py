@@ -0,0 +1,152 @@
+"""Query latency benchmark for the full-text search index.
+
+Seeds a synthetic corpus (100k documents by default) into the database at
+``DATABASE_URL``, indexes it, and times ranked queries through
+``core.search.search`` with the same visibility filter the API uses.
+Run it against a scratch database that has been migrated to head:
+
+    cd backend && DATABASE_URL=postgresql://... python -m benchmarks.search --docs 100000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from app.core import blobs
+from app.core import search as search_index
+from app.database import AsyncSessionLocal
+from app.models.document import Document
+from app.models.repository import DocRepository
+from app.models.user import User
+from app.models import dur  # noqa: register mappers
+from app.routers.repositories import visible_repos_clause
+
+WORDS = (
+    "deploy rollback database replica failover latency cache redis kafka consumer lag "
+    "kubernetes pod node drain certificate rotation backup restore incident postmortem "
+    "alert pager threshold dashboard grafana metrics tracing span ingress nginx tls dns "
+    "terraform module state lock migration schema index vacuum autovacuum bloat queue "
+    "worker retry timeout circuit breaker throttle quota billing invoice customer tenant"
+).split()
+
+# Long tail of rarer terms so that term frequencies follow a Zipf-like curve.
+RARE_WORDS = [f"zx{i:05d}" for i in range(20_000)]
+VOCABULARY = WORDS + RARE_WORDS
+ZIPF_CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+QUERIES = {
+    "single_common": "deploy",
+    "single_rare": "zx04321",
+    "two_rare": "zx00150 zx00151",
+    "phrase": '"circuit breaker"',
+    "or_terms": "failover or zx01000",
+    "negation": "kafka -consumer",
+    "no_match": "xylophone",
+}
+
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=ZIPF_CUM_WEIGHTS, k=words)) + "."
+
+
+async def seed(db, docs: int, repos: int, words: int, seed_value: int) -> tuple:
+    rng = random.Random(seed_value)
+    owner = User(username=f"bench-{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex[:8]}@bench.local",
+                 hashed_password="x")
+    db.add(owner)
+    await db.flush()
+    repo_rows = [
+        dict(id=uuid.uuid4(), name=f"Bench {i}", slug=f"bench-{uuid.uuid4().hex[:12]}",
+             is_public=i % 2 == 0, owner_id=owner.id, created_at=datetime.utcnow())
+        for i in range(repos)
+    ]
+    await db.execute(insert(DocRepository), repo_rows)
+
+    batch, texts = [], {}
+    for i in range(docs):
+        content = "\n\n".join(paragraph(rng, words // 4) for _ in range(4))
+        content_hash = blobs.digest(content)
+        texts[content_hash] = content
+        batch.append(dict(
+            id=uuid.uuid4(),
+            repo_id=repo_rows[i % repos]["id"],
+            title=" ".join(rng.choice(WORDS) for _ in range(4)).title(),
+            slug=f"doc-{i}",
+            content_hash=content_hash,
+            created_by=owner.id,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow(),
+        ))
+        if len(batch) == 5000:
+            await blobs.store(db, texts)
+            await db.execute(insert(Document), batch)
+            batch, texts = [], {}
+    if batch:
+        await blobs.store(db, texts)
+        await db.execute(insert(Document), batch)
+    await db.commit()
+    return owner, [r["id"] for r in repo_rows]
+
+
+async def time_query(db, q: str, visible, samples: int) -> dict:
+    latencies = []
+    hits = 0
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        hits = len(await search_index.search(db, q, visible, limit=20))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return {
+        "hits": hits,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+async def run(args) -> dict:
+    async with AsyncSessionLocal() as db:
+        t0 = time.perf_counter()
+        owner, _ = await seed(db, args.docs, args.repos, args.words, args.seed)
+        seed_seconds = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        await search_index.rebuild(db)
+        await db.commit()
+        index_seconds = time.perf_counter() - t0
+        await db.execute(text("ANALYZE search_entries"))
+
+        report = {
+            "documents": args.docs,
+            "seed_seconds": seed_seconds,
+            "index_seconds": index_seconds,
+            "anonymous": {},
+            "owner": {},
+        }
+        for name, q in QUERIES.items():
+            report["anonymous"][name] = await time_query(db, q, visible_repos_clause(None), args.samples)
+            report["owner"][name] = await time_query(db, q, visible_repos_clause(owner), args.samples)
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--repos", type=int, default=200)
+    parser.add_argument("--words", type=int, default=200, help="words per document body")
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Storage and reconstruction benchmark for core.version_store.
+
+Simulates a runbook edited many times with small changes and reports the
+bytes stored per version against full-text storage, plus the latency of
+rebuilding random versions from their snapshot chain.
+
+    cd backend && python -m benchmarks.version_store --versions 500
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from app.core.version_store import SNAPSHOT, encode_version, hydrate
+
+
+def evolve(rng: random.Random, lines: list[str]) -> list[str]:
+    lines = list(lines)
+    for _ in range(rng.randint(1, 4)):
+        action = rng.random()
+        pos = rng.randrange(len(lines) + 1)
+        if action < 0.5 or not lines:
+            lines.insert(pos, f"- step {rng.randrange(10**6)}: check service health and logs\n")
+        elif action < 0.8:
+            lines[min(pos, len(lines) - 1)] = f"Updated note {rng.randrange(10**6)}\n"
+        else:
+            del lines[min(pos, len(lines) - 1)]
+    return lines
+
+
+def build_history(versions: int, initial_lines: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    lines = [f"Line {i} of the on-call runbook with some descriptive text.\n" for i in range(initial_lines)]
+    history = []
+    for _ in range(versions):
+        lines = evolve(rng, lines)
+        history.append("".join(lines))
+    return history
+
+
+def run(versions: int, initial_lines: int, samples: int, seed: int) -> dict:
+    history = build_history(versions, initial_lines, seed)
+
+    rows = []
+    previous = None
+    start = time.perf_counter()
+    for number, content in enumerate(history, start=1):
+        storage, payload = encode_version(number, content, previous)
+        rows.append(SimpleNamespace(version_number=number, storage=storage, payload=payload, content=None))
+        previous = content
+    encode_seconds = time.perf_counter() - start
+
+    full_bytes = sum(len(c.encode("utf-8")) for c in history)
+    stored_bytes = sum(len(r.payload) for r in rows)
+
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(samples):
+        target = rng.randrange(versions)
+        base = max(i for i in range(target + 1) if rows[i].storage == SNAPSHOT)
+        chain = [SimpleNamespace(**vars(r)) for r in rows[base:target + 1]]
+        t0 = time.perf_counter()
+        hydrate(chain)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert chain[-1].content == history[target]
+
+    latencies.sort()
+    return {
+        "versions": versions,
+        "snapshots": sum(1 for r in rows if r.storage == SNAPSHOT),
+        "avg_document_bytes": full_bytes // versions,
+        "full_bytes_per_version": full_bytes / versions,
+        "stored_bytes_per_version": stored_bytes / versions,
+        "compression_ratio": full_bytes / stored_bytes,
+        "encode_ms_per_version": encode_seconds * 1000 / versions,
+        "reconstruct_ms_p50": statistics.median(latencies),
+        "reconstruct_ms_p99": latencies[int(len(latencies) * 0.99) - 1],
+        "reconstruct_ms_max": latencies[-1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int, default=500)
+    parser.add_argument("--initial-lines", type=int, default=400)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.versions, args.initial_lines, args.samples, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
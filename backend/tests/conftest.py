@@ -0,0 +1,49 @@
+"""Tests run against the Postgres database at ``TEST_DATABASE_URL``, which
+they migrate to head and write to; they are skipped when it is not set:
+
+    cd backend && TEST_DATABASE_URL=postgresql://... python -m pytest
+"""
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # Read once, when app.config is first imported.
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="session")
+def database() -> str:
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(BACKEND / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND / "alembic"))
+    command.upgrade(config, "head")
+    return TEST_DATABASE_URL
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def notifications(database):
+    """The worker's LISTEN connection, up, so the shared caches are in use."""
+    from app.core.notify import listener
+    from app.database import async_engine
+
+    listener.start()
+    for _ in range(100):
+        if listener.connected:
+            break
+        await asyncio.sleep(0.05)
+    else:
+        pytest.fail("LISTEN connection did not come up")
+    yield listener
+    await listener.stop()
+    await async_engine.dispose()
@@ -0,0 +1,37 @@
+"""Diffs past ``DIFF_MAX_EDITS`` fall back to a single replacement."""
+import time
+
+from app.config import settings
+from app.core.diff import compute, opcodes
+
+
+def test_small_change_is_exact(monkeypatch):
+    monkeypatch.setattr(settings, "DIFF_MAX_EDITS", 4)
+    a = [f"line {i}" for i in range(100)]
+    b = list(a)
+    b[10], b[80] = "changed", "changed too"
+    assert [code for code in opcodes(a, b) if code[0] != "equal"] == [
+        ("replace", 10, 11, 10, 11),
+        ("replace", 80, 81, 80, 81),
+    ]
+
+
+def test_rewrite_past_cap_is_one_replacement(monkeypatch):
+    monkeypatch.setattr(settings, "DIFF_MAX_EDITS", 4)
+    a = ["same"] + [f"old {i}" for i in range(50)] + ["end"]
+    b = ["same"] + [f"new {i}" if i % 3 != 2 else f"old {i}" for i in range(50)] + ["end"]
+    assert opcodes(a, b) == [("equal", 0, 1, 0, 1), ("replace", 1, 51, 1, 51), ("equal", 51, 52, 51, 52)]
+
+    result = compute("\n".join(a), "\n".join(b), context=1)
+    assert (result["additions"], result["deletions"]) == (50, 50)
+    [hunk] = result["hunks"]
+    assert (hunk["old_start"], hunk["old_lines"], hunk["new_start"], hunk["new_lines"]) == (1, 52, 1, 52)
+
+
+def test_large_rewrite_is_bounded():
+    old = "\n".join(f"old line {i}" for i in range(5000))
+    new = "\n".join(f"new line {i}" for i in range(5000))
+    started = time.perf_counter()
+    result = compute(old, new)
+    assert time.perf_counter() - started < 2
+    assert (result["additions"], result["deletions"], len(result["hunks"])) == (5000, 5000, 1)
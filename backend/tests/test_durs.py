@@ -0,0 +1,121 @@
+"""Concurrent reviews and edits of one document keep its history numbered
+``1..head_version``: a DUR merges once however many approvals race for it,
+and each accepted edit gets its own version number.
+"""
+import asyncio
+import uuid
+from dataclasses import dataclass
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import select
+from starlette.requests import Request
+
+from app.core.principals import Principal
+from app.database import AsyncSessionLocal
+from app.models.document import Document, DocumentVersion
+from app.models.dur import DUR, DURStatus
+from app.models.repository import DocRepository
+from app.models.user import User
+from app.routers.documents import create_doc, update_doc
+from app.routers.durs import approve_dur, create_dur, reject_dur
+from app.schemas.document import DocumentCreate, DocumentUpdate
+from app.schemas.dur import DURCreate, DURReview
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+REVIEWERS = 6
+WRITERS = 6
+
+
+@dataclass
+class World:
+    repo: DocRepository
+    owner: Principal
+    doc: Document
+    dur: DUR
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def world(database) -> World:
+    tag = uuid.uuid4().hex[:8]
+    async with AsyncSessionLocal() as db:
+        user = User(username=f"reviewer-{tag}", email=f"reviewer-{tag}@example.com", hashed_password="-")
+        db.add(user)
+        await db.flush()
+        repo = DocRepository(name=f"Reviews {tag}", slug=f"reviews-{tag}", owner_id=user.id)
+        db.add(repo)
+        await db.commit()
+        owner = Principal.from_user(user)
+    async with AsyncSessionLocal() as db:
+        doc = await create_doc(repo.slug, DocumentCreate(title="Racy", current_content="v1\n"),
+                               db=db, current_user=owner)
+    async with AsyncSessionLocal() as db:
+        dur = await create_dur(repo.slug, DURCreate(title="Merge me", proposed_content="merged\n", document_id=doc.id),
+                               db=db, current_user=owner)
+    return World(repo, owner, doc, dur)
+
+
+def _request() -> Request:
+    return Request({"type": "http", "method": "PUT", "headers": []})
+
+
+async def _outcome(review, world: World) -> str:
+    async with AsyncSessionLocal() as db:
+        try:
+            await review(world.repo.slug, world.dur.id, DURReview(), db=db, current_user=world.owner)
+        except HTTPException as exc:
+            assert exc.status_code == 400
+            return "refused"
+    return review.__name__
+
+
+async def _edit(world: World, n: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await update_doc(world.repo.slug, world.doc.slug, DocumentUpdate(current_content=f"edit {n}\n"),
+                         _request(), db=db, current_user=world.owner)
+
+
+async def _history(world: World) -> tuple:
+    async with AsyncSessionLocal() as db:
+        doc = await db.get(Document, world.doc.id)
+        numbers = (await db.scalars(
+            select(DocumentVersion.version_number)
+            .where(DocumentVersion.document_id == world.doc.id)
+            .order_by(DocumentVersion.version_number)
+        )).all()
+        messages = (await db.scalars(
+            select(DocumentVersion.commit_message).where(DocumentVersion.document_id == world.doc.id)
+        )).all()
+        dur = await db.get(DUR, world.dur.id)
+        return doc.head_version, numbers, messages, dur.status
+
+
+async def test_concurrent_approvals_merge_once(world: World):
+    results = await asyncio.gather(
+        *(_outcome(approve_dur, world) for _ in range(REVIEWERS)),
+        *(_edit(world, n) for n in range(WRITERS)),
+    )
+    assert sorted(results[:REVIEWERS]) == ["approve_dur"] + ["refused"] * (REVIEWERS - 1)
+
+    head, numbers, messages, status = await _history(world)
+    assert status == DURStatus.merged
+    assert numbers == list(range(1, head + 1))
+    assert head == 1 + WRITERS + 1
+    assert messages.count("Merged DUR: Merge me") == 1
+
+
+async def test_approval_races_rejection(world: World):
+    results = await asyncio.gather(
+        *(_outcome(review, world) for _ in range(REVIEWERS) for review in (approve_dur, reject_dur)),
+    )
+    decided = [result for result in results if result != "refused"]
+    assert len(decided) == 1
+
+    head, numbers, _, status = await _history(world)
+    assert numbers == list(range(1, head + 1))
+    if decided == ["approve_dur"]:
+        assert (status, head) == (DURStatus.merged, 2)
+    else:
+        assert (status, head) == (DURStatus.rejected, 1)
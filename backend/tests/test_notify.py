@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.core import permissions
+from app.core.notify import Listener, listen_dsn
+from app.core.permissions import _MISSING, PermissionCache
+from app.models.repository import MemberRole
+
+
+def test_listens_on_database_url_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", "postgresql://app@db/dochub")
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", False)
+    monkeypatch.setattr(settings, "DB_LISTEN_URL", None)
+    assert listen_dsn() == "postgresql://app@db/dochub"
+
+
+def test_listens_on_direct_url_behind_pgbouncer(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", "postgresql://app@pgbouncer/dochub")
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+    monkeypatch.setattr(settings, "DB_LISTEN_URL", "postgresql+psycopg2://app@db/dochub")
+    assert listen_dsn() == "postgresql://app@db/dochub"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_caches_stay_off_behind_pgbouncer_without_listen_url(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", "postgresql://app@pgbouncer/dochub")
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+    monkeypatch.setattr(settings, "DB_LISTEN_URL", None)
+    listener = Listener(listen_dsn())
+    listener.start()
+    await asyncio.sleep(0.05)
+    assert not listener.connected
+
+    monkeypatch.setattr(permissions, "listener", listener)
+    cache = PermissionCache(maxsize=10, ttl=60)
+    assert not cache.enabled
+    cache.put(("repo", "user"), MemberRole.admin, cache.generation)
+    assert cache.get(("repo", "user")) is _MISSING
+    await listener.stop()
@@ -0,0 +1,23 @@
+import os
+import signal
+
+import pytest
+
+from app.core.passwords import PasswordHasher
+from app.core.security import verify_password
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+async def test_hashing_survives_a_dead_worker():
+    hasher = PasswordHasher(workers=1, max_queue=4, rounds=4)
+    try:
+        assert await hasher.verify("secret", await hasher.hash("secret"))
+        broken = hasher._executor
+        for process in list(broken._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        hashed = await hasher.hash("secret")
+        assert verify_password("secret", hashed)
+        assert hasher._executor is not broken
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,150 @@
+"""Revoking access takes effect on the very next access check.
+
+Each revocation is checked three ways: later in the same request (the
+session memo), in the next request on the same worker before any
+notification arrives (the shared cache, evicted directly), and in the next
+request on a worker that only learns of it through
+``NOTIFY repo_access_changed``.
+"""
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from app.core.notify import listener
+from app.core.permissions import _MISSING, REPO_CHANNEL, permission_cache
+from app.core.principals import Principal
+from app.database import AsyncSessionLocal
+from app.models.repository import DocRepository, MemberRole, RepositoryMember
+from app.models.user import User
+from app.routers.repositories import (
+    add_member, check_repo_access, delete_repo, get_repo_or_404, remove_member, require_repo_role, update_repo,
+)
+from app.schemas.repository import MemberAdd, RepositoryUpdate
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+NOTIFY_TIMEOUT = 5
+
+
+@dataclass
+class World:
+    repo: DocRepository
+    owner: Principal
+    user: Principal
+
+    @property
+    def key(self):
+        return (str(self.repo.id), str(self.user.id))
+
+
+@dataclass
+class Revocation:
+    name: str
+    public: bool
+    # The user's role before, or None for a non-member.
+    role: Optional[MemberRole]
+    # The least role the check asks for, or None for read access.
+    needs: Optional[MemberRole]
+    revoke: Callable[..., Awaitable[None]]
+
+
+async def _remove(db, world: World) -> None:
+    await remove_member(world.repo.slug, world.user.id, db=db, current_user=world.owner)
+
+
+async def _downgrade(db, world: World) -> None:
+    await add_member(world.repo.slug, MemberAdd(user_id=world.user.id, role=MemberRole.viewer),
+                     db=db, current_user=world.owner)
+
+
+async def _make_private(db, world: World) -> None:
+    await update_repo(world.repo.slug, RepositoryUpdate(is_public=False), db=db, current_user=world.owner)
+
+
+async def _delete(db, world: World) -> None:
+    await delete_repo(world.repo.slug, db=db, current_user=world.owner)
+
+
+REVOCATIONS = [
+    Revocation("remove_member", public=False, role=MemberRole.viewer, needs=None, revoke=_remove),
+    Revocation("downgrade", public=False, role=MemberRole.editor, needs=MemberRole.editor, revoke=_downgrade),
+    Revocation("make_private", public=True, role=None, needs=None, revoke=_make_private),
+    Revocation("delete_repo", public=False, role=MemberRole.viewer, needs=None, revoke=_delete),
+]
+
+
+@pytest.fixture(params=REVOCATIONS, ids=lambda r: r.name)
+def revocation(request) -> Revocation:
+    return request.param
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def world(notifications, revocation: Revocation) -> World:
+    tag = uuid.uuid4().hex[:8]
+    async with AsyncSessionLocal() as db:
+        owner = User(username=f"owner-{tag}", email=f"owner-{tag}@example.com", hashed_password="-")
+        user = User(username=f"user-{tag}", email=f"user-{tag}@example.com", hashed_password="-")
+        db.add_all([owner, user])
+        await db.flush()
+        repo = DocRepository(name=f"Perm {tag}", slug=f"perm-{tag}", is_public=revocation.public, owner_id=owner.id)
+        db.add(repo)
+        await db.flush()
+        if revocation.role is not None:
+            db.add(RepositoryMember(repo_id=repo.id, user_id=user.id, role=revocation.role))
+        await db.commit()
+        return World(repo, Principal.from_user(owner), Principal.from_user(user))
+
+
+async def allowed(db, world: World, revocation: Revocation) -> bool:
+    try:
+        repo = await get_repo_or_404(world.repo.slug, db)
+        if revocation.needs is None:
+            await check_repo_access(repo, world.user, db)
+        else:
+            await require_repo_role(repo, world.user, db, revocation.needs)
+    except HTTPException as exc:
+        assert exc.status_code in (403, 404)
+        return False
+    return True
+
+
+async def test_revocation_in_same_request(world: World, revocation: Revocation):
+    async with AsyncSessionLocal() as db:
+        assert await allowed(db, world, revocation)
+        await revocation.revoke(db, world)
+        assert not await allowed(db, world, revocation)
+
+
+async def test_revocation_in_next_request(world: World, revocation: Revocation, monkeypatch):
+    async with AsyncSessionLocal() as db:
+        assert await allowed(db, world, revocation)
+    assert permission_cache.get(world.key) is not _MISSING
+    # Only the direct eviction may help; the notification can lag the commit.
+    monkeypatch.setitem(listener._handlers, REPO_CHANNEL, [])
+    async with AsyncSessionLocal() as db:
+        await revocation.revoke(db, world)
+    async with AsyncSessionLocal() as db:
+        assert not await allowed(db, world, revocation)
+
+
+async def test_revocation_from_another_worker(world: World, revocation: Revocation, monkeypatch):
+    async with AsyncSessionLocal() as db:
+        assert await allowed(db, world, revocation)
+    # As if another worker made the change: only the notification evicts here.
+    skipped = []
+    monkeypatch.setattr(permission_cache, "evict", skipped.append)
+    async with AsyncSessionLocal() as db:
+        await revocation.revoke(db, world)
+    assert skipped
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + NOTIFY_TIMEOUT
+    while permission_cache.get(world.key) is not _MISSING:
+        assert loop.time() < deadline, "NOTIFY repo_access_changed never arrived"
+        await asyncio.sleep(0.01)
+    async with AsyncSessionLocal() as db:
+        assert not await allowed(db, world, revocation)
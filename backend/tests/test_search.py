@@ -0,0 +1,38 @@
+import io
+import json
+import random
+import string
+import uuid
+
+import pytest
+
+from app.config import settings
+from app.core.importer import import_documents, read_ndjson
+from app.core.search import search
+from app.database import AsyncSessionLocal
+from app.models.repository import DocRepository
+from app.models.user import User
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+async def test_best_hit_survives_the_candidate_cap(database, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_MAX_CANDIDATES", 5)
+    word = "".join(random.choices(string.ascii_lowercase, k=12))
+    tag = uuid.uuid4().hex[:8]
+    # The best hit sits in the middle of the table, away from either end a scan may start at.
+    lines = [{"title": f"Note {n}", "content": f"{word}\n" + "filler text\n" * 50} for n in range(30)]
+    lines.insert(15, {"title": f"{word} {word}", "content": f"{word} {word} {word}\n"})
+    async with AsyncSessionLocal() as db:
+        user = User(username=f"search-{tag}", email=f"search-{tag}@example.com", hashed_password="-")
+        db.add(user)
+        await db.flush()
+        repo = DocRepository(name=f"Search {tag}", slug=f"search-{tag}", owner_id=user.id)
+        db.add(repo)
+        await db.commit()
+        upload = io.StringIO("".join(json.dumps(line) + "\n" for line in lines))
+        await import_documents(db, repo.id, user.id, upload, read_ndjson)
+
+        hits = await search(db, word, DocRepository.id == repo.id, kind="document")
+    assert len(hits) == 5
+    assert hits[0].document_title == f"{word} {word}"
@@ -0,0 +1,29 @@
+// Writes .br and .gz siblings for compressible build output so the backend
+// can serve them without compressing on every request. Runs after `vite build`.
+import { readdir, readFile, stat, writeFile } from 'node:fs/promises'
+import { join, extname } from 'node:path'
+import { brotliCompressSync, gzipSync, constants } from 'node:zlib'
+
+const DIST = new URL('../dist/', import.meta.url).pathname
+const EXTENSIONS = new Set(['.js', '.css', '.html', '.svg', '.json', '.txt', '.map'])
+const MIN_SIZE = 1024
+
+async function* files(dir) {
+  for (const entry of await readdir(dir, { withFileTypes: true })) {
+    const path = join(dir, entry.name)
+    if (entry.isDirectory()) yield* files(path)
+    else yield path
+  }
+}
+
+let count = 0
+for await (const path of files(DIST)) {
+  if (!EXTENSIONS.has(extname(path)) || (await stat(path)).size < MIN_SIZE) continue
+  const body = await readFile(path)
+  await writeFile(`${path}.br`, brotliCompressSync(body, {
+    params: { [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY },
+  }))
+  await writeFile(`${path}.gz`, gzipSync(body, { level: 9 }))
+  count++
+}
+console.log(`precompressed ${count} files in dist/`)
@@ -0,0 +1,20 @@
+import { Button } from './ui/button'
+
+export function LoadMore({
+  hasNextPage,
+  isFetchingNextPage,
+  fetchNextPage,
+}: {
+  hasNextPage: boolean
+  isFetchingNextPage: boolean
+  fetchNextPage: () => unknown
+}) {
+  if (!hasNextPage) return null
+  return (
+    <div className="py-3 text-center">
+      <Button variant="outline" size="sm" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+        {isFetchingNextPage ? 'Loading...' : 'Load more'}
+      </Button>
+    </div>
+  )
+}
@@ -1,22 +1,29 @@
 import { useState } from 'react'
-import { marked } from 'marked'
+import { useQuery } from '@tanstack/react-query'
+import { docApi } from '../lib/api'
 import { Button } from './ui/button'
 import { Textarea } from './ui/textarea'
 import { Eye, Edit2 } from 'lucide-react'
 
 interface MarkdownEditorProps {
+  // Repository the text belongs to; previews are rendered by its server.
+  repoSlug: string
   value: string
   onChange: (value: string) => void
   placeholder?: string
   minHeight?: string
 }
 
-export function MarkdownEditor({ value, onChange, placeholder, minHeight = '300px' }: MarkdownEditorProps) {
+export function MarkdownEditor({ repoSlug, value, onChange, placeholder, minHeight = '300px' }: MarkdownEditorProps) {
   const [preview, setPreview] = useState(false)
 
-  const getHtml = () => {
-    return { __html: marked(value) as string }
-  }
+  // Rendered the same way, and with the same sanitizing, as the document view.
+  const { data: rendered, isLoading } = useQuery({
+    queryKey: ['preview', repoSlug, value],
+    queryFn: () => docApi.preview(repoSlug, value).then(r => r.data),
+    enabled: preview,
+    staleTime: Infinity,
+  })
 
   return (
     <div className="border rounded-md overflow-hidden">
@@ -45,11 +52,15 @@ export function MarkdownEditor({ value, onChange, placeholder, minHeight = '300p
         </Button>
       </div>
       {preview ? (
-        <div
-          className="markdown-content p-4 min-h-[200px]"
-          style={{ minHeight }}
-          dangerouslySetInnerHTML={getHtml()}
-        />
+        isLoading ? (
+          <div className="p-4 text-sm text-muted-foreground" style={{ minHeight }}>Rendering...</div>
+        ) : (
+          <div
+            className="markdown-content p-4 min-h-[200px]"
+            style={{ minHeight }}
+            dangerouslySetInnerHTML={{ __html: rendered?.html ?? '' }}
+          />
+        )
       ) : (
         <Textarea
           value={value}
@@ -0,0 +1,26 @@
+import { useInfiniteQuery, type QueryKey } from '@tanstack/react-query'
+import type { AxiosResponse } from 'axios'
+
+export interface Page<T> {
+  items: T[]
+  next_cursor: string | null
+}
+
+// Cursor-paginated list endpoints: follows next_cursor and flattens the loaded pages
+export function usePaginated<T = any>(
+  queryKey: QueryKey,
+  fetchPage: (cursor?: string) => Promise<AxiosResponse<Page<T>>>,
+  enabled = true,
+  refetchOnWindowFocus = true,
+) {
+  const query = useInfiniteQuery({
+    queryKey,
+    queryFn: ({ pageParam }) => fetchPage(pageParam).then(r => r.data),
+    initialPageParam: undefined as string | undefined,
+    getNextPageParam: (last: Page<T>) => last.next_cursor ?? undefined,
+    enabled,
+    refetchOnWindowFocus,
+  })
+  const items: T[] = query.data?.pages.flatMap(p => p.items) ?? []
+  return { ...query, items }
+}
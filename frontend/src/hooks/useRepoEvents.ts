@@ -0,0 +1,102 @@
+import { useEffect, useState } from 'react'
+import { useQueryClient, type QueryClient } from '@tanstack/react-query'
+import { eventsUrl } from '../lib/api'
+
+const RETRY_MS = 3000
+
+type RepoEvent = { event: string; data: any }
+
+function apply(queryClient: QueryClient, slug: string, { event, data }: RepoEvent) {
+  const invalidate = (...queryKey: unknown[]) => queryClient.invalidateQueries({ queryKey })
+  switch (event) {
+    case 'comment':
+      invalidate('dur-comments', slug, data.dur_id)
+      break
+    case 'dur':
+      invalidate('dur', slug, data.id)
+      invalidate('dur-diff', slug, data.id)
+      invalidate('repo-durs', slug)
+      invalidate('durs', slug)
+      break
+    case 'document':
+      invalidate('doc', slug, data.slug)
+      invalidate('doc-versions', slug, data.slug)
+      invalidate('repo-docs', slug)
+      invalidate('docs', slug)
+      // Open DURs are diffed against the document's current text.
+      invalidate('dur-diff', slug)
+      break
+    default:
+      // 'reset': events were lost, so anything shown may be stale.
+      queryClient.invalidateQueries({ predicate: q => q.queryKey[1] === slug })
+  }
+}
+
+function parse(frame: string): RepoEvent | null {
+  let event = 'message'
+  const data: string[] = []
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data.push(line.slice(5).trim())
+  }
+  return data.length ? { event, data: JSON.parse(data.join('\n')) } : null
+}
+
+// Keeps the repository's queries fresh from its event stream while mounted.
+// Returns whether the stream is connected; pages only refetch on focus while it is not.
+export function useRepoEvents(slug: string | undefined) {
+  const queryClient = useQueryClient()
+  const [live, setLive] = useState(false)
+
+  useEffect(() => {
+    if (!slug) return
+    const abort = new AbortController()
+    let connectedBefore = false
+
+    // fetch rather than EventSource, which cannot send the Authorization header.
+    async function connect() {
+      while (!abort.signal.aborted) {
+        try {
+          const token = localStorage.getItem('access_token')
+          const response = await fetch(eventsUrl(slug!), {
+            headers: token ? { Authorization: `Bearer ${token}` } : {},
+            signal: abort.signal,
+          })
+          // Access revoked or repository deleted: refetching lets the page say so.
+          if (response.status === 403 || response.status === 404) {
+            apply(queryClient, slug!, { event: 'reset', data: {} })
+            return
+          }
+          if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`)
+          setLive(true)
+          // Whatever happened while disconnected was missed.
+          if (connectedBefore) apply(queryClient, slug!, { event: 'reset', data: {} })
+          connectedBefore = true
+
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+          let buffer = ''
+          for (;;) {
+            const { value, done } = await reader.read()
+            if (done) break
+            buffer += value.replace(/\r\n?/g, '\n')
+            let end
+            while ((end = buffer.indexOf('\n\n')) >= 0) {
+              const parsed = parse(buffer.slice(0, end))
+              buffer = buffer.slice(end + 2)
+              if (parsed) apply(queryClient, slug!, parsed)
+            }
+          }
+        } catch {
+          // Aborted on unmount, or the stream failed; retried below.
+        }
+        setLive(false)
+        if (!abort.signal.aborted) await new Promise(resolve => setTimeout(resolve, RETRY_MS))
+      }
+    }
+
+    connect()
+    return () => abort.abort()
+  }, [slug, queryClient])
+
+  return live
+}
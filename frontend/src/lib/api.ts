@@ -2,6 +2,13 @@ import axios from 'axios'
 
 const BASE_URL = import.meta.env.VITE_API_URL || ''
 
+export type PageParams = { cursor?: string; limit?: number }
+
+// 'html' adds the server-rendered, sanitized body and its table of contents.
+export type FormatParams = { format?: 'markdown' | 'html' }
+
+export type TocEntry = { level: number; text: string; id: string }
+
 export const api = axios.create({
   baseURL: BASE_URL,
   headers: {
@@ -62,14 +69,14 @@ export const authApi = {
 
 // Repositories
 export const repoApi = {
-  list: () => api.get('/api/repos'),
+  list: (params?: PageParams) => api.get('/api/repos', { params }),
   create: (data: { name: string; slug?: string; description?: string; is_public: boolean }) =>
     api.post('/api/repos', data),
   get: (slug: string) => api.get(`/api/repos/${slug}`),
   update: (slug: string, data: { name?: string; description?: string; is_public?: boolean }) =>
     api.put(`/api/repos/${slug}`, data),
   delete: (slug: string) => api.delete(`/api/repos/${slug}`),
-  getMembers: (slug: string) => api.get(`/api/repos/${slug}/members`),
+  getMembers: (slug: string, params?: PageParams) => api.get(`/api/repos/${slug}/members`, { params }),
   addMember: (slug: string, data: { user_id: string; role: string }) =>
     api.post(`/api/repos/${slug}/members`, data),
   removeMember: (slug: string, userId: string) =>
@@ -78,41 +85,48 @@ export const repoApi = {
 
 // Documents
 export const docApi = {
-  list: (repoSlug: string) => api.get(`/api/repos/${repoSlug}/docs`),
+  list: (repoSlug: string, params?: PageParams) => api.get(`/api/repos/${repoSlug}/docs`, { params }),
   create: (repoSlug: string, data: { title: string; slug?: string; current_content: string }) =>
     api.post(`/api/repos/${repoSlug}/docs`, data),
-  get: (repoSlug: string, docSlug: string) =>
-    api.get(`/api/repos/${repoSlug}/docs/${docSlug}`),
-  update: (repoSlug: string, docSlug: string, data: { title?: string; current_content?: string; commit_message?: string }) =>
+  get: (repoSlug: string, docSlug: string, params?: FormatParams) =>
+    api.get(`/api/repos/${repoSlug}/docs/${docSlug}`, { params }),
+  update: (repoSlug: string, docSlug: string, data: { title?: string; current_content?: string; commit_message?: string; base_version?: number }) =>
     api.put(`/api/repos/${repoSlug}/docs/${docSlug}`, data),
   delete: (repoSlug: string, docSlug: string) =>
     api.delete(`/api/repos/${repoSlug}/docs/${docSlug}`),
-  getVersions: (repoSlug: string, docSlug: string) =>
-    api.get(`/api/repos/${repoSlug}/docs/${docSlug}/versions`),
-  getVersion: (repoSlug: string, docSlug: string, versionNumber: number) =>
-    api.get(`/api/repos/${repoSlug}/docs/${docSlug}/versions/${versionNumber}`),
+  getVersions: (repoSlug: string, docSlug: string, params?: PageParams) =>
+    api.get(`/api/repos/${repoSlug}/docs/${docSlug}/versions`, { params }),
+  getVersion: (repoSlug: string, docSlug: string, versionNumber: number, params?: FormatParams) =>
+    api.get(`/api/repos/${repoSlug}/docs/${docSlug}/versions/${versionNumber}`, { params }),
+  preview: (repoSlug: string, content: string) =>
+    api.post<{ html: string; toc: TocEntry[] }>(`/api/repos/${repoSlug}/preview`, { content }),
 }
 
 // DURs
 export const durApi = {
-  list: (repoSlug: string, status?: string) =>
-    api.get(`/api/repos/${repoSlug}/durs`, { params: status ? { status } : {} }),
+  list: (repoSlug: string, status?: string, params?: PageParams) =>
+    api.get(`/api/repos/${repoSlug}/durs`, { params: { ...params, ...(status ? { status } : {}) } }),
   create: (repoSlug: string, data: { document_id: string; title: string; description?: string; proposed_content: string }) =>
     api.post(`/api/repos/${repoSlug}/durs`, data),
   get: (repoSlug: string, durId: string) =>
     api.get(`/api/repos/${repoSlug}/durs/${durId}`),
+  getDiff: (repoSlug: string, durId: string, params: { view?: 'unified' | 'split'; page?: number; page_size?: number; context?: number }) =>
+    api.get(`/api/repos/${repoSlug}/durs/${durId}/diff`, { params }),
   approve: (repoSlug: string, durId: string, data: { review_comment?: string }) =>
     api.post(`/api/repos/${repoSlug}/durs/${durId}/approve`, data),
   reject: (repoSlug: string, durId: string, data: { review_comment?: string }) =>
     api.post(`/api/repos/${repoSlug}/durs/${durId}/reject`, data),
   addComment: (repoSlug: string, durId: string, content: string) =>
     api.post(`/api/repos/${repoSlug}/durs/${durId}/comments`, { content }),
-  getComments: (repoSlug: string, durId: string) =>
-    api.get(`/api/repos/${repoSlug}/durs/${durId}/comments`),
+  getComments: (repoSlug: string, durId: string, params?: PageParams) =>
+    api.get(`/api/repos/${repoSlug}/durs/${durId}/comments`, { params }),
 }
 
+// Live events (Server-Sent Events); see hooks/useRepoEvents
+export const eventsUrl = (repoSlug: string) => `${BASE_URL}/api/repos/${repoSlug}/events`
+
 // Users
 export const userApi = {
-  list: () => api.get('/api/users'),
+  list: (params?: PageParams & { username?: string }) => api.get('/api/users', { params }),
   get: (id: string) => api.get(`/api/users/${id}`),
 }
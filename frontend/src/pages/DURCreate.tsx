@@ -106,6 +106,7 @@ export function DURCreate() {
                 </TabsContent>
                 <TabsContent value="edit">
                   <MarkdownEditor
+                    repoSlug={slug!}
                     value={proposedContent || doc.current_content}
                     onChange={setProposedContent}
                   />
@@ -1,8 +1,11 @@
 import { useState } from 'react'
 import { useParams, Link } from 'react-router-dom'
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query'
 import { durApi, docApi } from '../lib/api'
+import { usePaginated } from '../hooks/usePaginated'
+import { LoadMore } from '../components/LoadMore'
 import { useAuth } from '../hooks/useAuth'
+import { useRepoEvents } from '../hooks/useRepoEvents'
 import { Button } from '../components/ui/button'
 import { Badge } from '../components/ui/badge'
 import { Card, CardContent, CardHeader } from '../components/ui/card'
@@ -19,101 +22,126 @@ const STATUS_COLORS: Record<string, 'default' | 'secondary' | 'destructive' | 'o
   approved: 'secondary',
 }
 
-// Compute unified diff chunks from two texts
-function computeDiff(original: string, proposed: string) {
-  const originalLines = original.split('\n')
-  const proposedLines = proposed.split('\n')
-  const result: Array<{ type: 'same' | 'removed' | 'added'; content: string }> = []
+type DiffSegment = { type: 'equal' | 'insert' | 'delete'; text: string }
+type DiffLine = {
+  type: 'context' | 'add' | 'remove'
+  old_number: number | null
+  new_number: number | null
+  content: string
+  segments: DiffSegment[] | null
+}
+type DiffRow = { left: DiffLine | null; right: DiffLine | null }
+type DiffHunk = {
+  old_start: number
+  old_lines: number
+  new_start: number
+  new_lines: number
+  lines: DiffLine[] | null
+  rows: DiffRow[] | null
+}
 
-  let i = 0, j = 0
-  while (i < originalLines.length || j < proposedLines.length) {
-    if (i >= originalLines.length) {
-      result.push({ type: 'added', content: proposedLines[j++] })
-    } else if (j >= proposedLines.length) {
-      result.push({ type: 'removed', content: originalLines[i++] })
-    } else if (originalLines[i] === proposedLines[j]) {
-      result.push({ type: 'same', content: originalLines[i] })
-      i++; j++
-    } else {
-      result.push({ type: 'removed', content: originalLines[i++] })
-      result.push({ type: 'added', content: proposedLines[j++] })
-    }
-  }
-  return result
+const HUNKS_PER_PAGE = 50
+
+// Diff hunks are computed and cached server-side; fetch them a page at a time
+function useDurDiff(slug: string, durId: string, view: 'unified' | 'split') {
+  return useInfiniteQuery({
+    queryKey: ['dur-diff', slug, durId, view],
+    queryFn: ({ pageParam }) =>
+      durApi.getDiff(slug, durId, { view, page: pageParam, page_size: HUNKS_PER_PAGE }).then(r => r.data),
+    initialPageParam: 1,
+    getNextPageParam: (last: any) =>
+      last.page * last.page_size < last.total_hunks ? last.page + 1 : undefined,
+  })
 }
 
-// Unified diff (single column)
-function DiffView({ original, proposed }: { original: string; proposed: string }) {
-  const diffLines = computeDiff(original, proposed)
+// Line text with word-level changes highlighted
+function LineContent({ line }: { line: DiffLine }) {
+  if (!line.segments) return <>{line.content || ' '}</>
   return (
-    <div className="font-mono text-xs border rounded-md overflow-auto max-h-[500px]">
-      {diffLines.map((line, idx) => (
-        <div
+    <>
+      {line.segments.map((seg, idx) => (
+        <span
           key={idx}
-          className={`px-4 py-0.5 whitespace-pre-wrap ${
-            line.type === 'removed'
-              ? 'bg-red-50 text-red-800 border-l-4 border-red-400 dark:bg-red-950 dark:text-red-200'
-              : line.type === 'added'
-              ? 'bg-green-50 text-green-800 border-l-4 border-green-400 dark:bg-green-950 dark:text-green-200'
-              : 'bg-background text-foreground border-l-4 border-transparent'
-          }`}
+          className={
+            seg.type === 'delete'
+              ? 'bg-red-200 dark:bg-red-800'
+              : seg.type === 'insert'
+              ? 'bg-green-200 dark:bg-green-800'
+              : undefined
+          }
         >
-          <span className="mr-2 select-none opacity-50">
-            {line.type === 'removed' ? '-' : line.type === 'added' ? '+' : ' '}
-          </span>
-          {line.content || ' '}
-        </div>
+          {seg.text}
+        </span>
       ))}
+    </>
+  )
+}
+
+function HunkHeader({ hunk }: { hunk: DiffHunk }) {
+  return (
+    <div className="px-4 py-1 bg-muted/50 text-muted-foreground font-mono text-xs border-y">
+      @@ -{hunk.old_start},{hunk.old_lines} +{hunk.new_start},{hunk.new_lines} @@
     </div>
   )
 }
 
-// Side-by-side diff (two columns, paired)
-function SideBySideDiff({ original, proposed }: { original: string; proposed: string }) {
-  const chunks = computeDiff(original, proposed)
+function DiffFooter({ query, empty }: { query: ReturnType<typeof useDurDiff>; empty: boolean }) {
+  if (query.isLoading) return <div className="text-sm text-muted-foreground py-4 px-4">Computing diff...</div>
+  if (empty) return <div className="text-sm text-muted-foreground py-4 px-4">No changes.</div>
+  if (!query.hasNextPage) return null
+  return (
+    <div className="p-2 text-center">
+      <Button variant="outline" size="sm" onClick={() => query.fetchNextPage()} disabled={query.isFetchingNextPage}>
+        {query.isFetchingNextPage ? 'Loading...' : 'Load more changes'}
+      </Button>
+    </div>
+  )
+}
 
-  // Pair removed/added lines so they sit next to each other
-  type Row = { left: string | null; right: string | null; type: 'same' | 'changed' | 'removed' | 'added' }
-  const rows: Row[] = []
+// Unified diff (single column)
+function DiffView({ slug, durId }: { slug: string; durId: string }) {
+  const query = useDurDiff(slug, durId, 'unified')
+  const hunks: DiffHunk[] = query.data?.pages.flatMap((p: any) => p.hunks) ?? []
+  return (
+    <div className="font-mono text-xs border rounded-md overflow-auto max-h-[500px]">
+      {hunks.map((hunk, h) => (
+        <div key={h}>
+          <HunkHeader hunk={hunk} />
+          {hunk.lines?.map((line, idx) => (
+            <div
+              key={idx}
+              className={`px-4 py-0.5 whitespace-pre-wrap ${
+                line.type === 'remove'
+                  ? 'bg-red-50 text-red-800 border-l-4 border-red-400 dark:bg-red-950 dark:text-red-200'
+                  : line.type === 'add'
+                  ? 'bg-green-50 text-green-800 border-l-4 border-green-400 dark:bg-green-950 dark:text-green-200'
+                  : 'bg-background text-foreground border-l-4 border-transparent'
+              }`}
+            >
+              <span className="mr-2 select-none opacity-50">
+                {line.type === 'remove' ? '-' : line.type === 'add' ? '+' : ' '}
+              </span>
+              <LineContent line={line} />
+            </div>
+          ))}
+        </div>
+      ))}
+      <DiffFooter query={query} empty={!query.isLoading && hunks.length === 0} />
+    </div>
+  )
+}
 
-  let k = 0
-  while (k < chunks.length) {
-    const chunk = chunks[k]
-    if (chunk.type === 'same') {
-      rows.push({ left: chunk.content, right: chunk.content, type: 'same' })
-      k++
-    } else if (chunk.type === 'removed') {
-      // Peek ahead: pair with next 'added' if present
-      const next = chunks[k + 1]
-      if (next?.type === 'added') {
-        rows.push({ left: chunk.content, right: next.content, type: 'changed' })
-        k += 2
-      } else {
-        rows.push({ left: chunk.content, right: null, type: 'removed' })
-        k++
-      }
-    } else {
-      // standalone 'added'
-      rows.push({ left: null, right: chunk.content, type: 'added' })
-      k++
-    }
-  }
+// Side-by-side diff (two columns, paired)
+function SideBySideDiff({ slug, durId }: { slug: string; durId: string }) {
+  const query = useDurDiff(slug, durId, 'split')
+  const hunks: DiffHunk[] = query.data?.pages.flatMap((p: any) => p.hunks) ?? []
 
-  const cellClass = (side: 'left' | 'right', type: Row['type']) => {
+  const cellClass = (line: DiffLine | null) => {
     const base = 'px-3 py-0.5 whitespace-pre-wrap w-1/2 align-top font-mono text-xs'
-    if (type === 'same') return `${base} bg-background text-foreground`
-    if (type === 'changed') {
-      return side === 'left'
-        ? `${base} bg-red-50 text-red-800 dark:bg-red-950 dark:text-red-200`
-        : `${base} bg-green-50 text-green-800 dark:bg-green-950 dark:text-green-200`
-    }
-    if (type === 'removed') return side === 'left'
-      ? `${base} bg-red-50 text-red-800 dark:bg-red-950 dark:text-red-200`
-      : `${base} bg-muted/30`
-    if (type === 'added') return side === 'left'
-      ? `${base} bg-muted/30`
-      : `${base} bg-green-50 text-green-800 dark:bg-green-950 dark:text-green-200`
-    return base
+    if (!line) return `${base} bg-muted/30`
+    if (line.type === 'remove') return `${base} bg-red-50 text-red-800 dark:bg-red-950 dark:text-red-200`
+    if (line.type === 'add') return `${base} bg-green-50 text-green-800 dark:bg-green-950 dark:text-green-200`
+    return `${base} bg-background text-foreground`
   }
 
   return (
@@ -123,21 +151,26 @@ function SideBySideDiff({ original, proposed }: { original: string; proposed: st
         <div className="w-1/2 px-3 py-1.5 border-r">Current</div>
         <div className="w-1/2 px-3 py-1.5">Proposed</div>
       </div>
-      {/* Rows */}
-      <table className="w-full border-collapse">
-        <tbody>
-          {rows.map((row, idx) => (
-            <tr key={idx} className="border-b border-border/30 last:border-0">
-              <td className={cellClass('left', row.type)}>
-                {row.left ?? ''}
-              </td>
-              <td className={`${cellClass('right', row.type)} border-l border-border/30`}>
-                {row.right ?? ''}
-              </td>
-            </tr>
-          ))}
-        </tbody>
-      </table>
+      {hunks.map((hunk, h) => (
+        <div key={h}>
+          <HunkHeader hunk={hunk} />
+          <table className="w-full border-collapse">
+            <tbody>
+              {hunk.rows?.map((row, idx) => (
+                <tr key={idx} className="border-b border-border/30 last:border-0">
+                  <td className={cellClass(row.left)}>
+                    {row.left && <LineContent line={row.left} />}
+                  </td>
+                  <td className={`${cellClass(row.right)} border-l border-border/30`}>
+                    {row.right && <LineContent line={row.right} />}
+                  </td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        </div>
+      ))}
+      <DiffFooter query={query} empty={!query.isLoading && hunks.length === 0} />
     </div>
   )
 }
@@ -150,24 +183,31 @@ export function DURDetail() {
   const [comment, setComment] = useState('')
   const [reviewComment, setReviewComment] = useState('')
   const [showReviewInput, setShowReviewInput] = useState<'approve' | 'reject' | null>(null)
+  const [tab, setTab] = useState('split')
+  // While the stream is up, other people's comments and reviews arrive as events
+  const live = useRepoEvents(slug)
 
   const { data: dur, isLoading } = useQuery({
     queryKey: ['dur', slug, durId],
     queryFn: () => durApi.get(slug!, durId!).then(r => r.data),
     enabled: !!slug && !!durId,
+    refetchOnWindowFocus: !live,
   })
 
-  const { data: comments, refetch: refetchComments } = useQuery({
-    queryKey: ['dur-comments', slug, durId],
-    queryFn: () => durApi.getComments(slug!, durId!).then(r => r.data),
-    enabled: !!slug && !!durId,
-  })
+  const commentsQuery = usePaginated(
+    ['dur-comments', slug, durId],
+    cursor => durApi.getComments(slug!, durId!, { cursor }),
+    !!slug && !!durId,
+    !live,
+  )
+  const { items: comments, refetch: refetchComments } = commentsQuery
 
-  // Fetch the current document content using the slug from the DUR response
+  // The full current document is only needed when its tab is open; diffs come from the server
   const { data: doc } = useQuery({
     queryKey: ['doc', slug, dur?.document?.slug],
     queryFn: () => docApi.get(slug!, dur!.document.slug).then(r => r.data),
-    enabled: !!dur?.document?.slug,
+    enabled: tab === 'current' && !!dur?.document?.slug,
+    refetchOnWindowFocus: !live,
   })
 
   const approveMutation = useMutation({
@@ -176,6 +216,7 @@ export function DURDetail() {
       queryClient.invalidateQueries({ queryKey: ['dur', slug, durId] })
       queryClient.invalidateQueries({ queryKey: ['repo-durs', slug] })
       queryClient.invalidateQueries({ queryKey: ['doc', slug, dur?.document?.slug] })
+      queryClient.invalidateQueries({ queryKey: ['dur-diff', slug, durId] })
       setShowReviewInput(null)
     },
   })
@@ -193,7 +234,8 @@ export function DURDetail() {
     mutationFn: () => durApi.addComment(slug!, durId!, comment),
     onSuccess: () => {
       setComment('')
-      refetchComments()
+      // Our own comment comes back as an event too
+      if (!live) refetchComments()
     },
   })
 
@@ -246,7 +288,7 @@ export function DURDetail() {
 
       {/* Diff tabs — single Tabs context wrapping both list and content */}
       <Card className="mb-6">
-        <Tabs defaultValue="split">
+        <Tabs value={tab} onValueChange={setTab}>
           <CardHeader className="pb-0">
             <TabsList>
               <TabsTrigger value="split">Split</TabsTrigger>
@@ -257,16 +299,10 @@ export function DURDetail() {
           </CardHeader>
           <CardContent className="pt-4">
             <TabsContent value="split" className="mt-0">
-              {doc
-                ? <SideBySideDiff original={doc.current_content} proposed={dur.proposed_content} />
-                : <div className="text-sm text-muted-foreground py-4">Loading current document...</div>
-              }
+              <SideBySideDiff slug={slug!} durId={durId!} />
             </TabsContent>
             <TabsContent value="diff" className="mt-0">
-              {doc
-                ? <DiffView original={doc.current_content} proposed={dur.proposed_content} />
-                : <div className="text-sm text-muted-foreground py-4">Loading current document...</div>
-              }
+              <DiffView slug={slug!} durId={durId!} />
             </TabsContent>
             <TabsContent value="proposed" className="mt-0">
               <pre className="text-xs font-mono whitespace-pre-wrap border rounded-md p-4 bg-muted/30 max-h-[500px] overflow-auto">
@@ -366,7 +402,7 @@ export function DURDetail() {
       <div>
         <h2 className="text-lg font-semibold mb-4 flex items-center gap-2">
           <MessageSquare className="w-5 h-5" />
-          Comments ({comments?.length ?? 0})
+          Comments ({comments.length}{commentsQuery.hasNextPage ? '+' : ''})
         </h2>
 
         <div className="space-y-4 mb-6">
@@ -388,7 +424,8 @@ export function DURDetail() {
               </div>
             </div>
           ))}
-          {(!comments || comments.length === 0) && (
+          <LoadMore {...commentsQuery} />
+          {comments.length === 0 && (
             <p className="text-sm text-muted-foreground">No comments yet.</p>
           )}
         </div>
@@ -1,7 +1,9 @@
 import { useState } from 'react'
 import { Link, useNavigate } from 'react-router-dom'
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
+import { useMutation, useQueryClient } from '@tanstack/react-query'
 import { repoApi } from '../lib/api'
+import { usePaginated } from '../hooks/usePaginated'
+import { LoadMore } from '../components/LoadMore'
 import { useAuth } from '../hooks/useAuth'
 import { Button } from '../components/ui/button'
 import { Input } from '../components/ui/input'
@@ -21,10 +23,8 @@ export function Dashboard() {
   const [form, setForm] = useState({ name: '', slug: '', description: '', is_public: true })
   const [error, setError] = useState('')
 
-  const { data: repos = [], isLoading } = useQuery({
-    queryKey: ['repos'],
-    queryFn: () => repoApi.list().then(r => r.data),
-  })
+  const reposQuery = usePaginated(['repos'], cursor => repoApi.list({ cursor }))
+  const { items: repos, isLoading } = reposQuery
 
   const createMutation = useMutation({
     mutationFn: (data: typeof form) => repoApi.create(data),
@@ -98,6 +98,7 @@ export function Dashboard() {
               </Button>
             </div>
           )}
+          <LoadMore {...reposQuery} />
         </>
       )}
 
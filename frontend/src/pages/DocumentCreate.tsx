@@ -82,7 +82,7 @@ export function DocumentCreate() {
 
             <div className="space-y-2">
               <Label>Content * (Markdown)</Label>
-              <MarkdownEditor value={content} onChange={setContent} />
+              <MarkdownEditor repoSlug={slug!} value={content} onChange={setContent} />
             </div>
 
             {error && <p className="text-sm text-destructive">{error}</p>}
@@ -1,48 +1,53 @@
 import { useState } from 'react'
 import { useParams, useNavigate, Link } from 'react-router-dom'
 import { useQuery } from '@tanstack/react-query'
-import { docApi } from '../lib/api'
+import { docApi, TocEntry } from '../lib/api'
+import { usePaginated } from '../hooks/usePaginated'
+import { LoadMore } from '../components/LoadMore'
 import { useAuth } from '../hooks/useAuth'
+import { useRepoEvents } from '../hooks/useRepoEvents'
 import { Button } from '../components/ui/button'
 import { Badge } from '../components/ui/badge'
 import { Card, CardContent, CardHeader, CardTitle } from '../components/ui/card'
 import { ScrollArea } from '../components/ui/scroll-area'
 import { Separator } from '../components/ui/separator'
-import { ArrowLeft, Clock, GitPullRequest, History } from 'lucide-react'
-import { marked } from 'marked'
+import { ArrowLeft, Clock, GitPullRequest, History, ListTree } from 'lucide-react'
 
 export function DocumentView() {
   const { slug, docSlug } = useParams<{ slug: string; docSlug: string }>()
   const navigate = useNavigate()
   const { user } = useAuth()
   const [selectedVersion, setSelectedVersion] = useState<number | null>(null)
+  const live = useRepoEvents(slug)
 
   const { data: doc, isLoading } = useQuery({
-    queryKey: ['doc', slug, docSlug],
-    queryFn: () => docApi.get(slug!, docSlug!).then(r => r.data),
+    queryKey: ['doc', slug, docSlug, 'html'],
+    queryFn: () => docApi.get(slug!, docSlug!, { format: 'html' }).then(r => r.data),
     enabled: !!slug && !!docSlug,
+    refetchOnWindowFocus: !live,
   })
 
-  const { data: versions } = useQuery({
-    queryKey: ['doc-versions', slug, docSlug],
-    queryFn: () => docApi.getVersions(slug!, docSlug!).then(r => r.data),
-    enabled: !!slug && !!docSlug,
-  })
+  const versionsQuery = usePaginated(
+    ['doc-versions', slug, docSlug],
+    cursor => docApi.getVersions(slug!, docSlug!, { cursor }),
+    !!slug && !!docSlug,
+    !live,
+  )
+  const versions = versionsQuery.items
 
   const { data: versionContent } = useQuery({
-    queryKey: ['doc-version', slug, docSlug, selectedVersion],
-    queryFn: () => docApi.getVersion(slug!, docSlug!, selectedVersion!).then(r => r.data),
+    queryKey: ['doc-version', slug, docSlug, selectedVersion, 'html'],
+    queryFn: () => docApi.getVersion(slug!, docSlug!, selectedVersion!, { format: 'html' }).then(r => r.data),
     enabled: selectedVersion !== null,
   })
 
   if (isLoading) return <div className="flex items-center justify-center h-64">Loading...</div>
   if (!doc) return <div className="p-8 text-center text-muted-foreground">Document not found.</div>
 
-  const displayContent = selectedVersion !== null && versionContent
-    ? versionContent.content
-    : doc.current_content
-
-  const renderedHtml = marked(displayContent || '') as string
+  // Rendered and sanitized by the server, once per distinct text.
+  const displayed = selectedVersion !== null && versionContent ? versionContent : doc
+  const renderedHtml: string = displayed.html ?? ''
+  const toc: TocEntry[] = displayed.toc ?? []
 
   return (
     <div className="max-w-6xl mx-auto px-4 py-8">
@@ -94,8 +99,33 @@ export function DocumentView() {
           </Card>
         </div>
 
-        {/* Version history sidebar */}
-        <div className="w-64 shrink-0">
+        {/* Sidebar: contents and version history */}
+        <div className="w-64 shrink-0 space-y-4">
+          {toc.length > 0 && (
+            <Card>
+              <CardHeader className="pb-2">
+                <CardTitle className="text-sm flex items-center gap-2">
+                  <ListTree className="w-4 h-4" />
+                  Contents
+                </CardTitle>
+              </CardHeader>
+              <CardContent className="pb-4">
+                <nav className="space-y-1 text-sm">
+                  {toc.map(entry => (
+                    <a
+                      key={entry.id}
+                      href={`#${entry.id}`}
+                      className="block truncate text-muted-foreground hover:text-foreground"
+                      style={{ paddingLeft: `${(entry.level - 1) * 0.75}rem` }}
+                    >
+                      {entry.text}
+                    </a>
+                  ))}
+                </nav>
+              </CardContent>
+            </Card>
+          )}
+
           <Card>
             <CardHeader className="pb-2">
               <CardTitle className="text-sm flex items-center gap-2">
@@ -141,6 +171,8 @@ export function DocumentView() {
                   </button>
                 ))}
 
+                <LoadMore {...versionsQuery} />
+
                 {(!versions || versions.length === 0) && (
                   <div className="px-4 py-3 text-xs text-muted-foreground">No versions yet</div>
                 )}
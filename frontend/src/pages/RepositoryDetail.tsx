@@ -2,6 +2,8 @@ import { useState } from 'react'
 import { Link, useParams, useNavigate } from 'react-router-dom'
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
 import { repoApi, docApi, durApi, userApi } from '../lib/api'
+import { usePaginated } from '../hooks/usePaginated'
+import { LoadMore } from '../components/LoadMore'
 import { useAuth } from '../hooks/useAuth'
 import { Button } from '../components/ui/button'
 import { Input } from '../components/ui/input'
@@ -41,29 +43,25 @@ export function RepositoryDetail() {
     queryFn: () => repoApi.get(slug!).then(r => r.data),
   })
 
-  const { data: docs = [] } = useQuery({
-    queryKey: ['docs', slug],
-    queryFn: () => docApi.list(slug!).then(r => r.data),
-    enabled: !!repo,
-  })
+  const docsQuery = usePaginated(['docs', slug], cursor => docApi.list(slug!, { cursor }), !!repo)
+  const docs = docsQuery.items
 
-  const { data: durs = [] } = useQuery({
-    queryKey: ['durs', slug],
-    queryFn: () => durApi.list(slug!).then(r => r.data),
-    enabled: !!repo,
-  })
+  // Status filtering happens server-side so pages stay full
+  const dursQuery = usePaginated(
+    ['durs', slug, statusFilter],
+    cursor => durApi.list(slug!, statusFilter === 'all' ? undefined : statusFilter, { cursor }),
+    !!repo,
+  )
+  const filteredDurs = dursQuery.items
 
-  const { data: members = [] } = useQuery({
-    queryKey: ['members', slug],
-    queryFn: () => repoApi.getMembers(slug!).then(r => r.data),
-    enabled: !!repo && !!user,
-  })
+  const membersQuery = usePaginated(['members', slug], cursor => repoApi.getMembers(slug!, { cursor }), !!repo && !!user)
+  const members = membersQuery.items
 
   const addMemberMutation = useMutation({
     mutationFn: async () => {
       // Look up user by username
-      const allUsers = await userApi.list().then(r => r.data)
-      const target = allUsers.find((u: any) => u.username === memberUsername)
+      const matches = await userApi.list({ username: memberUsername, limit: 1 }).then(r => r.data.items)
+      const target = matches[0]
       if (!target) throw new Error('User not found')
       return repoApi.addMember(slug!, { user_id: target.id, role: memberRole })
     },
@@ -97,8 +95,6 @@ export function RepositoryDetail() {
   const userMember = user && members.find((m: any) => m.user_id === user.id)
   const canEdit = isAdmin || (userMember && ['admin', 'editor'].includes(userMember.role))
 
-  const filteredDurs = statusFilter === 'all' ? durs : durs.filter((d: any) => d.status === statusFilter)
-
   return (
     <div>
       {/* Repo header */}
@@ -133,11 +129,11 @@ export function RepositoryDetail() {
         <TabsList className="mb-4">
           <TabsTrigger value="docs">
             <FileText className="h-4 w-4 mr-1" />
-            Documents ({docs.length})
+            Documents
           </TabsTrigger>
           <TabsTrigger value="durs">
             <GitPullRequest className="h-4 w-4 mr-1" />
-            DURs ({durs.length})
+            DURs
           </TabsTrigger>
           {user && (
             <TabsTrigger value="members">
@@ -195,6 +191,7 @@ export function RepositoryDetail() {
               </TableBody>
             </Table>
           )}
+          <LoadMore {...docsQuery} />
         </TabsContent>
 
         {/* DURs Tab */}
@@ -241,6 +238,7 @@ export function RepositoryDetail() {
               ))}
             </div>
           )}
+          <LoadMore {...dursQuery} />
         </TabsContent>
 
         {/* Members Tab */}
@@ -297,6 +295,7 @@ export function RepositoryDetail() {
                 </div>
               </div>
             ))}
+            <LoadMore {...membersQuery} />
           </TabsContent>
         )}
       </Tabs>
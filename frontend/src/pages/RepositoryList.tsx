@@ -1,7 +1,8 @@
 import { useState } from 'react'
 import { Link } from 'react-router-dom'
-import { useQuery } from '@tanstack/react-query'
 import { repoApi } from '../lib/api'
+import { usePaginated } from '../hooks/usePaginated'
+import { LoadMore } from '../components/LoadMore'
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from '../components/ui/card'
 import { Input } from '../components/ui/input'
 import { Badge } from '../components/ui/badge'
@@ -11,10 +12,8 @@ import { formatDate } from '../lib/utils'
 export function RepositoryList() {
   const [search, setSearch] = useState('')
 
-  const { data: repos = [], isLoading } = useQuery({
-    queryKey: ['repos'],
-    queryFn: () => repoApi.list().then(r => r.data),
-  })
+  const reposQuery = usePaginated(['repos'], cursor => repoApi.list({ cursor }))
+  const { items: repos, isLoading } = reposQuery
 
   const filtered = repos.filter((r: any) =>
     r.name.toLowerCase().includes(search.toLowerCase()) ||
@@ -86,6 +85,7 @@ export function RepositoryList() {
           ))}
         </div>
       )}
+      <LoadMore {...reposQuery} />
     </div>
   )
 }